@@ -0,0 +1,217 @@
+"""
+Benchmarks of the build steps with a synthetic course (see course_generator).
+
+Course is generated to a temporary directory and each step is run --repeat times. Best time of each step is
+reported:
+
+    create_paths            reading the index.rst files (course files from a FileSnapshot)
+    create_img_path_list    walking the course directory for images
+    write_rst               extracting the point-of-interests and writing presentation.rst, without the slide cache
+    write_rst_cached        same with the slide cache filled by the previous run
+    convert_rst2pdf         convert_rst_to_rst2pdf_compatible for presentation.rst
+    columns                 docutils column transforms of presentation.rst (create_columns)
+    post_process            html transforms of index.html created by hovercraft (hover.post_process)
+    stream_html             same with the streaming rewriter (stream_html.rewrite)
+    api_build_outside       whole html build with api.build into a directory outside of the course. Fails if an
+                            image of index.html is not found from the presentation folder.
+
+Results can be saved as a baseline and later runs compared to it. A step is a regression if it is more than
+--tolerance slower than in the baseline. Times depend on the machine, so baseline should be saved on the same
+machine (e.g. the build runner) as the runs compared to it.
+
+python3 -m benchmarks.bench_build [-n 5 -m 8 -k 6 --images 50] [--repeat 3]
+python3 -m benchmarks.bench_build --save-baseline benchmarks/baseline.json
+python3 -m benchmarks.bench_build --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from docutils.parsers.rst import directives
+
+from benchmarks import course_generator
+from benchmarks.bench_columns import parse
+from presentation_maker import api
+from presentation_maker import create_columns
+from presentation_maker import create_pdf
+from presentation_maker import hover
+from presentation_maker import pathfinder
+from presentation_maker import presentation_maker as pm
+from presentation_maker import settings
+from presentation_maker import stream_html
+from presentation_maker.build_context import BuildContext
+from presentation_maker.file_snapshot import FileSnapshot
+
+default_baseline = Path(__file__).parent / "baseline.json"
+
+
+def best_time(function, repeat, setup=None):
+    """
+    :param setup: function called before each run, not timed
+    :return: best time of running function in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def read_config(course_dir, context):
+    """
+    :return: arguments of write_rst from the default presentation_config.yaml
+    """
+    params, raw_dict, _, _, ending, last_slide_content, transition, other_transitions = \
+        pm.parse_config_file(settings.code_dir / settings.config_name, context)
+    raw_dict[settings.files][settings.course_path] = str(course_dir)
+    return params, raw_dict, ending, last_slide_content, transition, other_transitions
+
+
+def run_benchmarks(course_dir, repeat):
+    """
+    Runs the benchmarks in the generated course.
+
+    :return: {benchmark: best time in seconds}
+    """
+    results = OrderedDict()
+    context = BuildContext(course_dir)
+    build_dir = context.build_dir
+    params, raw_dict, ending, last_slide_content, transition, other_transitions = read_config(course_dir, context)
+    rst_file = str(build_dir / "presentation.rst")
+    poi_cache_dir = context.cache_path(settings.poi_cache_dir)
+
+    snapshot = FileSnapshot(course_dir)
+    results["create_paths"] = best_time(lambda: pathfinder.create_paths([-1], course_dir, "en", snapshot), repeat)
+    paths = pathfinder.create_paths([-1], course_dir, "en", snapshot)
+    results["create_img_path_list"] = best_time(lambda: pm.create_img_path_list(course_dir), repeat)
+
+    def write_rst():
+        return pm.write_rst(raw_dict, params, rst_file, paths, ending, last_slide_content, transition,
+                            other_transitions, course_dir, 0, context, snapshot)
+    results["write_rst"] = best_time(write_rst, repeat, lambda: shutil.rmtree(str(poi_cache_dir), True))
+    results["write_rst_cached"] = best_time(write_rst, repeat)
+
+    results["convert_rst2pdf"] = best_time(lambda: create_pdf.convert_rst_to_rst2pdf_compatible(build_dir, rst_file),
+                                           repeat)
+
+    with open(rst_file) as reader:
+        rst = reader.read()
+    hover.register_directives()
+    documents = []
+    results["columns"] = best_time(lambda: documents.pop().transformer.apply_transforms(), repeat,
+                                   lambda: documents.append(parse(rst)))
+
+    presentation_dir = build_dir / "presentation"
+    html_file = hover.run_hovercraft(rst_file, str(presentation_dir))
+    created_html = build_dir / "hovercraft.html"
+    shutil.copyfile(str(html_file), str(created_html))
+
+    def restore_html():
+        shutil.copyfile(str(created_html), str(html_file))
+    results["post_process"] = best_time(lambda: hover.post_process(html_file, context), repeat, restore_html)
+    results["stream_html"] = best_time(lambda: stream_html.rewrite(html_file, context), repeat, restore_html)
+
+    # image paths are relative to the presentation RST, so they work outside of the course too
+    output_dir = Path(course_dir).parent / "output"
+    results["api_build_outside"] = best_time(lambda: check_images(api.build(None, course_dir, output_dir,
+                                                                            force=True)), repeat)
+    return results
+
+
+def check_images(result):
+    """
+    Stops the benchmarks if an image or background image of the built presentation does not exist.
+    """
+    with open(str(result.html_file)) as reader:
+        text = reader.read()
+    images = re.findall(r'<img[^>]* src="([^"]+)"', text) + re.findall(r"url\(([^)]+)\)", text)
+    missing = sorted({image for image in images if not (result.presentation_dir / image).exists()})
+    if not images or missing:
+        sys.exit("Images of {} were not found: {}".format(result.html_file, ", ".join(missing)))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the results next to the baseline.
+
+    :return: list of the benchmarks which are more than tolerance slower than in the baseline
+    """
+    regressions = []
+    print("{:<22} {:>10} {:>13} {:>8}".format("benchmark", "time (ms)", "baseline (ms)", "change"))
+    for name, seconds in results.items():
+        base = baseline.get(name) if baseline else None
+        if base:
+            change = seconds / base - 1
+            mark = ""
+            if change > tolerance:
+                regressions.append(name)
+                mark = "  slower"
+            print("{:<22} {:>10.1f} {:>13.1f} {:>+7.0%}{}".format(name, seconds * 1000, base * 1000, change, mark))
+        else:
+            print("{:<22} {:>10.1f} {:>13} {:>8}".format(name, seconds * 1000, "-", "-"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the build steps with a synthetic course.")
+    parser.add_argument("-n", "--modules", type=int, default=5, help="number of modules")
+    parser.add_argument("-m", "--chapters", type=int, default=8, help="number of chapters in each module")
+    parser.add_argument("-k", "--pois", type=int, default=6, help="number of point-of-interests in each chapter")
+    parser.add_argument("--images", type=int, default=50, help="number of images in the course")
+    parser.add_argument("--image-size", type=int, default=20 * 1024, help="size of each image in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times each step is measured")
+    parser.add_argument("--baseline", nargs="?", const=str(default_baseline), metavar="FILE",
+                        help="compare to the baseline, {} by default".format(default_baseline.name))
+    parser.add_argument("--save-baseline", nargs="?", const=str(default_baseline), metavar="FILE",
+                        help="save the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="how much slower than the baseline is a regression, 0.25 = 25 %%")
+    arguments = parser.parse_args()
+    settings.logger.setLevel(logging.ERROR)
+    directives.register_directive(settings.newcol_directive, create_columns.NewColumn)
+
+    course = OrderedDict([("modules", arguments.modules), ("chapters", arguments.chapters),
+                          ("pois", arguments.pois), ("images", arguments.images),
+                          ("image_size", arguments.image_size)])
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline) as reader:
+            saved = json.load(reader)
+        if saved["course"] != course:
+            sys.exit("Baseline was measured with another course: {}".format(saved["course"]))
+        baseline = saved["results"]
+
+    with tempfile.TemporaryDirectory(prefix="presentation_maker_bench_") as directory:
+        course_dir = Path(directory) / "course"
+        course_generator.generate(course_dir, **course)
+        print("Course: {} modules, {} chapters, {} point-of-interests, {} images".format(
+            arguments.modules, arguments.modules * arguments.chapters,
+            arguments.modules * arguments.chapters * arguments.pois, arguments.images))
+        results = run_benchmarks(course_dir, arguments.repeat)
+
+    regressions = compare(results, baseline, arguments.tolerance)
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, "w") as writer:
+            saved = OrderedDict((name, round(seconds, 6)) for name, seconds in results.items())
+            json.dump(OrderedDict([("course", course), ("results", saved)]), writer, indent=2)
+            writer.write("\n")
+        print("Baseline saved to {}".format(arguments.save_baseline))
+    if regressions:
+        sys.exit("Slower than the baseline: {}".format(", ".join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark for create_columns.
+
+Creates hovercraft RST decks with thousands of multi-column slides. Each deck is parsed with docutils once and
+the time of running the column transforms is measured. Time per slide should stay about the same when the number
+of slides grows.
+
+python3 -m benchmarks.bench_columns [-n 500 1000 2000 4000] [--repeat 3]
+"""
+
+import argparse
+import gc
+import logging
+import time
+
+from docutils import nodes
+from docutils.frontend import OptionParser
+from docutils.parsers.rst import Parser, directives
+from docutils.utils import new_document
+
+from presentation_maker import create_columns
+from presentation_maker import presentation_maker as pm
+from presentation_maker import settings
+
+slide_rst = "----\n\n:data-x: r1600\n\nSlide {index}\n{underline}\n\n{columns}\n"
+column_rst = "  Column {} text\n\n  * first\n  * second\n\n  ::\n\n    code = {}\n"
+
+
+def create_deck(slides, columns=3):
+    """
+    Creates hovercraft RST of a presentation where every slide has columns.
+
+    :param slides: number of slides
+    :param columns: number of columns in each slide
+    :return: RST as a string
+    """
+    ratio = " ".join(str(c + 1) for c in range(columns))
+    separator = pm.newcol_directive(ratio) + "\n"
+    parts = []
+    for index in range(slides):
+        title = "Slide {}".format(index)
+        contents = separator.join(column_rst.format(c, index) for c in range(columns))
+        parts.append(slide_rst.format(index=index, underline="-" * len(title), columns=contents))
+    return "Benchmark\n=========\n\n" + "".join(parts)
+
+
+def parse(rst):
+    """
+    Parses RST without applying the transforms.
+
+    :return: docutils document which has the column transforms pending
+    """
+    parser = Parser()
+    document_settings = OptionParser(components=(Parser,)).get_default_values()
+    document_settings.report_level = 4
+    document = new_document("<benchmark>", document_settings)
+    parser.parse(rst, document)
+    return document
+
+
+def measure(slides, repeat):
+    """
+    :return: best time (seconds) of creating columns in a deck with given number of slides
+    """
+    rst = create_deck(slides)
+    times = []
+    for _ in range(repeat):
+        document = parse(rst)
+        # collections of the large document would add time which does not depend on create_columns
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        document.transformer.apply_transforms()
+        times.append(time.perf_counter() - start)
+        gc.enable()
+        rows = sum(1 for node in document.traverse(nodes.container) if 'row' in node['classes'])
+        assert rows == slides
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure column creation with decks of different sizes.")
+    parser.add_argument("-n", "--slides", type=int, nargs="+", default=[500, 1000, 2000, 4000],
+                        help="numbers of slides in the decks")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times each deck is measured")
+    arguments = parser.parse_args()
+    settings.logger.setLevel(logging.WARNING)
+    directives.register_directive(settings.newcol_directive, create_columns.NewColumn)
+
+    print("{:>8} {:>10} {:>14}".format("slides", "time (ms)", "per slide (us)"))
+    for slides in arguments.slides:
+        best = measure(slides, arguments.repeat)
+        print("{:>8} {:>10.1f} {:>14.1f}".format(slides, best * 1000, best / slides * 10 ** 6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark of the command line start: import time and time to fail with a bad configuration.
+
+Heavy modules (docutils, hovercraft, bs4, rst2pdf, multiprocessing) are imported only by the build stages which use
+them, so --help and errors in the configuration are fast. This runs the command line in new processes:
+
+    import      python -X importtime report of importing the command line, slowest modules first
+    help        presentation_maker --help
+    bad config  presentation_maker -y <missing file>, exits with status 2
+
+Exits with non-zero status if a heavy module is imported when the command line starts or, with --limit, if failing
+with a bad configuration takes longer than the limit. Times depend on the machine, e.g. in CI:
+
+python3 -m benchmarks.bench_import --limit 0.1
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# modules which the command line must not import before the build needs them
+heavy_modules = ("docutils", "hovercraft", "bs4", "lxml", "rst2pdf", "reportlab", "multiprocessing",
+                 "pkg_resources")
+cli_import = "from presentation_maker.presentation_maker import main"
+cli_run = cli_import + "; main()"
+repo_dir = Path(__file__).resolve().parent.parent
+
+
+def run_python(arguments, cwd=None):
+    """
+    Runs python with the repository in the module search path.
+
+    :return: tuple (seconds, completed process)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(repo_dir), os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable] + arguments, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, process
+
+
+def best_run(arguments, repeat, cwd=None):
+    """
+    :return: tuple (best time in seconds, exit status of the last run)
+    """
+    times = []
+    for _ in range(repeat):
+        seconds, process = run_python(arguments, cwd)
+        times.append(seconds)
+    return min(times), process.returncode
+
+
+def import_times():
+    """
+    :return: list of (module, self microseconds, cumulative microseconds) from python -X importtime
+    """
+    _, process = run_python(["-X", "importtime", "-c", cli_import])
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the start of the command line.")
+    parser.add_argument("--repeat", type=int, default=5, help="how many times each command is run")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports listed")
+    parser.add_argument("--limit", type=float, metavar="SECONDS",
+                        help="fail if failing with a bad configuration takes longer than this")
+    arguments = parser.parse_args()
+
+    modules = import_times()
+    total = max((cumulative for _, _, cumulative in modules), default=0)
+    print("Importing the command line: {:.1f} ms, {} modules".format(total / 1000, len(modules)))
+    print("{:<45} {:>10} {:>15}".format("module", "self (ms)", "cumulative (ms)"))
+    for name, own, cumulative in sorted(modules, key=lambda module: module[1], reverse=True)[:arguments.top]:
+        print("{:<45} {:>10.1f} {:>15.1f}".format(name, own / 1000, cumulative / 1000))
+    imported = sorted({name for name, _, _ in modules if name.split(".")[0] in heavy_modules})
+    print()
+
+    startup, _ = best_run(["-c", "pass"], arguments.repeat)
+    help_time, _ = best_run(["-c", cli_run, "--help"], arguments.repeat)
+    with tempfile.TemporaryDirectory(prefix="presentation_maker_bench_") as directory:
+        bad_config, status = best_run(["-c", cli_run, "-y", "missing.yaml"], arguments.repeat, directory)
+    print("{:<45} {:>10.1f} ms".format("python startup", startup * 1000))
+    print("{:<45} {:>10.1f} ms".format("--help", help_time * 1000))
+    print("{:<45} {:>10.1f} ms (exit status {})".format("bad config", bad_config * 1000, status))
+
+    errors = []
+    if imported:
+        errors.append("heavy modules imported when the command line starts: {}".format(", ".join(imported)))
+    if status != 2:
+        errors.append("bad config exited with status {}, expected 2".format(status))
+    if arguments.limit is not None and bad_config > arguments.limit:
+        errors.append("bad config took {:.1f} ms, limit is {:.1f} ms".format(bad_config * 1000,
+                                                                             arguments.limit * 1000))
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
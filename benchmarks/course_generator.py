@@ -0,0 +1,174 @@
+"""
+Generator of synthetic A+ courses for the benchmarks.
+
+Course has modules m01, m02, ... with an index.rst each, and the chapters of a module are listed in the toctree of
+the module index. Main index.rst lists the module indexes like A+ courses do:
+
+    index.rst               toctree: m01/index, m02/index, ...
+    m01/index.rst           toctree: 01_chapter, 02_chapter, ...
+    m01/01_chapter.rst      point-of-interests
+    images/image_001.png    image corpus shared by the chapters
+
+Point-of-interests use both title styles (title as the directive argument or :title: option), columns, background
+images, code blocks and images. Some text is written between the point-of-interests, like in real chapters.
+
+python3 -m benchmarks.course_generator <directory> [-n 5] [-m 8] [-k 6] [--images 50]
+"""
+
+import argparse
+import struct
+import zlib
+from pathlib import Path
+
+poi_new_title = """.. point-of-interest:: {title}
+  :id: {id}
+{options}
+  Slide {index} of chapter {chapter} in module {module}. Some **bold** text and a
+  `link <https://plus.cs.aalto.fi/>`_.
+
+  * first item
+  * second item with ``code``
+
+"""
+poi_old_title = """.. point-of-interest:: {index}
+  :title: {title}
+  :id: {id}
+{options}
+  Slide with the title in the options. Text of slide {index}.
+
+"""
+code_block = """  .. code-block:: python
+
+    def slide_{index}(x):
+        return x * {index}
+
+"""
+image_block = "  .. image:: ../images/{image}\n\n"
+columns_block = """  Left column of slide {index}.
+
+  ::newcol
+
+  Middle column.
+
+  ::newcol
+
+  Right column with an image.
+
+  .. image:: ../images/{image}
+
+"""
+chapter_text = "Text between the point-of-interests. It is not included in the slides.\n\n"
+
+
+def png_bytes(size):
+    """
+    :return: valid 1x1 png image padded to at least size bytes. Padding is after the end of the image.
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    image = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(b"\x00\xff\xff\xff")) + chunk(b"IEND", b"")
+    return image + b"\x00" * max(0, size - len(image))
+
+
+def image_name(index):
+    return "image_{:03d}.png".format(index)
+
+
+def write_index(path, title, entries):
+    with open(str(path), "w") as writer:
+        writer.write("{}\n{}\n\n.. toctree::\n  :maxdepth: 1\n\n".format(title, "=" * len(title)))
+        for entry in entries:
+            writer.write("  {}\n".format(entry))
+
+
+def create_poi(module, chapter, index, images):
+    """
+    :return: rst of the index'th point-of-interest of the chapter. Kind of the slide changes with the index.
+    """
+    title = "Slide {}.{}.{}".format(module, chapter, index)
+    poi_id = "m{}c{}p{}".format(module, chapter, index)
+    image = image_name((module * 31 + chapter * 7 + index) % images + 1) if images else None
+    options = ""
+    body = ""
+    kind = index % 4
+    if kind == 1:
+        options += "  :bgimg: images/{}\n".format(image_name(1)) if images else ""
+        body = code_block.format(index=index)
+    elif kind == 2 and image:
+        options += "  :columns: 1 2 1\n"
+        body = columns_block.format(index=index, image=image)
+    elif kind == 3 and image:
+        body = image_block.format(image=image)
+    # every other chapter uses the old title style, styles are not mixed in a file
+    template = poi_old_title if chapter % 2 == 0 else poi_new_title
+    return template.format(title=title, id=poi_id, options=options, index=index, chapter=chapter,
+                           module=module) + body
+
+
+def create_chapter(module, chapter, pois, images):
+    """
+    :return: rst of a chapter with pois point-of-interests
+    """
+    title = "Chapter {}.{}".format(module, chapter)
+    parts = ["{}\n{}\n\n".format(title, "=" * len(title)), chapter_text]
+    for index in range(pois):
+        parts.append(create_poi(module, chapter, index, images))
+        if index % 3 == 2:
+            parts.append(chapter_text)
+    return "".join(parts)
+
+
+def generate(root, modules=5, chapters=8, pois=6, images=50, image_size=20 * 1024):
+    """
+    Writes a synthetic course to root.
+
+    :param modules: number of modules
+    :param chapters: number of chapters in each module
+    :param pois: number of point-of-interests in each chapter
+    :param images: number of images in the image corpus (root/images)
+    :param image_size: size of each image in bytes
+    :return: list of paths of the chapter files in the course order
+    """
+    root = Path(root)
+    image_dir = root / "images"
+    image_dir.mkdir(parents=True, exist_ok=True)
+    data = png_bytes(image_size)
+    for index in range(1, images + 1):
+        with open(str(image_dir / image_name(index)), "wb") as writer:
+            writer.write(data)
+
+    module_names = ["m{:02d}".format(module) for module in range(1, modules + 1)]
+    write_index(root / "index.rst", "Synthetic course", ["{}/index".format(name) for name in module_names])
+    chapter_files = []
+    for module, module_name in enumerate(module_names, 1):
+        module_dir = root / module_name
+        module_dir.mkdir(exist_ok=True)
+        chapter_names = ["{:02d}_chapter".format(chapter) for chapter in range(1, chapters + 1)]
+        write_index(module_dir / "index.rst", "Module {}".format(module), chapter_names)
+        for chapter, chapter_name in enumerate(chapter_names, 1):
+            chapter_file = module_dir / (chapter_name + ".rst")
+            with open(str(chapter_file), "w") as writer:
+                writer.write(create_chapter(module, chapter, pois, images))
+            chapter_files.append(chapter_file)
+    return chapter_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a synthetic A+ course.")
+    parser.add_argument("directory", help="directory of the course")
+    parser.add_argument("-n", "--modules", type=int, default=5, help="number of modules")
+    parser.add_argument("-m", "--chapters", type=int, default=8, help="number of chapters in each module")
+    parser.add_argument("-k", "--pois", type=int, default=6, help="number of point-of-interests in each chapter")
+    parser.add_argument("--images", type=int, default=50, help="number of images")
+    parser.add_argument("--image-size", type=int, default=20 * 1024, help="size of each image in bytes")
+    arguments = parser.parse_args()
+    files = generate(arguments.directory, arguments.modules, arguments.chapters, arguments.pois, arguments.images,
+                     arguments.image_size)
+    print("{} chapters, {} point-of-interests written to {}".format(len(files), len(files) * arguments.pois,
+                                                                   arguments.directory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Library interface of presentation_maker.
+
+    from presentation_maker import api
+
+    config = api.default_config()
+    config["presentation_start"]["title"] = "Programming 1"
+    result = api.build(config, "path/to/course", "path/to/output")
+    print(result.html_file, result.slides, result.timings)
+
+build() creates the presentation like the command line does, but the configuration is given as a dictionary in the
+format of presentation_config.yaml. Nothing is written outside of output_dir: the configuration is not copied to the
+course and the working directory of the process is not changed. Errors are raised as PresentationMakerError
+subclasses (see errors) instead of exiting the process.
+
+Imported modules (docutils, hovercraft, bs4, rst2pdf) and the caches in output_dir are used again by the next build
+in the same process. Timings are recorded to the BuildContext of each build, but builds are still run one at a time
+because the directives of docutils and the warnings logged with settings.logger are shared by the whole process. Use
+processes to run builds at the same time.
+"""
+
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import yaml
+
+from . import create_pdf
+from . import presentation_maker as pm
+from . import profiling
+from . import settings
+from .build_context import BuildContext
+# exceptions raised by build can be imported from here too
+from .errors import PresentationMakerError, ConfigError, CourseError, RenderError  # noqa: F401
+
+# builds share the docutils registries and settings.logger, see the module documentation
+build_lock = threading.Lock()
+# sections of the configuration which build needs, the other sections are optional
+required_sections = (settings.presentation_start, settings.files, settings.first_slide, settings.other_slides)
+# sections which are dictionaries. files can be None, like in the default presentation_config.yaml.
+dict_sections = required_sections + (settings.slide_options, settings.header_footer, settings.last_slide)
+# (section, key) of the values which are written to the presentation RST as text
+text_values = ((settings.presentation_start, settings.title), (settings.presentation_start, settings.subtitle),
+               (settings.header_footer, settings.header), (settings.header_footer, settings.footer),
+               (settings.last_slide, settings.content))
+
+
+class BuildResult:
+    """
+    Outputs of a build.
+
+    rst_file: presentation RST
+    presentation_dir: folder of the html presentation
+    html_file: index.html of the presentation
+    pdf_file: pdf of the presentation, None if pdf creation is disabled in the configuration
+    slides: number of slides in the presentation
+    timings: wall times of the build stages in seconds, {stage: seconds}. "total" is the time of the whole build.
+    report: build report (see profiling.create_report) if build was run with timings=True, otherwise None
+    warnings: warnings and errors logged during the build
+    """
+
+    def __init__(self, rst_file, presentation_dir, pdf_file, slides, timings, report, warnings):
+        self.rst_file = Path(rst_file)
+        self.presentation_dir = Path(presentation_dir)
+        self.html_file = self.presentation_dir / "index.html"
+        self.pdf_file = Path(pdf_file) if pdf_file else None
+        self.slides = slides
+        self.timings = timings
+        self.report = report
+        self.warnings = warnings
+
+    def to_dict(self):
+        """
+        :return: result as a dictionary which can be written as JSON
+        """
+        return OrderedDict([
+            ("rst_file", str(self.rst_file)),
+            ("presentation_dir", str(self.presentation_dir)),
+            ("html_file", str(self.html_file)),
+            ("pdf_file", str(self.pdf_file) if self.pdf_file else None),
+            ("slides", self.slides),
+            ("timings", self.timings),
+            ("report", self.report),
+            ("warnings", self.warnings),
+        ])
+
+
+class WarningRecorder(logging.Handler):
+    """
+    Saves the messages of warnings and errors logged with settings.logger.
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def default_config(code_dir=None):
+    """
+    :param code_dir: directory of the default configuration, directory of presentation_maker by default
+    :return: default presentation_config.yaml as a dictionary. Its files section is empty but a dictionary, so
+        values can be set to it.
+    """
+    with open(str(Path(code_dir or settings.code_dir) / settings.config_name)) as reader:
+        config = yaml.load(reader, Loader=yaml.Loader)
+    config[settings.files] = config.get(settings.files) or {}
+    return config
+
+
+def config_error(message):
+    settings.logger.error(message)
+    raise ConfigError(message)
+
+
+def check_config(config):
+    """
+    Checks the structure of the configuration before anything is built.
+
+    :raises ConfigError: configuration is not a dictionary, a section is missing or it is not a dictionary, title or
+        subtitle is missing or a text value is not a string
+    """
+    if not isinstance(config, dict):
+        config_error("Configuration must be a dictionary, not {}.".format(type(config).__name__))
+    for section in required_sections:
+        if section not in config:
+            config_error("{} missing from the configuration.".format(section))
+    for section in dict_sections:
+        if section not in config or (section == settings.files and config[section] is None):
+            continue
+        if not isinstance(config[section], dict):
+            config_error("{} must be a dictionary, not {}.".format(section, type(config[section]).__name__))
+    for key in (settings.title, settings.subtitle):
+        if key not in config[settings.presentation_start]:
+            config_error("{} missing from {}.".format(key, settings.presentation_start))
+    for section, key in text_values:
+        value = config.get(section, {}).get(key)
+        if value and not isinstance(value, str):
+            config_error("{}: {} must be a string, not {}.".format(section, key, type(value).__name__))
+
+
+def build(config=None, course_path=".", output_dir=None, jobs=settings.default_jobs, timings=False, verbose=False,
+          stream_html=False, force=False):
+    """
+    Creates the presentation of the course.
+
+    :param config: configuration as a dictionary in the format of presentation_config.yaml, default_config() if None.
+        It is not changed. Relative paths in it (filename, css) are relative to course_path. Image paths in the
+        header and footer are relative to the presentation RST like in the command line.
+    :param course_path: root of the course directory which has index.rst
+    :param output_dir: build directory, course_path/_build by default. Presentation RST is written to
+        output_dir/presentation.rst unless filename is set in the configuration.
+    :param jobs: number of processes extracting slides and number of build stages run at the same time
+    :param timings: True to record the build report (wall time, CPU time and peak memory of the stages)
+    :param verbose: log more information
+    :param stream_html: rewrite index.html one step at a time
+    :param force: create the presentation even if nothing has changed since the last build in output_dir. Otherwise
+        the outputs of the last build are returned and timings has only "total".
+    :return: BuildResult
+    :raises ConfigError: configuration is not valid, see check_config
+    :raises CourseError: course files can not be read
+    :raises RenderError: html presentation or pdf was not created
+    :raises PresentationMakerError: other errors during the build
+    """
+    context = BuildContext(course_path, output_dir, verbose=verbose, stream_html=stream_html)
+    config = copy.deepcopy(config) if config is not None else default_config(context.code_dir)
+    check_config(config)
+    files = config[settings.files] or {}
+    config[settings.files] = files
+    files.setdefault(settings.filename, str(context.build_dir / Path(settings.default_filename).name))
+
+    context.recorder = profiling.Recorder() if timings else None
+    recorder = WarningRecorder()
+    with build_lock, profiling.activate(context.recorder):
+        settings.logger.addHandler(recorder)
+        try:
+            pm.create_dir(context.build_dir)
+            with profiling.stage("config"):
+                params, raw_dict, _, _, ending, last_slide_content, transition, other_transitions = \
+                    pm.parse_config(config, settings.config_name, context)
+            build, rst_file, presentation_folder = pm.build_course(raw_dict, params, ending, last_slide_content,
+                                                                   transition, other_transitions, context, jobs,
+                                                                   force=force)
+        except PresentationMakerError:
+            raise
+        except Exception as e:
+            settings.logger.error("Creating the presentation failed. Error: {}".format(e))
+            raise PresentationMakerError("Creating the presentation failed: {}".format(e)) from e
+        finally:
+            settings.logger.removeHandler(recorder)
+    report = profiling.create_report(context.recorder) if context.recorder else None
+
+    return create_result(build, rst_file, presentation_folder, raw_dict, context, report, recorder.messages)
+
+
+def create_result(build, rst_file, presentation_folder, raw_dict, context, report, warnings):
+    """
+    Checks that the presentation and pdf were created.
+
+    :return: BuildResult
+    """
+    html_file = Path(presentation_folder) / "index.html"
+    if not html_file.exists():
+        raise RenderError("{} was not created".format(html_file))
+    pdf_file = None
+    if raw_dict[settings.files][settings.make_pdf]:
+        pdf_file = context.build_dir / settings.pdf_folder / create_pdf.clean_filename(rst_file)
+        if not pdf_file.exists():
+            raise RenderError("{} was not created".format(pdf_file))
+    with open(rst_file) as reader:
+        slides = pm.count_slides(reader.read())
+    timings = OrderedDict((stage.name, round(stage.duration, 6)) for stage in build.stages.values())
+    timings["total"] = round(build.finished - build.started, 6)
+    return BuildResult(rst_file, presentation_folder, pdf_file, slides, timings, report, warnings)
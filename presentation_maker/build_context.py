@@ -0,0 +1,56 @@
+"""
+State of one presentation build.
+
+Paths of the build and the settings which are found while the presentation is built (background images, header and
+footer visibility) are kept in a BuildContext, which is given to the functions building the presentation. So two
+builds in the same process, e.g. in threads, do not change each other's settings or timings.
+
+Relative paths of the configuration (filename, course_path, css) are relative to base_dir instead of the working
+directory of the process. Command line uses the working directory as base_dir.
+"""
+
+from pathlib import Path
+
+from . import settings
+
+
+class BuildContext:
+    """
+    base_dir: directory which relative paths are relative to
+    build_dir: build directory, base_dir/_build by default
+    code_dir: directory of presentation_maker (default configuration, css and deck2pdf)
+    verbose: log more information, -v in command line
+    stream_html: rewrite index.html one step at a time, --stream-html in command line
+    bg_img: True if some slide has a background image
+    header_visible, footer_visible: False if header or footer is hidden in the configuration
+    recorder: profiling.Recorder of the timings of the build or None if they are not recorded
+    """
+
+    def __init__(self, base_dir, build_dir=None, code_dir=None, verbose=False, stream_html=False):
+        self.base_dir = Path(base_dir).absolute()
+        self.build_dir = self.path(build_dir or settings.build_dir_name)
+        self.code_dir = Path(code_dir) if code_dir else settings.code_dir
+        self.verbose = verbose
+        self.stream_html = stream_html
+        self.recorder = None
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the settings which are found while the presentation is built, before building it again.
+        """
+        self.bg_img = False
+        self.header_visible = True
+        self.footer_visible = True
+
+    def path(self, path):
+        """
+        :return: path relative to base_dir. Absolute paths are returned as they are.
+        """
+        return self.base_dir / path
+
+    def cache_path(self, *parts):
+        """
+        :return: path inside of the cache directory of the build
+        """
+        return self.build_dir.joinpath(settings.cache_dir, *parts)
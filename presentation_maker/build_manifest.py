@@ -0,0 +1,220 @@
+"""
+Manifest of the last successful build, used to skip builds when nothing has changed.
+
+Fingerprint of the build is created from everything the presentation is created from:
+
+    config: configuration after the command-line parameters and default values
+    sources: rst-files of the presentation in the toctree order and hashes of their contents
+    images: hashes of the images used in the last build and of the header and footer images, and version of the
+        image index (images found by name change if an image is added, removed or moved)
+    styles: presentation.css, css given in the configuration and light.style of rst2pdf
+    tool: hash of the source code of presentation_maker and versions of hovercraft, docutils, rst2pdf and bs4
+
+After a successful build the fingerprint is saved to _build/.cache/build_manifest.json with the size and
+modification time of each output file (presentation RST, rst2pdf RST, pdf and the files in the presentation folder).
+Next build creates the fingerprint before doing anything else. If it is the same and the output files have not been
+changed or deleted, the build is skipped. --force builds anyway.
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+from . import settings
+
+# change this if the content of the manifest or the fingerprint changes
+manifest_version = 1
+# distributions whose version affects the html presentation or the pdf
+tool_distributions = ("hovercraft", "docutils", "rst2pdf", "beautifulsoup4")
+# images in the header and footer of the configuration
+header_image_pattern = re.compile(r"(?:image|figure)::\s*(\S+)")
+
+
+def hash_file(path):
+    """
+    :return: sha256 hex digest of the file content or None if file does not exist
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(str(path), 'rb') as reader:
+            for block in iter(lambda: reader.read(1024 * 1024), b""):
+                digest.update(block)
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return None
+    return digest.hexdigest()
+
+
+def hash_files(paths):
+    """
+    :return: {path: hash of the content} in the order of paths
+    """
+    return OrderedDict((str(path), hash_file(path)) for path in paths)
+
+
+def tool_version(code_dir):
+    """
+    :return: hash of the python files of presentation_maker and versions of the distributions which create the
+        presentation
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(code_dir).glob("*.py")):
+        digest.update(path.name.encode("utf-8"))
+        digest.update((hash_file(path) or "").encode("ascii"))
+    versions = OrderedDict([("code", digest.hexdigest())])
+    try:
+        # new in Python 3.8, imported here because it is needed only when the fingerprint is created
+        from importlib import metadata
+    except ImportError:
+        return versions
+    for distribution in tool_distributions:
+        try:
+            versions[distribution] = metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            versions[distribution] = None
+    return versions
+
+
+def header_images(raw_dict, rst_dir):
+    """
+    :return: paths of the images in the header and footer of the configuration, relative to rst_dir like in the
+        presentation RST
+    """
+    header_footer = raw_dict.get(settings.header_footer) or {}
+    images = []
+    for key in (settings.header, settings.footer):
+        images.extend(Path(rst_dir) / image for image in header_image_pattern.findall(str(header_footer.get(key))))
+    return images
+
+
+def style_files(raw_dict, context):
+    """
+    :return: paths of the stylesheets of the html presentation and the pdf
+    """
+    styles = [context.code_dir / settings.default_css, context.code_dir / "light.style"]
+    css = raw_dict[settings.files].get(settings.css)
+    if css and context.path(css).is_file():
+        styles.append(context.path(css))
+    return styles
+
+
+def image_fingerprint(raw_dict, image_index, images, rst_file):
+    """
+    :param images: image paths used in the slides, relative to the directory of rst_file
+    :return: fingerprint of the images, see create_fingerprint
+    """
+    rst_dir = Path(rst_file).parent
+    image_paths = [rst_dir / image for image in images if image] + header_images(raw_dict, rst_dir)
+    return OrderedDict([("index", image_index.version), ("files", hash_files(image_paths))])
+
+
+def create_fingerprint(config, paths, image_index, images, rst_file, context):
+    """
+    Creates the fingerprint of the build, see the module documentation.
+
+    :param config: list of the configuration values from parse_config (raw_dict, params, ending,
+        last_slide_content, transition, other_transitions)
+    :param paths: rst-files of the presentation from pathfinder
+    :param image_index: ImageIndex of the course
+    :param images: image paths used in the slides, see image_fingerprint
+    :return: fingerprint as a dictionary which can be written as JSON
+    """
+    return OrderedDict([
+        ("config", hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()),
+        ("sources", hash_files(paths)),
+        ("images", image_fingerprint(config[0], image_index, images, rst_file)),
+        ("styles", hash_files(style_files(config[0], context))),
+        ("tool", tool_version(context.code_dir)),
+    ])
+
+
+def output_files(rst_file, presentation_folder, pdf_rst, pdf_file):
+    """
+    :param pdf_rst: path of the rst2pdf RST or None
+    :param pdf_file: path of the pdf or None if pdf is not created
+    :return: tuple (files which the build must have created, all output files)
+    """
+    required = [Path(rst_file), Path(presentation_folder) / "index.html"]
+    if pdf_rst:
+        required.append(Path(pdf_rst))
+    if pdf_file:
+        required.append(Path(pdf_file))
+    files = list(required)
+    for root, _, names in os.walk(str(presentation_folder)):
+        files.extend(Path(root) / name for name in sorted(names))
+    return required, files
+
+
+def stat_files(files):
+    """
+    :return: {path: [size, modification time in ns]}, None for the files which do not exist
+    """
+    stats = OrderedDict()
+    for path in files:
+        try:
+            st = os.stat(str(path))
+        except (FileNotFoundError, NotADirectoryError):
+            stats[str(path)] = None
+        else:
+            stats[str(path)] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def load(manifest_file):
+    """
+    :return: manifest as a dictionary or None if there is no valid manifest
+    """
+    try:
+        with open(str(manifest_file), encoding="utf-8") as reader:
+            manifest = json.load(reader, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != manifest_version:
+        return None
+    return manifest
+
+
+def save(manifest_file, fingerprint, outputs, images, presentation_folder):
+    """
+    Writes the manifest of a successful build.
+
+    :param outputs: stat_files of the output files
+    :param images: image paths used in the slides, see create_fingerprint
+    """
+    manifest = OrderedDict([("version", manifest_version), ("fingerprint", fingerprint), ("outputs", outputs),
+                            ("images", list(images)), ("presentation_folder", str(presentation_folder))])
+    manifest_file = Path(manifest_file)
+    try:
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        temporary = manifest_file.with_name(manifest_file.name + ".tmp")
+        with open(str(temporary), 'w', encoding="utf-8") as writer:
+            json.dump(manifest, writer, indent=1)
+        os.replace(str(temporary), str(manifest_file))
+    except OSError as e:
+        settings.logger.warning("Could not write build manifest {}. Error: {}".format(manifest_file, e))
+
+
+def remove(manifest_file):
+    """
+    Removes the manifest before the outputs are written, so an interrupted build is not taken as up to date.
+    """
+    try:
+        os.remove(str(manifest_file))
+    except FileNotFoundError:
+        pass
+
+
+def changes(manifest, fingerprint):
+    """
+    :return: list of the reasons why the build is not up to date, empty if it is
+    """
+    if manifest is None:
+        return ["no manifest of an earlier build"]
+    reasons = ["{} changed".format(name) for name, value in fingerprint.items()
+               if manifest["fingerprint"].get(name) != value]
+    outputs = manifest["outputs"]
+    if stat_files(outputs) != outputs:
+        reasons.append("output files changed")
+    return reasons
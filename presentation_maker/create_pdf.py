@@ -9,7 +9,6 @@ This file and deck2pdf folder needs to be in presentation_maker folder.
 """
 
 import argparse
-import os
 import re
 import shutil
 import subprocess
@@ -18,16 +17,28 @@ from pathlib import Path
 import yaml
 
 from . import presentation_maker as pm
+from .errors import ConfigError, RenderError
+from . import pdf_chunks
+from . import pdf_render
+from . import pdf_shards
+from . import profiling
 from . import settings
 
+option_line = re.compile(r"^[\s]?[:][a-zA-Z0-9]+.+$")
+transition_line = re.compile(r"^[-]{4}$")
+note_end = re.compile(r"^([a-zA-Z0-9\S]+)")
+main_title_underline = re.compile(r"^[=]{2,}$")
+title_underline = re.compile(r"^[-]{2,}$")
 
-def create_with_deck2pdf(deck2pdf_folder, pres_folder, filename, build_path):
+
+def create_with_deck2pdf(deck2pdf_folder, pres_folder, filename, build_path, shards=1):
     """
-    Creates pdf from index.html (presentation) file.
+    Creates pdf from index.html (presentation) file. deck2pdf is run in its bin directory, the working directory of
+    this process is not changed.
+
+    :param shards: number of deck2pdf processes rendering parts of the presentation at the same time
     """
-    current_path = Path.cwd()
-    run_deck2pdf = "./deck2pdf"
-    path_to_html = str(current_path / pres_folder / 'index.html')
+    path_to_html = str(Path(pres_folder).absolute() / 'index.html')
 
     # output = filename
     output = Path(build_path) / settings.pdf_folder / filename
@@ -36,45 +47,123 @@ def create_with_deck2pdf(deck2pdf_folder, pres_folder, filename, build_path):
         # if pdf folder does not exist it will be created
         pm.create_dir(output.parent)
 
-    os.chdir("{}/bin".format(deck2pdf_folder))
-
-    style_profile = "--profile=impressjs"
     try:
-        command = [run_deck2pdf, style_profile, path_to_html, str(output)]
-        subprocess.call(command)
+        if shards > 1:
+            pdf_shards.create(deck2pdf_folder, path_to_html, output, shards)
+        else:
+            pdf_shards.run_deck2pdf(deck2pdf_folder, path_to_html, output)
     except Exception as e:
         settings.logger.critical("Error occurred while trying to run deck2pdf. Error message: {}".format(e))
 
 
-def create_with_rst2pdf(rst2pdf_rst, output_pdf, code_dir):
+def create_with_rst2pdf(rst2pdf_rst, output_pdf, code_dir, parallel=False):
     # run rst2pdf with parameters
     # rst2pdf -s light.style -b1 converted_rst.rst -o presentation.pdf
     """
-    Creates pdf from rst2pdf compatible rst file.
-    """
+    Creates pdf from rst2pdf compatible rst file. rst2pdf is run in the same process if it can be imported,
+    errors are raised as RenderError then. Otherwise rst2pdf command is run in the directory of the rst file.
 
-    run_rst2pdf = "rst2pdf"
+    :param parallel: True if other stages of the build (e.g. hovercraft) run at the same time in this process.
+        rst2pdf is run in a warm worker process then (see pdf_render.render_in_worker), so they do not wait for it.
+    :raises RenderError: rst2pdf failed in the same process or in the worker process
+    """
+    with profiling.stage("rst2pdf.render", "pdf", file=str(rst2pdf_rst)):
+        if settings.rst2pdf_in_process and pdf_render.available():
+            if parallel and settings.rst2pdf_worker_process:
+                render = pdf_render.render_in_worker
+            else:
+                render = pdf_render.render
+            try:
+                render(rst2pdf_rst, output_pdf, rst2pdf_stylesheets(code_dir), settings.rst2pdf_break_level)
+            except Exception as e:
+                settings.logger.critical("Error occurred while running rst2pdf. Error message: {}".format(e))
+                raise RenderError("Running rst2pdf failed: {}".format(e)) from e
+            return
+
+        run_rst2pdf = "rst2pdf"
+        try:
+            command = [run_rst2pdf] + rst2pdf_options(code_dir) + [str(rst2pdf_rst), "-o", str(output_pdf)]
+            subprocess.call(command, cwd=str(Path(rst2pdf_rst).parent))
+        except Exception as e:
+            settings.logger.critical("Error occurred while trying to run rst2pdf. Error message: {}".format(e))
+
+
+def rst2pdf_stylesheets(code_dir):
+    """
+    :return: list of rst2pdf stylesheets
+    """
     font = "freetype-serif"
     # possible fonts
     # serif, freetype-sans, freetype-serif, twelvepoint, tenpoint, eightpoint, kerning
+    return [font, str(Path(code_dir) / "light.style")]
 
-    style_profile = font + "," + str(Path(code_dir) / "light.style")
-    # if page breaking fails try using -b1 or -b3 in a command below instead of -b2
-    try:
-        command = [run_rst2pdf, "-s", style_profile, "-b2", rst2pdf_rst, "-o", output_pdf]
-        subprocess.call(command)
-    except Exception as e:
-        settings.logger.critical("Error occurred while trying to run rst2pdf. Error message: {}".format(e))
+
+def rst2pdf_options(code_dir):
+    """
+    :return: rst2pdf command-line options for style and page breaks
+    """
+    style_profile = ",".join(rst2pdf_stylesheets(code_dir))
+    return ["-s", style_profile, "-b{}".format(settings.rst2pdf_break_level)]
+
+
+def rst2pdf_lines(lines, first_title_reached=False, title_done=False):
+    """
+    Converts lines of "hovercraft RST" to "rst2pdf RST", see convert_rst_to_rst2pdf_compatible.
+
+    :param first_title_reached: False if lines before the first transition line (----) are skipped
+    :param title_done: False if the first (=) title underline is the main title
+    :return: generator of converted lines
+    """
+    note = False
+    newcol = ".. {}::".format(settings.newcol_directive)
+    for line in lines:
+        if line.startswith(newcol):
+            # columns do not work in rst2pdf
+            line = settings.newcol + "\n"
+        if option_line.search(line):
+            # searches lines that has (0 or more space and) colon at start, some text after
+            # :options: skipped
+            continue
+        if transition_line.search(line):
+            # searches lines that has exactly four dashes in a line. (transitions) and skip them.
+            first_title_reached = True
+            continue
+        if re.search(settings.note, line):
+            # if this is found then skip lines as long as there is something in the beginning of a line
+            # remove notes from pdf. Could also be saved to another file if wanted.
+            note = True
+            continue
+        if note:
+            if not note_end.search(line):
+                # if note has not ended then continue skipping
+                continue
+            # checks if note has ended. if there is any character in the beginning of the line
+            note = False
+        elif not first_title_reached:
+            continue
+
+        if main_title_underline.search(line):
+            # this is only needed for the main title. Other (=) lines are skipped.
+            if title_done:
+                continue
+            line = line.replace("=", "#")
+            title_done = True
+        elif title_underline.search(line):
+            # find lines with two or more dashes and nothing else
+            # replacing "-" with "="
+            line = line.replace("-", "=")
+        yield line
 
 
 def convert_rst_to_rst2pdf_compatible(build_path, rst_file):
     """
-    Convert "hovercraft RST" to "rst2pdf RST"
+    Convert "hovercraft RST" to "rst2pdf RST". Used when the presentation is created directly from an RST file
+    (--direct). Otherwise presentation_maker writes the rst2pdf RST while it writes the presentation.
 
-    skip all the rows that follow these guidelines and append all other lines to list.
+    skip all the rows that follow these guidelines.
         0) remove all lines that are before first transition line (----), before first title
         1) remove all lines that start with colon (:)
-        2) remove all transition lines (----)
+        2) remove all transition lines (----) and write newcol directives as ::newcol lines
 
     replace all characters with these patterns:
         3) replace title under lines from (-) to (=)
@@ -82,60 +171,9 @@ def convert_rst_to_rst2pdf_compatible(build_path, rst_file):
 
         optional: delete notes from rst, otherwise those notes will be showed in pdf
     """
-    filename = settings.converted_rst_filename
-    file_to_write = Path(build_path) / filename
-    temporary_lines = []    # lines which will be added to file
-    first_title_reached = False
-    done = False
-    note = False
-    open(file_to_write, 'w').close()
-    with open(rst_file, 'r') as reader, open(file_to_write, 'a') as writer:
-
-        for line in reader.readlines():
-            if re.search("^[\s]?[:][a-zA-Z0-9]+.+$", line):
-                # searches lines that has (0 or more space and) colon at start, some text after
-                # :options: skipped
-                pass
-            elif re.search("^[-]{4}$", line):
-                # searches lines that has exactly four dashes in a line. (transitions) and skip them.
-                first_title_reached = True
-            elif re.search(settings.note, line):
-                # if this is found then skip lines as long as there is something in the beginning of a line
-                if note:
-                    pass
-                else:
-                    note = True
-                # remove notes from pdf. Could also be saved to another file if wanted.
-            else:
-                # store this line since it's ok
-                if note:
-                    if re.search("^([a-zA-Z0-9\S]+)", line):
-                        # checks if note has ended. if there is any character in the beginning of the line
-                        note = False
-                        temporary_lines.append(line)
-                    else:
-                        # if note has not ended then continue skipping
-                        pass
-                elif first_title_reached:
-                    temporary_lines.append(line)
-
-        # still steps 3 and 4 need to be implemented to temporary lines
-        for line in temporary_lines:
-            if re.search("^[=]{2,}$", line):
-                # this is only needed for the main title. After first round done flag is set to True
-                if not done:
-                    line = line.replace("=", "#")
-                    writer.write(line)
-                    done = True
-                else:
-                    pass
-            elif re.search("^[-]{2,}$", line):
-                # find lines with two or more dashes and nothing else
-                # replacing "-" with "="
-                line = line.replace("-", "=")
-                writer.write(line)
-            else:
-                writer.write(line)
+    file_to_write = converted_rst_path(build_path)
+    with open(rst_file, 'r') as reader, open(file_to_write, 'w') as writer:
+        writer.writelines(rst2pdf_lines(reader))
     settings.logger.info("RST conversion completed.")
     return file_to_write
 
@@ -151,11 +189,22 @@ def clean_filename(filename):
     return filename
 
 
+def pdf_path(filename, build_path):
+    """
+    :return: path of the pdf file in the pdf folder of the build directory. Folder is created if it does not exist.
+    """
+    destination = Path(build_path) / settings.pdf_folder / filename
+    if not destination.parent.is_dir():
+        settings.logger.info("Creating directory for pdf")
+        pm.create_dir(destination.parent)
+    return destination
+
+
 def move_pdf(filename, build_path):
     """
-    Moves pdf file to destination location.
+    Moves pdf file from the working directory to destination location. Used by independent pdf creation.
     """
-    # cwd: something/presentation-maker/presentation_maker/deck2pdf-0.3.0/bin
+    # independent pdf creation creates the pdf to the working directory
     cwd = Path.cwd()
     # build_path: something/else/test_course/course-templates/_build
     source = cwd / filename
@@ -204,56 +253,119 @@ def create_unique_filename(filename, destination):
     return filename
 
 
-def deck2pdf_method(pres_folder, filename, code_dir, build_path):
+def deck2pdf_method(pres_folder, filename, code_dir, build_path, shards=1):
     # if deck2pdf directory name changes. Change it here too.
     deck2pdf_dir_name = settings.deck2pdf_dir_name
     deck2pdf_path = str(code_dir / deck2pdf_dir_name)
     try:
         settings.logger.info("deck2pdf method selected")
         settings.logger.info("Creating pdf slides...")
-        create_with_deck2pdf(deck2pdf_path, pres_folder, filename, build_path)
+        create_with_deck2pdf(deck2pdf_path, pres_folder, filename, build_path, shards)
     except KeyError:
         settings.logger.critical("deck2pdf_dir not set in presentation_config.yaml")
-        pm.exiting()
+        pm.exiting(ConfigError, "deck2pdf_dir not set")
 
 
-def rst2pdf_method(pdf, rst, code_dir, build_path):
+def rst2pdf_method(pdf, rst, code_dir, build_path, chunk_size=0, jobs=1, converted_rst=None):
+    """
+    :param converted_rst: rst2pdf RST written by presentation_maker, rst is converted if it is None
+    """
+    if converted_rst is None:
+        converted_rst = convert_rst_to_rst2pdf_compatible(build_path, rst)
+    rst2pdf_render(converted_rst, pdf, code_dir, build_path, chunk_size, jobs)
+
+
+def converted_rst_path(build_path):
+    """
+    :return: path to the rst2pdf compatible rst file
+    """
+    return Path(build_path) / settings.converted_rst_filename
+
+
+def uses_rst2pdf(dictionary):
+    """
+    :return: True if pdf is created with rst2pdf
+    """
+    return bool(dictionary.get(settings.files)[settings.make_pdf] and dictionary.get(settings.files)[settings.rst2pdf])
+
+
+def rst2pdf_render(converted_rst, pdf, code_dir, build_path, chunk_size=0, jobs=1, parallel=False):
+    """
+    Creates pdf with rst2pdf to the pdf folder.
+
+    :param chunk_size: if more than 0, pdf is rendered in chunks of chunk_size slides which are cached
+    :param jobs: number of processes rendering the chunks
+    :param parallel: True if other stages of the build run at the same time, see create_with_rst2pdf
+    """
     settings.logger.info("rst2pdf method selected")
-    converted_rst = convert_rst_to_rst2pdf_compatible(build_path, rst)
     settings.logger.info("Creating pdf slides...")
-    create_with_rst2pdf(converted_rst, pdf, code_dir)
+    output = pdf_path(pdf, build_path)
+    if chunk_size > 0:
+        pdf_chunks.create(converted_rst, output, code_dir, Path(build_path) / settings.cache_dir /
+                          settings.rst2pdf_cache_dir, chunk_size, jobs, parallel)
+    else:
+        create_with_rst2pdf(converted_rst, output, code_dir, parallel)
 
 
-def create(dictionary, rst_file, pres_folder, build_path, code_dir):
+def create(dictionary, rst_file, pres_folder, context, jobs=1, converted_rst=None):
     """
     This function is being run as a module from presentation_maker.py.
     Function starts other functions in order to create pdf.
+
+    :param context: BuildContext, pdf is created to the pdf folder of its build directory
+    :param jobs: number of processes rendering the pdf chunks
+    :param converted_rst: rst2pdf RST written with the presentation RST, rst_file is converted if it is None
     """
     # changes .rst suffix to .pdf
     pdf_file = clean_filename(rst_file)
+    build_path = context.build_dir
+    code_dir = context.code_dir
 
     if dictionary.get(settings.files)[settings.make_pdf]:
         # pdf creation set to true
         if dictionary.get(settings.files)[settings.rst2pdf]:
             # rst2pdf selected
-            rst2pdf_method(pdf_file, rst_file, code_dir, build_path)
-            move_pdf(pdf_file, build_path)
+            rst2pdf_method(pdf_file, rst_file, code_dir, build_path, pdf_chunk_size(dictionary), jobs,
+                           converted_rst)
         else:
             # deck2pdf selected
-            deck2pdf_method(pres_folder, pdf_file, code_dir, build_path)
+            deck2pdf_method(pres_folder, pdf_file, code_dir, build_path, pdf_shard_count(dictionary))
+            check_pdf(pdf_file, build_path)
+    else:
+        skip_pdf()
+    pm.print_spacer()
 
-            pdf_file = Path(build_path) / settings.pdf_folder / pdf_file
 
-            path = Path.cwd() / pdf_file
+def pdf_shard_count(dictionary):
+    """
+    :return: number of deck2pdf processes (pdf_shards in presentation_config.yaml or --pdf-shards)
+    """
+    return int(dictionary.get(settings.files).get(settings.pdf_shards) or settings.default_pdf_shards)
 
-            if Path(pdf_file).exists():
-                settings.logger.info("{} created".format(pdf_file))
-            else:
-                settings.logger.warning("PDF file creation failed. Pdf file was not found "
-                                        "in the location:\n {}".format(path))
+
+def pdf_chunk_size(dictionary):
+    """
+    :return: number of slides rendered together by rst2pdf (pdf_chunk_size in presentation_config.yaml or
+        --pdf-chunk-size), 0 if the whole presentation is rendered at once
+    """
+    return int(dictionary.get(settings.files).get(settings.pdf_chunk_size) or settings.default_pdf_chunk_size)
+
+
+def skip_pdf():
+    settings.logger.info("Skipping pdf creation...\nNote: edit presentation_config.yaml to enable pdf creation")
+
+
+def check_pdf(pdf_file, build_path):
+    """
+    Checks that deck2pdf created the pdf file.
+    """
+    pdf_file = Path(build_path) / settings.pdf_folder / pdf_file
+
+    if pdf_file.exists():
+        settings.logger.info("{} created".format(pdf_file))
     else:
-        settings.logger.info("Skipping pdf creation...\nNote: edit presentation_config.yaml to enable pdf creation")
-    pm.print_spacer()
+        settings.logger.warning("PDF file creation failed. Pdf file was not found "
+                                "in the location:\n {}".format(pdf_file))
 
 
 # if this file is being run directly by it's own from terminal. Then do stuff below.
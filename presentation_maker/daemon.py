@@ -0,0 +1,481 @@
+"""
+Build daemon: presentation_maker daemon and its client presentation_maker submit
+
+Daemon is a long-lived process which creates presentations with api.build in a pool of worker processes. Workers
+import hovercraft, docutils, bs4, yaml and rst2pdf and register the directives when they start, so a build does not
+pay for starting Python and importing them. Jobs are sent over HTTP to localhost or to a Unix socket (--socket) and
+they wait in a bounded queue. When the queue is full, new jobs are refused with 503 and the client tries again later.
+
+    POST /jobs          submit a job, returns {"id": ..., "status": "queued"}
+    GET /jobs/<id>      status and results of the job. ?wait=<seconds> waits until the job is done.
+    GET /status         number of workers, queued and running jobs
+
+Job is a JSON object:
+
+    course_path     root of the course directory, absolute path
+    output_dir      build directory, course_path/_build by default. When several languages are built, each language
+                    is built to output_dir_<language> next to it.
+    config          path of the configuration file relative to course_path. presentation_config.yaml of the course
+                    or the default configuration is used if it is not given.
+    overrides       configuration values which replace the ones of the configuration file, e.g.
+                    {"files": {"make_pdf": true}, "presentation_start": {"title": "Programming 1"}}
+    languages       languages to build, e.g. ["en", "fi"]. Languages are built in parallel.
+    jobs            --jobs of each build, 1 by default
+
+Results of the job have the BuildResult of each language (paths, slides, stage times, build report of all stages,
+warnings) or the type and message of the error if the build failed.
+"""
+
+import argparse
+import copy
+import http.client
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import yaml
+
+from . import api
+from . import settings
+from .errors import ConfigError
+
+
+def warm_up(log_level):
+    """
+    Initializer of the worker processes. Registers the directives and imports rst2pdf before the first build.
+    """
+    from . import hover
+    from . import pdf_render
+
+    settings.logger.setLevel(log_level)
+    # the worker is already a process which has rst2pdf imported
+    settings.rst2pdf_worker_process = False
+    hover.register_directives()
+    if pdf_render.available():
+        # rst2pdf registers its directives when it is imported, they are kept in the rst2pdf registry
+        with pdf_render.rst2pdf_docutils():
+            pdf_render.warm_renderer_class()
+
+
+def run_build(config, course_path, output_dir, language, jobs):
+    """
+    Builds one language of a job in a worker process.
+
+    :return: result of the build as a dictionary, error and message instead of the outputs if the build failed
+    """
+    if language:
+        config[settings.files][settings.language] = language
+    try:
+        result = api.build(config, course_path, output_dir, jobs=jobs, timings=True)
+    except api.PresentationMakerError as e:
+        return OrderedDict([("language", language), ("status", "failed"), ("error", type(e).__name__),
+                            ("message", str(e))])
+    return OrderedDict([("language", language), ("status", "done")] + list(result.to_dict().items()))
+
+
+def merge_config(config, overrides):
+    """
+    Replaces the values of config with overrides. Sections (dictionaries) are merged, other values are replaced.
+
+    :return: config
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            merge_config(config[key], value)
+        else:
+            config[key] = value
+    return config
+
+
+def load_config(spec):
+    """
+    :return: configuration of the job with its overrides
+    """
+    course_path = Path(spec["course_path"])
+    config_path = course_path / spec["config"] if spec.get("config") else course_path / settings.config_name
+    if spec.get("config") or config_path.exists():
+        try:
+            with open(str(config_path)) as reader:
+                config = yaml.load(reader, Loader=yaml.Loader)
+        except (OSError, yaml.YAMLError) as e:
+            raise ConfigError("Could not read {}: {}".format(config_path, e))
+        if not isinstance(config, dict):
+            raise ConfigError("{} is not a configuration".format(config_path))
+    else:
+        config = api.default_config()
+    # language is set to the files section
+    config[settings.files] = config.get(settings.files) or {}
+    return merge_config(config, spec.get("overrides") or {})
+
+
+def check_spec(spec):
+    """
+    :raises ValueError: if the job is not valid
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("job must be a JSON object")
+    if not isinstance(spec.get("course_path"), str) or not Path(spec["course_path"]).is_absolute():
+        raise ValueError("course_path must be an absolute path")
+    for key, kind in (("output_dir", str), ("config", str), ("overrides", dict), ("languages", list),
+                      ("jobs", int)):
+        if spec.get(key) is not None and not isinstance(spec[key], kind):
+            raise ValueError("{} must be {}".format(key, kind.__name__))
+    if not all(isinstance(language, str) and language for language in spec.get("languages") or []):
+        raise ValueError("languages must be a list of language codes")
+
+
+class Job:
+    """
+    Build job and its results. Times are time.time() timestamps, None until the job is started or done.
+    """
+
+    def __init__(self, job_id, spec):
+        self.id = job_id
+        self.spec = spec
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.results = []
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        waited = (self.started or time.time()) - self.submitted
+        run = (self.finished or time.time()) - self.started if self.started else None
+        return OrderedDict([
+            ("id", self.id),
+            ("status", self.status),
+            ("course_path", self.spec["course_path"]),
+            ("queued", round(waited, 3)),
+            ("run", round(run, 3) if run is not None else None),
+            ("results", self.results),
+            ("error", self.error),
+        ])
+
+
+class BuildDaemon:
+    """
+    Queue of the jobs and the worker processes running them. Each dispatcher thread takes a job from the queue and
+    waits for its builds, so at most workers jobs are running at the same time.
+    """
+
+    def __init__(self, workers=settings.daemon_workers, queue_size=settings.daemon_queue_size,
+                 history=settings.daemon_history, log_level=logging.WARNING):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers, initializer=warm_up, initargs=(log_level,))
+        self.queue = queue.Queue(queue_size)
+        self.history = history
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+        self.running = 0
+        self.lock = threading.Lock()
+        for number in range(workers):
+            threading.Thread(target=self.dispatch, name="dispatcher {}".format(number), daemon=True).start()
+
+    def submit(self, spec):
+        """
+        :return: Job or None if the queue is full
+        :raises ValueError: if the job is not valid
+        """
+        check_spec(spec)
+        with self.lock:
+            job = Job(str(next(self.ids)), spec)
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                return None
+            self.jobs[job.id] = job
+            # oldest finished jobs are forgotten
+            finished = [old.id for old in self.jobs.values() if old.done.is_set()]
+            for old_id in finished[:max(0, len(self.jobs) - self.history)]:
+                del self.jobs[old_id]
+        settings.logger.info("Job {} queued: {}".format(job.id, spec["course_path"]))
+        return job
+
+    def dispatch(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                self.running += 1
+            job.started = time.time()
+            job.status = "running"
+            try:
+                job.results = self.run(job)
+                job.status = "done" if all(result["status"] == "done" for result in job.results) else "failed"
+            except Exception as e:
+                job.error = "{}: {}".format(type(e).__name__, e)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                with self.lock:
+                    self.running -= 1
+                job.done.set()
+            settings.logger.info("Job {} {} in {:.2f} s.".format(job.id, job.status, job.finished - job.started))
+
+    def run(self, job):
+        """
+        Builds the languages of the job in the worker processes.
+
+        :return: list of the results of the builds
+        """
+        spec = job.spec
+        config = load_config(spec)
+        languages = spec.get("languages") or [None]
+        output_dir = Path(spec.get("output_dir") or Path(spec["course_path"]) / settings.build_dir_name)
+        futures = []
+        for language in languages:
+            # arguments are pickled later by the executor, so each build needs its own copy
+            build_config = copy.deepcopy(config)
+            build_dir = output_dir
+            if len(languages) > 1:
+                build_dir = output_dir.with_name("{}_{}".format(output_dir.name, language))
+                filename = build_config[settings.files].get(settings.filename) or settings.default_filename
+                build_config[settings.files][settings.filename] = str(build_dir / Path(filename).name)
+            futures.append(self.executor.submit(run_build, build_config, spec["course_path"], str(build_dir),
+                                                language, spec.get("jobs") or 1))
+        return [future.result() for future in futures]
+
+    def status(self):
+        with self.lock:
+            return OrderedDict([("workers", self.workers), ("queued", self.queue.qsize()),
+                                ("running", self.running), ("jobs", len(self.jobs))])
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of the daemon. Attributes daemon and verbose are set by create_server.
+    """
+
+    protocol_version = "HTTP/1.1"
+    daemon = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            settings.logger.info("{} - {}".format(self.address_string(), format % args))
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix socket"
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/jobs":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            job = self.daemon.submit(json.loads(self.rfile.read(length).decode("utf-8")))
+        except ValueError as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        if job is None:
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "queue is full"})
+            return
+        self.send_json(HTTPStatus.ACCEPTED, job.to_dict())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/status":
+            self.send_json(HTTPStatus.OK, self.daemon.status())
+            return
+        job = self.daemon.jobs.get(url.path[len("/jobs/"):]) if url.path.startswith("/jobs/") else None
+        if job is None:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "no such job"})
+            return
+        try:
+            wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+        except ValueError:
+            wait = 0
+        job.done.wait(min(max(wait, 0), settings.daemon_wait))
+        self.send_json(HTTPStatus.OK, job.to_dict())
+
+
+class DaemonServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(daemon, host, port, socket_path=None, verbose=False):
+    """
+    :param socket_path: path of the Unix socket, host and port are not used if it is given
+    :return: server listening to localhost or the Unix socket
+    """
+    handler = type("Handler", (DaemonHandler,), {"daemon": daemon, "verbose": verbose})
+    if socket_path:
+        if os.path.exists(socket_path):
+            # socket of a daemon which was not stopped cleanly
+            os.unlink(socket_path)
+        return UnixDaemonServer(socket_path, handler)
+    return DaemonServer((host, port), handler)
+
+
+def main(argv=None):
+    """
+    Runs the build daemon until interrupted.
+    """
+    parser = argparse.ArgumentParser(prog="presentation_maker daemon",
+                                     description="Build presentations sent by presentation_maker submit in warm "
+                                                 "worker processes.")
+    parser.add_argument("--host", default=settings.daemon_host, help="address to listen to")
+    parser.add_argument("--port", type=int, default=settings.daemon_port, help="port to listen to")
+    parser.add_argument("--socket", metavar="PATH", help="listen to a Unix socket instead of a port")
+    parser.add_argument("-w", "--workers", type=int, default=settings.daemon_workers,
+                        help="number of worker processes")
+    parser.add_argument("--queue-size", type=int, default=settings.daemon_queue_size,
+                        help="maximum number of jobs waiting for a worker")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the requests and the builds")
+    args = parser.parse_args(argv)
+
+    daemon = BuildDaemon(args.workers, args.queue_size, log_level=logging.INFO if args.verbose else logging.WARNING)
+    server = create_server(daemon, args.host, args.port, args.socket, args.verbose)
+    address = args.socket or "http://{}:{}/".format(args.host, server.server_address[1])
+    settings.logger.info("Build daemon listening at {} with {} workers. Press Ctrl+C to stop.".format(
+        address, args.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        settings.logger.info("Stopped the build daemon.")
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to a Unix socket.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(args, method, path, data=None):
+    """
+    Sends a request to the daemon.
+
+    :return: tuple (HTTP status, response as a dictionary)
+    """
+    timeout = settings.daemon_wait + 30
+    if args.socket:
+        connection = UnixHTTPConnection(args.socket, timeout)
+    else:
+        connection = http.client.HTTPConnection(args.host, args.port, timeout)
+    try:
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        connection.request(method, path, body, {"Content-Type": "application/json"} if body else {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
+
+
+def parse_override(text):
+    """
+    Parses --set option, e.g. "files.make_pdf=true" or "presentation_start.title=Programming 1". Value is read as
+    YAML, so true, false and numbers get their types.
+
+    :return: overrides as a dictionary, {"files": {"make_pdf": True}}
+    """
+    key, separator, value = text.partition("=")
+    if not separator or not key:
+        raise argparse.ArgumentTypeError("use SECTION.KEY=VALUE")
+    override = yaml.safe_load(value) if value else None
+    for part in reversed(key.split(".")):
+        override = {part: override}
+    return override
+
+
+def submit_main(argv=None):
+    """
+    Sends a job to the daemon and waits for the results. Results are printed as JSON.
+
+    :return: exit status, 0 if the job succeeded
+    """
+    parser = argparse.ArgumentParser(prog="presentation_maker submit",
+                                     description="Send a build job to presentation_maker daemon.")
+    parser.add_argument("course_path", nargs="?", default=".", help="root of the course directory")
+    parser.add_argument("-o", "--output-dir", help="build directory, <course_path>/_build by default")
+    parser.add_argument("-y", "--config_path", help="configuration file, relative to the course directory")
+    parser.add_argument("-l", "--language", action="append", dest="languages",
+                        help="language to build, can be given several times")
+    parser.add_argument("--set", action="append", type=parse_override, default=[], metavar="SECTION.KEY=VALUE",
+                        help="override a configuration value, e.g. --set files.make_pdf=true")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="--jobs of each build")
+    parser.add_argument("--no-wait", action="store_true", help="print the job id and do not wait for the results")
+    parser.add_argument("--host", default=settings.daemon_host, help="address of the daemon")
+    parser.add_argument("--port", type=int, default=settings.daemon_port, help="port of the daemon")
+    parser.add_argument("--socket", metavar="PATH", help="Unix socket of the daemon")
+    parser.add_argument("--retry", type=float, default=60, metavar="SECONDS",
+                        help="how long to try again if the queue of the daemon is full")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for override in args.set:
+        merge_config(overrides, override)
+    spec = OrderedDict([("course_path", str(Path(args.course_path).resolve())),
+                        ("output_dir", str(Path(args.output_dir).resolve()) if args.output_dir else None),
+                        ("config", args.config_path), ("overrides", overrides), ("languages", args.languages),
+                        ("jobs", args.jobs)])
+    deadline = time.monotonic() + args.retry
+    try:
+        while True:
+            status, job = request(args, "POST", "/jobs", spec)
+            if status != HTTPStatus.SERVICE_UNAVAILABLE or time.monotonic() > deadline:
+                break
+            time.sleep(1)
+        if status != HTTPStatus.ACCEPTED:
+            settings.logger.error("Daemon refused the job: {}".format(job.get("error")))
+            return 2
+        if args.no_wait:
+            print(job["id"])
+            return 0
+        job_id = job["id"]
+        while job["status"] in ("queued", "running"):
+            status, job = request(args, "GET", "/jobs/{}?wait={}".format(job_id, settings.daemon_wait))
+            if status != HTTPStatus.OK:
+                settings.logger.error("Job {} was not found: {}".format(job_id, job.get("error")))
+                return 2
+    except OSError as e:
+        settings.logger.error("Could not connect to the daemon. Error: {}".format(e))
+        return 2
+    print(json.dumps(job, indent=2))
+    return 0 if job["status"] == "done" else 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Errors which stop the build.
+
+Errors are logged where they are found and then an exception is raised with exiting(). Command line exits with
+status 2 when it gets a PresentationMakerError. Library users (see api.build) can catch the exceptions.
+"""
+
+
+class PresentationMakerError(Exception):
+    """
+    Base class of the errors of presentation_maker.
+    """
+
+
+class ConfigError(PresentationMakerError):
+    """
+    Configuration is missing or it is not valid.
+    """
+
+
+class CourseError(PresentationMakerError):
+    """
+    Course files (index.rst, rst-files) can not be read.
+    """
+
+
+class RenderError(PresentationMakerError):
+    """
+    Creating the html presentation or the pdf failed.
+    """
@@ -0,0 +1,277 @@
+"""
+Snapshot of the course directory.
+
+Course directory is walked once with os.scandir. Build and version control directories are skipped
+without descending into them. Name, size and modification time are recorded for every file, so
+image discovery, pathfinder and copy_file can use the snapshot instead of walking and stat'ing the
+file system again.
+
+Snapshot can be saved to the build directory (_build/.cache). Next run stats only the directories
+and reads again only those directories whose modification time has changed.
+
+Cold and warm snapshot times can be compared by running this file directly:
+python3 -m presentation_maker.file_snapshot <course_path>
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from . import settings
+
+FileEntry = namedtuple("FileEntry", ["path", "name", "size", "mtime"])
+
+# change this if the format of the cache file changes
+cache_version = 1
+# directories modified this close (ns) to the previous scan may have changed after it within the same mtime
+# tick, so those are always read again
+racy_window = 2 * 10 ** 9
+
+
+def is_ignored_dir(name):
+    """
+    Checks if directory is skipped while walking the course directory.
+
+    :return: True if directory is a build or version control directory.
+    """
+    return name in settings.ignored_dirs or settings.ignored_dir_pattern in name
+
+
+def normalize(path):
+    return os.path.normpath(os.path.abspath(str(path)))
+
+
+def stat(path):
+    """
+    Stats a file which is not in the snapshot.
+
+    :return: FileEntry or None if file does not exist.
+    """
+    path = str(path)
+    try:
+        st = os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return FileEntry(path, os.path.basename(path), st.st_size, st.st_mtime)
+
+
+class FileSnapshot:
+    """
+    Files in the course directory. Paths are absolute and normalized, see normalize function.
+
+    If cache_dir is given, snapshot is loaded from and saved to a cache file in that directory.
+    File sizes and modification times taken from the cache are refreshed when the file is stat'ed.
+    """
+
+    def __init__(self, root, cache_dir=None):
+        self.root = normalize(root)
+        self.prefix = os.path.join(self.root, "")
+        # {path: FileEntry}
+        self.files = {}
+        # {lowercase suffix: [FileEntry, ...]}
+        self.suffixes = {}
+        # {directory path relative to root: (mtime_ns, [file names], [sub directory names])}
+        self.dirs = {}
+        # files whose FileEntry is from the cache and may be out of date
+        self.cached = set()
+        self.scanned_dirs = 0
+        self.reused_dirs = 0
+        self.cache_file = Path(cache_dir) / settings.file_index_cache if cache_dir else None
+        self.scan(self.load_cache())
+        if self.cache_file and self.scanned_dirs:
+            self.save_cache()
+
+    def scan(self, cached_dirs=None):
+        """
+        Walks the course directory once. Ignored directories are pruned before descending into them.
+        Directories which have not changed since they were cached are not read again.
+
+        :param cached_dirs: dirs from the previous snapshot or None
+        """
+        cached_dirs = cached_dirs or {}
+        stack = [(self.root, ".")]
+        while stack:
+            directory, relative = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+                settings.logger.warning("Could not read directory {}. Error: {}".format(directory, e))
+                continue
+            cached = cached_dirs.get(relative)
+            if cached and cached[0] == mtime:
+                subdirs = self.reuse_dir(directory, relative, cached)
+            else:
+                subdirs = self.scan_dir(directory, relative, mtime)
+            if subdirs is None:
+                continue
+            # reversed so that directories are walked in alphabetical order
+            for name in reversed(subdirs):
+                stack.append((os.path.join(directory, name), os.path.join(relative, name)))
+
+    def scan_dir(self, directory, relative, mtime):
+        """
+        Reads one directory and stats its files.
+
+        :return: names of sub directories or None if directory could not be read.
+        """
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+            settings.logger.warning("Could not read directory {}. Error: {}".format(directory, e))
+            return None
+        # sorted so that the order of the files does not depend on the file system
+        entries.sort(key=lambda e: e.name)
+        files = []
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_ignored_dir(entry.name):
+                    subdirs.append(entry.name)
+            else:
+                st = entry.stat(follow_symlinks=False)
+                self.add(FileEntry(entry.path, entry.name, st.st_size, st.st_mtime))
+                files.append([entry.name, st.st_size, st.st_mtime])
+        self.dirs[relative] = (mtime, files, subdirs)
+        self.scanned_dirs += 1
+        return subdirs
+
+    def reuse_dir(self, directory, relative, cached):
+        """
+        Adds files of an unchanged directory from the cache.
+
+        :return: names of sub directories.
+        """
+        mtime, files, subdirs = cached
+        directory = os.path.join(directory, "")
+        for name, size, file_mtime in files:
+            path = directory + name
+            self.add(FileEntry(path, name, size, file_mtime))
+            self.cached.add(path)
+        self.dirs[relative] = cached
+        self.reused_dirs += 1
+        return subdirs
+
+    def add(self, file_entry):
+        self.files[file_entry.path] = file_entry
+        name = file_entry.name.lstrip(".")
+        suffix = "." + name.rpartition(".")[2].lower() if "." in name else ""
+        self.suffixes.setdefault(suffix, []).append(file_entry)
+
+    def load_cache(self):
+        """
+        Loads directories from the cache file. Cache is ignored if it was made for another course directory,
+        with other ignored directories or with another cache format.
+
+        :return: dirs from the cache or None.
+        """
+        if not self.cache_file or not self.cache_file.exists():
+            return None
+        try:
+            with gzip.open(str(self.cache_file), "rt", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            settings.logger.warning("Could not read file index cache {}. Error: {}".format(self.cache_file, e))
+            return None
+        if data.get("version") != cache_version or data.get("root") != self.root \
+                or data.get("ignored") != [list(settings.ignored_dirs), settings.ignored_dir_pattern]:
+            return None
+        racy = data["scanned_at"] - racy_window
+        return {relative: entry for relative, entry in data["dirs"].items() if entry[0] < racy}
+
+    def save_cache(self):
+        data = {
+            "version": cache_version,
+            "root": self.root,
+            "ignored": [list(settings.ignored_dirs), settings.ignored_dir_pattern],
+            "scanned_at": int(time.time() * 10 ** 9),
+            "dirs": self.dirs,
+        }
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.cache_file.with_name(self.cache_file.name + ".tmp")
+            with gzip.open(str(temporary), "wt", compresslevel=1, encoding="utf-8") as file:
+                json.dump(data, file, separators=(",", ":"))
+            os.replace(str(temporary), str(self.cache_file))
+        except OSError as e:
+            settings.logger.warning("Could not write file index cache {}. Error: {}".format(self.cache_file, e))
+
+    def covers(self, path):
+        """
+        Checks if path is inside of the snapshot. Files outside of the snapshot need to be stat'ed normally.
+        """
+        if not path.startswith(self.prefix):
+            return False
+        relative = path[len(self.prefix):]
+        return not any(is_ignored_dir(part) for part in relative.split(os.sep)[:-1])
+
+    def stat(self, path):
+        """
+        :return: FileEntry or None if file does not exist.
+        """
+        path = normalize(path)
+        if not self.covers(path):
+            return stat(path)
+        if path in self.cached:
+            # size and mtime from the cache may be old, since file changes do not change directory mtime
+            self.cached.discard(path)
+            file_entry = stat(path)
+            if file_entry:
+                self.files[path] = file_entry
+            else:
+                del self.files[path]
+        return self.files.get(path)
+
+    def exists(self, path):
+        path = normalize(path)
+        if self.covers(path):
+            return path in self.files
+        return stat(path) is not None
+
+    def find_suffixes(self, suffixes):
+        """
+        Finds files which have one of the given suffixes. Suffixes are case-sensitive like in the file system.
+
+        :return: list of paths in order of the given suffixes.
+        """
+        paths = []
+        for suffix in suffixes:
+            for entry in self.suffixes.get(suffix.lower(), []):
+                if entry.name.endswith(suffix):
+                    paths.append(Path(entry.path))
+        return paths
+
+
+def main():
+    """
+    Compares cold (no cache) and warm (cache) snapshot times of a course directory.
+    """
+    parser = argparse.ArgumentParser(description="Compare file index times with and without the cache.")
+    parser.add_argument("course_path", nargs="?", default=".", help="path to the root of course directory")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="how many times each snapshot is made")
+    arguments = parser.parse_args()
+    cache_dir = Path(arguments.course_path) / "_build" / settings.cache_dir
+
+    def best_time(use_cache):
+        times = []
+        for _ in range(arguments.repeat):
+            start = time.perf_counter()
+            snapshot = FileSnapshot(arguments.course_path, cache_dir if use_cache else None)
+            times.append(time.perf_counter() - start)
+        return min(times), snapshot
+
+    cold, snapshot = best_time(False)
+    settings.logger.info("cold: {:.1f} ms, {} files in {} directories".format(cold * 1000, len(snapshot.files),
+                                                                             snapshot.scanned_dirs))
+    # first run fills the cache
+    FileSnapshot(arguments.course_path, cache_dir)
+    warm, snapshot = best_time(True)
+    settings.logger.info("warm: {:.1f} ms, {} directories from cache, {} directories read".format(
+        warm * 1000, snapshot.reused_dirs, snapshot.scanned_dirs))
+
+
+if __name__ == "__main__":
+    main()
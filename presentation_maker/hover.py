@@ -4,15 +4,21 @@ RST file. Presentation (index.html) will be in the folder called presentation.
 
 """
 
+import os
 import subprocess
 import traceback
+from contextlib import contextmanager
 from pathlib import Path
 
 from bs4 import BeautifulSoup as bs
 
 from . import presentation_maker as pm
 from . import create_columns as column
+from .errors import RenderError
+from . import pdf_render
+from . import profiling
 from . import settings
+from . import stream_html
 
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
@@ -37,18 +43,17 @@ def create_unique_folder(current_path):
             return presentation_folder
 
 
-def get_folder_name(dictionary):
+def get_folder_name(dictionary, build_dir):
     """
     Gets folder name for presentation. Primarily tries to get name from
     presentation_config.yaml. If there isn't one then create folder
-    'presentation', if it already exist then create unique folder.
+    'presentation', if it already exist in build_dir then create unique folder.
 
     :return: folder name for presentation
     """
 
     try:
         presentation_folder = dictionary.get(settings.files)[settings.hovercraft_target_dir]
-        p = Path.cwd()
         if not presentation_folder:
             raise TypeError
         return presentation_folder
@@ -57,7 +62,7 @@ def get_folder_name(dictionary):
         settings.logger.warning(
             "'hovercraft_destination_folder' not set in presentation_config.yaml\nSelecting destination "
             "folder...")
-        p = Path.cwd()
+        p = Path(build_dir)
         # trying to use name as a default name
         presentation_folder = settings.default_hovercraft_target_dir
         if (p / presentation_folder).is_dir():
@@ -71,46 +76,44 @@ def get_folder_name(dictionary):
         return presentation_folder
 
 
-def handle_images(pres_dir_path, rst_file, image_paths):
+def handle_images(pres_dir_path, rst_file, image_paths, snapshot=None):
     """
-    Handles all the functions which are needed to copy images (used in presentation) to images directory.
-    And also changes image paths in presentation.rst to match new paths.
+    Copies images (used in presentation) to the places where index.html refers to them. Image paths are relative to
+    the directory of rst_file.
 
     :param image_paths:
+    :param snapshot:
     :param pres_dir_path:
     :param rst_file:
     :return:
     """
-
-    pres_dir_path = Path(pres_dir_path)
-    images_dir_path = pres_dir_path.parent / "images"
-    if not images_dir_path.exists():
-        settings.logger.info("Images folder does not exist. Creating {}".format(images_dir_path))
-        images_dir_path.mkdir(exist_ok=False)
     # image_list = find_images(rst_file)
     image_list = image_paths
-    copy(image_list, images_dir_path)
+    copy(image_list, Path(pres_dir_path), Path(rst_file).parent, snapshot)
     # change_paths(rst_file)
 
 
-def copy(image_list, images_dir_path):
+def copy(image_list, pres_dir_path, rst_dir, snapshot=None):
     """
-    Copies images (which are used in presentation) into images directory.
+    Copies images (which are used in presentation) relative to the presentation folder like hovercraft copies the
+    images of the slides, so background images (bgimg) are found from the same paths as the other images.
 
     :param image_list:
-    :param images_dir_path:
-    :return:
+    :param pres_dir_path: presentation folder
+    :param rst_dir: directory of the presentation RST, image paths are relative to it
+    :param snapshot: FileSnapshot of the course directory or None
+    :return: paths of the copied images
     """
     settings.logger.info("Starting to copy images...")
     new_paths = []
-    for image in image_list:
-        if image:
-            image = Path(image).resolve()
-            source = image
-            destination = images_dir_path / image.name
-            new_paths.append(destination)
-            pm.copy_file(source, destination)
-    settings.logger.info("Images copied to {}".format(images_dir_path))
+    with profiling.stage("image_copy"):
+        for image in image_list:
+            if image:
+                source = (Path(rst_dir) / image).resolve()
+                destination = Path(os.path.normpath(str(Path(pres_dir_path) / image)))
+                new_paths.append(destination)
+                pm.copy_file(source, destination, snapshot)
+    settings.logger.info("Images copied for {}".format(pres_dir_path))
     return new_paths
 
 
@@ -146,7 +149,6 @@ def write_to_file(soup, file):
 
 def add_background_images(soup, html_file):
     add_bgimg_to_steps(soup)
-    write_to_file(soup, html_file)
 
 
 def hide_header(soup, html_file):
@@ -161,17 +163,6 @@ def hide_header(soup, html_file):
     if not header.style:
         header['style'] = style
 
-    write_to_file(soup, html_file)
-
-
-def make_columns(filename):
-    """
-    Creates columns if ::newcol option is used inside of point-of-interest in RST material.
-    :param filename:
-    :return:
-    """
-    column.create(filename)
-
 
 def hide_footer(soup, html_file):
     """
@@ -184,7 +175,6 @@ def hide_footer(soup, html_file):
     style = "visibility: hidden;"
     if not footer.style:
         footer['style'] = style
-    write_to_file(soup, html_file)
 
 
 def links_to_new_tabs(soup, html_file):
@@ -200,7 +190,6 @@ def links_to_new_tabs(soup, html_file):
         for l in links:
             if not l.target:
                 l['target'] = "_blank"
-        write_to_file(soup, html_file)
 
 
 # hovercraft directives. Same directives as in a-plus-rst-tools but done with docutils. In order to make column and
@@ -266,63 +255,151 @@ def add_bootstrap(soup, filename):
     except AttributeError as no_head:
         settings.logger.error("Error - Bootstrap link creation failed. Could not find head tag in {}".format(filename))
 
-    write_to_file(soup, filename)
 
+# HTML transforms which are applied to index.html after hovercraft has created it.
+# List of tuples (transform, enabled). transform is a function (soup, html_file) which changes the soup,
+# enabled is a function (BuildContext) which returns True if the transform is needed or None if the transform is
+# always used.
+html_transforms = []
 
-def run(filename, dictionary, build_dir, image_paths):
-    settings.logger.info("Bootstrap added successfully.")
 
+def register_transform(transform, enabled=None):
     """
-    Runs hovercraft command. Creates presentation in presentation folder.
+    Registers HTML transform. Transforms are applied in the order they are registered.
     """
+    html_transforms.append((transform, enabled))
 
-    try:
-        settings.logger.info("registering directives...")
-        directives.register_directive('row', Row)
-        directives.register_directive('column', Column)
-        settings.logger.info("Done")
 
-        pm.print_spacer()
-        settings.logger.info("Running hovercraft to create presentation...\n")
-        hovercraft_target_dir = get_folder_name(dictionary)
-        hovercraft_target_dir = str(Path(build_dir) / hovercraft_target_dir)
+register_transform(add_bootstrap)
+register_transform(add_background_images, lambda context: context.bg_img)
+register_transform(hide_header, lambda context: not context.header_visible)
+register_transform(hide_footer, lambda context: not context.footer_visible)
+register_transform(links_to_new_tabs)
 
-        command = ["--skip-help", filename, hovercraft_target_dir]
 
-        handle_images(hovercraft_target_dir, filename, image_paths)
-        hovercraft.main(command)
-        html_file = Path(hovercraft_target_dir) / "index.html"
-        if settings.columns:
-            make_columns(str(html_file))
+def post_process(html_file, context):
+    """
+    Parses html file once, applies all the registered transforms to it and writes it once.
+
+    :param context: BuildContext of the presentation
+    """
+    with profiling.stage("parse_html", "html_transform"):
         soup = make_soup(html_file)
-        add_bootstrap(soup, html_file)
-        if settings.bg_img:
-            add_background_images(soup, html_file)
-        if not settings.header_visible:
-            hide_header(soup, html_file)
-        if not settings.footer_visible:
-            hide_footer(soup, html_file)
-        links_to_new_tabs(soup, html_file)
-        settings.logger.info("Hovercraft presentation created.")
-        return hovercraft_target_dir
+    for transform, enabled in html_transforms:
+        if enabled is None or enabled(context):
+            with profiling.stage(transform.__name__, "html_transform"):
+                transform(soup, html_file)
+    with profiling.stage("write_html", "html_transform"):
+        write_to_file(soup, html_file)
+
+
+@contextmanager
+def hovercraft_errors():
+    """
+    Stops the build with an error message if running hovercraft fails.
+    """
+    try:
+        yield
     except FileNotFoundError as fnf_error:
         settings.logger.critical("\nCritical error occurred while running hovercraft."
                                  "\nFile not found.\nError message: {}".format(fnf_error))
         tb = traceback.format_exc()
         settings.logger.warning(tb)
-        pm.exiting()
+        pm.exiting(RenderError, "File not found while running hovercraft: {}".format(fnf_error))
 
     except OSError as error:
         settings.logger.critical("\nError occurred while running hovercraft.\nError message: {}".format(error))
         tb = traceback.format_exc()
         settings.logger.warning(tb)
-        pm.exiting()
+        pm.exiting(RenderError, "Running hovercraft failed: {}".format(error))
     except subprocess.CalledProcessError as e:
         settings.logger.critical("\nError occurred while running hovercraft.\nError: {}, \noutput: {} "
                                  "\nPossible cause: Header and/or footer images do not exist or image paths are not "
                                  "correct in presentation_config.yaml".format(e, e.output))
         tb = traceback.format_exc()
         settings.logger.warning(tb)
-        pm.exiting()
+        pm.exiting(RenderError, "Running hovercraft failed: {}".format(e))
+
+
+def target_folder(dictionary, build_dir):
+    """
+    :return: folder of the presentation, inside of the build directory
+    """
+    return str(Path(build_dir) / get_folder_name(dictionary, build_dir))
+
+
+def register_directives():
+    settings.logger.info("registering directives...")
+    directives.register_directive('row', Row)
+    directives.register_directive('column', Column)
+    directives.register_directive(settings.newcol_directive, column.NewColumn)
+    settings.logger.info("Done")
+
+
+def slide_cache_dir(dictionary, context):
+    """
+    :return: directory of the rendered slides if the presentation is rendered one slide at a time (html_per_slide in
+        presentation_config.yaml or --html-per-slide), otherwise None
+    """
+    if dictionary.get(settings.files).get(settings.html_per_slide, settings.default_html_per_slide):
+        return context.cache_path(settings.html_cache_dir)
+    return None
+
+
+def run_hovercraft(filename, hovercraft_target_dir, slide_cache=None, jobs=1):
+    """
+    Runs hovercraft command. Creates index.html in hovercraft_target_dir.
+
+    :param slide_cache: directory of the rendered slides. If given, slides are rendered one at a time, see html_slides.
+    :param jobs: number of processes rendering the slides which are not in slide_cache
+    :return: path to index.html
+    """
+    # rst2pdf may be parsing rst in another thread
+    with hovercraft_errors(), pdf_render.docutils_lock:
+        register_directives()
+        if slide_cache:
+            from . import html_slides
+            settings.logger.info("Rendering presentation one slide at a time...\n")
+            with profiling.stage("html_slides"):
+                return html_slides.generate(filename, hovercraft_target_dir, slide_cache, jobs)
+        settings.logger.info("Running hovercraft to create presentation...\n")
+        command = ["--skip-help", filename, hovercraft_target_dir]
+        with profiling.stage("hovercraft.main"):
+            hovercraft.main(command)
+    return Path(hovercraft_target_dir) / "index.html"
+
+
+def finish_html(html_file, context):
+    """
+    Applies the html transforms to index.html created by hovercraft.
+    """
+    with hovercraft_errors():
+        if context.stream_html:
+            with profiling.stage("stream_html", "html_transform"):
+                stream_html.rewrite(html_file, context)
+        else:
+            post_process(html_file, context)
+        settings.logger.info("Hovercraft presentation created.")
+
+
+def run(filename, dictionary, image_paths, context, snapshot=None, target_dir=None, jobs=1):
+    settings.logger.info("Bootstrap added successfully.")
+
+    """
+    Runs hovercraft command. Creates presentation in presentation folder.
+
+    :param context: BuildContext, presentation folder is inside of its build directory
+    :param target_dir: folder of the presentation, selected from the configuration if not given
+    :param jobs: number of processes rendering slides, see run_hovercraft
+    """
+
+    try:
+        pm.print_spacer()
+        with hovercraft_errors():
+            hovercraft_target_dir = str(target_dir) if target_dir else target_folder(dictionary, context.build_dir)
+            handle_images(hovercraft_target_dir, filename, image_paths, snapshot)
+        finish_html(run_hovercraft(filename, hovercraft_target_dir, slide_cache_dir(dictionary, context), jobs),
+                    context)
+        return hovercraft_target_dir
     finally:
         pm.print_spacer()
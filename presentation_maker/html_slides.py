@@ -0,0 +1,424 @@
+"""
+Html presentation rendered one slide at a time (html_per_slide in presentation_config.yaml or --html-per-slide).
+
+hovercraft renders the whole presentation RST with docutils on every build, so changing one slide renders all of
+them again. Here the presentation RST is split at the transitions written before each slide and each slide is
+rendered alone with docutils, the slide transforms of hovercraft (SlideMaker) and the XSLT template. Html of the
+steps is saved to the build directory (_build/.cache/html). Key of a slide is a hash of its RST and the template, so
+only the slides which changed are rendered again. Slides which are not in the cache are rendered in parallel
+processes if jobs is more than 1.
+
+index.html is assembled from the steps of the slides like hovercraft would create it:
+
+    positions: data-x, data-y, ... of the steps are calculated from the steps of all the slides with position_slides
+        of hovercraft, so relative positions (e.g. data-x: r4000 in other_slides) work like before
+    numbers and ids: steps are numbered again and ids which are used in an earlier slide are changed to new ids
+        (id1, id2, ...) like docutils does in the whole document
+    frame: html head, header and footer are rendered from the lines before the first slide
+
+Each slide is rendered after section titles with the title styles of the earlier slides, so the sections of the
+slide have the same levels as in the whole document. Slide is a document of its own: references, footnote numbers
+and substitutions do not work across slides.
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+import docutils
+import hovercraft
+from hovercraft.generate import rst2html, copy_resource, ResourceResolver
+from hovercraft.parse import rst2xml, SlideMaker
+from hovercraft.position import position_slides
+from hovercraft.template import Template, CSS_RESOURCE, DIRECTORY_RESOURCE, JS_RESOURCE, JS_POSITION_HEADER, \
+    OTHER_RESOURCE
+from lxml import etree, html
+
+from . import build_manifest
+from . import presentation_maker as pm
+from . import poi_cache
+from . import profiling
+from . import settings
+
+# change this if the content of the rendered slides changes
+cache_version = 1
+xhtml = "{http://www.w3.org/1999/xhtml}"
+# section title adornment, a punctuation character repeated (docutils nonalphanum7bit)
+adornment = re.compile(r"^([!-/:-@\[-`{-~])\1*$")
+# ids docutils creates when a name can not be used as an id
+auto_id = re.compile(r"^id\d+$")
+# marks the paragraph before the title styles, the slide after the rendered slide and the slide of the frame
+marker = "presentation_maker"
+impress_div = re.compile(br'(<div id="impress"[^>]*>)(</div>)')
+marker_step = re.compile(br'(<div id="impress"[^>]*>)<div [^>]*><p>' + marker.encode("ascii") + br'</p></div>(</div>)')
+html_tag = re.compile(r"<[a-zA-Z][^>]*>")
+id_attribute = re.compile(r'(\sid=")([^"]*)"|(\shref="#)([^"]*)"')
+# same as in hovercraft.generate
+css_url = re.compile(br"""url\(['"]?(.*?)['"]?[\)\?\#]""")
+# {xsl: XSLT}, compiled templates of the process
+transformers = {}
+
+
+def title_styles(text, styles=()):
+    """
+    Finds the styles of the section titles in the order docutils sees them. Style is the adornment character, or
+    the character twice if the title has an overline.
+
+    :param styles: styles found before text
+    :return: list of styles
+    """
+    styles = list(styles)
+    lines = text.splitlines()
+    for index in range(1, len(lines)):
+        line = lines[index].rstrip()
+        title = lines[index - 1].rstrip()
+        if not adornment.match(line) or not title.strip() or adornment.match(title.strip()):
+            continue
+        if index >= 2 and lines[index - 2].rstrip() == line and (index == 2 or not lines[index - 3].strip()):
+            style = line[0] * 2
+        elif not title[0].isspace() and (index == 1 or not lines[index - 2].strip()) and \
+                (len(line) >= 4 or len(line) >= len(title)):
+            style = line[0]
+        else:
+            continue
+        if style not in styles:
+            styles.append(style)
+    return styles
+
+
+def slide_document(slide, styles, has_next):
+    """
+    Creates the RST document of one slide. Slide is written after a section title of each style, so docutils gives
+    the titles of the slide the same levels as in the whole presentation. Slides other than the last one are followed
+    by a transition and a paragraph like in the presentation, because docutils checks the transition at the end.
+
+    :param styles: title styles of the presentation before the slide
+    :param has_next: False if the slide is the last slide of the presentation
+    :return: document as a string
+    """
+    # paragraph first, so the first title is not made the title of the document
+    lines = [marker, ""]
+    for number, style in enumerate(styles, 1):
+        title = "{}-title-{}".format(marker, number)
+        if len(style) == 2:
+            lines.append(style[0] * len(title))
+        lines.extend([title, style[0] * len(title), ""])
+    lines.append("----")
+    document = "\n".join(lines) + "\n" + slide
+    if has_next:
+        document += "----\n\n{}\n".format(marker)
+    return document
+
+
+def transformer(xsl):
+    """
+    :return: XSLT of the template, compiled once per process
+    """
+    if xsl not in transformers:
+        parser = etree.XMLParser()
+        parser.resolvers.add(ResourceResolver())
+        transformers[xsl] = etree.XSLT(etree.fromstring(xsl, parser))
+    return transformers[xsl]
+
+
+def split_step(div):
+    """
+    :return: tuple (attributes of the step as a list of [name, value], html inside of the step)
+    """
+    step = html.tostring(div, with_tail=False)
+    # ">" is escaped in the attribute values
+    return [list(item) for item in div.items()], step[step.index(b">") + 1:-len(b"</div>")].decode("ascii")
+
+
+def render_slide(job):
+    """
+    Renders one slide. Run in a worker process if jobs is more than 1.
+
+    :param job: tuple (slide document, path of the presentation RST, template xsl, True if the document has the
+        title styles before the slide, True if the document has a slide after the slide)
+    :return: rendered slide as a dictionary: steps ([attributes, html] of each step), ids created by docutils in the
+        steps, img and source files of the steps and True if the slide needs MathJax
+    """
+    document, rst_file, xsl, has_styles, has_next = job
+    xml, _ = rst2xml(document.encode("utf-8"), rst_file)
+    slide_maker = SlideMaker(etree.fromstring(xml))
+    tree = slide_maker.walk()
+    steps = tree.findall("step")
+    # steps of the title styles and the next slide
+    extra = (steps[:1] if has_styles else []) + (steps[-1:] if has_next else [])
+    for step in extra:
+        tree.remove(step)
+    result = transformer(xsl)(tree)
+    impress = result.getroot().find(".//{}div[@id='impress']".format(xhtml))
+    return {
+        "steps": [split_step(div) for div in impress],
+        # ids of the steps are set with the id field and docutils does not change them
+        "ids": [element.get("id") for div in impress for element in div.iterdescendants() if element.get("id")],
+        "files": [element.get("src") for element in impress.iter(xhtml + "img", xhtml + "source")
+                  if element.get("src")],
+        "mathjax": slide_maker.need_mathjax,
+    }
+
+
+def template_key(template_info, rst_file):
+    """
+    :return: key of the settings which affect all the slides: template, code of presentation_maker (directives),
+        versions of hovercraft and docutils and the directory of the presentation RST, which relative paths are
+        relative to
+    """
+    digest = hashlib.sha256(template_info.xsl)
+    # reST.xsl is imported by the templates of hovercraft
+    rest_xsl = build_manifest.hash_file(Path(hovercraft.__file__).parent / "templates" / "reST.xsl")
+    digest.update((rest_xsl or "").encode("ascii"))
+    code = build_manifest.tool_version(settings.code_dir)["code"]
+    return json.dumps([cache_version, digest.hexdigest(), code, hovercraft.__version__, docutils.__version__,
+                       str(Path(rst_file).resolve().parent)])
+
+
+def slide_key(document, config_key):
+    return hashlib.sha256((config_key + document).encode("utf-8")).hexdigest()
+
+
+def load_slide(path):
+    """
+    :return: rendered slide from the cache or None if it is not in the cache
+    """
+    try:
+        with open(str(path), encoding="utf-8") as reader:
+            slide = json.load(reader)
+        # marks the slide as recently used
+        os.utime(str(path))
+    except (OSError, ValueError):
+        return None
+    return slide
+
+
+def save_slide(path, slide):
+    try:
+        temporary = path.with_name(path.name + ".tmp")
+        with open(str(temporary), "w", encoding="utf-8") as writer:
+            json.dump(slide, writer)
+        os.replace(str(temporary), str(path))
+    except OSError as e:
+        settings.logger.warning("Could not write slide cache {}. Error: {}".format(path, e))
+
+
+def render_slides(slides, rst_file, template_info, cache_dir, jobs=1):
+    """
+    Renders the slides which are not in the cache.
+
+    :param slides: texts of the slides, see presentation_maker.split_slides
+    :param jobs: number of processes rendering slides
+    :return: list of rendered slides, see render_slide
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    config_key = template_key(template_info, rst_file)
+
+    jobs_of_slides = []
+    styles = []
+    for index, slide in enumerate(slides):
+        has_next = index < len(slides) - 1
+        jobs_of_slides.append((slide_document(slide, styles, has_next), str(rst_file), template_info.xsl,
+                               bool(styles), has_next))
+        styles = title_styles(slide, styles)
+    paths = [cache_dir / (slide_key(job[0], config_key) + ".json") for job in jobs_of_slides]
+    rendered = [load_slide(path) for path in paths]
+    missing = [index for index, slide in enumerate(rendered) if slide is None]
+    settings.logger.info("Rendering {} of {} slides, {} taken from the cache.".format(
+        len(missing), len(slides), len(slides) - len(missing)))
+    profiling.count("html_slides", len(slides))
+    profiling.count("html_slide_cache_hits", len(slides) - len(missing))
+
+    if jobs > 1 and len(missing) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(missing) // (jobs * 4))
+        # caller holds docutils_lock, so workers do not get a copy of a lock another thread holds
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = profiling.results(executor.map(profiling.worker(render_slide),
+                                                     [jobs_of_slides[i] for i in missing], chunksize=chunksize))
+            for i in missing:
+                rendered[i] = next(results)
+    else:
+        for i in missing:
+            with profiling.stage("render_slide", "html_slide"):
+                rendered[i] = render_slide(jobs_of_slides[i])
+
+    for i in missing:
+        save_slide(paths[i], rendered[i])
+    poi_cache.evict_files(cache_dir, ".json", settings.html_cache_max_size)
+    return rendered
+
+
+def add_mathjax(template_info, mathjax):
+    """
+    Adds MathJax to the resources of the template like hovercraft does when the presentation has math.
+
+    :param mathjax: url of MathJax or directory of a local copy
+    """
+    if mathjax.startswith("http"):
+        template_info.add_resource(None, JS_RESOURCE, target=mathjax, extra_info=JS_POSITION_HEADER)
+    else:
+        template_info.add_resource(mathjax, DIRECTORY_RESOURCE, target="mathjax")
+        template_info.add_resource(None, JS_RESOURCE, target="mathjax/MathJax.js?config=TeX-MML-AM_CHTML",
+                                   extra_info=JS_POSITION_HEADER)
+
+
+def render_frame(preamble, rst_file, template_info, mathjax):
+    """
+    Renders index.html without the slides from the lines before the first slide (fields of the presentation, header
+    and footer). Frame is written next to the presentation RST, so relative paths in it work. One marker slide is
+    rendered, because hovercraft makes the whole document a step if there are no transitions.
+
+    :param mathjax: url or directory of MathJax passed to hovercraft
+    :return: html of the frame as bytes
+    """
+    frame_file = Path(rst_file).parent / settings.html_frame_name
+    with open(str(frame_file), "w") as writer:
+        writer.write(preamble + "\n----\n\n{}\n".format(marker))
+    try:
+        frame, _ = rst2html(str(frame_file), template_info, skip_help=True, mathjax=mathjax)
+    finally:
+        frame_file.unlink()
+    return marker_step.sub(br"\1\2", frame)
+
+
+def rename_ids(ids, used, counter):
+    """
+    Changes ids which are created by docutils or used in an earlier slide to the next free id1, id2, ... like docutils
+    does in the whole document.
+
+    :param ids: ids of the slide
+    :param used: ids of the earlier slides, ids of the slide are added to it
+    :param counter: list with the number of the next id, increased when an id is created
+    :return: {id: new id} of the changed ids
+    """
+    renamed = {}
+    for name in ids:
+        new = name
+        if auto_id.match(name) or name in used:
+            new = None
+            while not new or new in used:
+                new = "id{}".format(counter[0])
+                counter[0] += 1
+        used.add(new)
+        if new != name:
+            renamed[name] = new
+    return renamed
+
+
+def replace_ids(step, renamed):
+    """
+    :return: html of the step with the renamed ids in id attributes and in the links to them
+    """
+    def replace_id(match):
+        prefix, name = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        return '{}{}"'.format(prefix, renamed.get(name, name))
+
+    return html_tag.sub(lambda tag: id_attribute.sub(replace_id, tag.group(0)), step)
+
+
+def start_tag(attributes):
+    """
+    :return: start tag of a step div in the format of lxml
+    """
+    return html.tostring(etree.Element("div", OrderedDict(attributes)))[:-len(b"</div>")]
+
+
+def assemble(frame, slides):
+    """
+    Adds the steps of the rendered slides to the frame. Steps are numbered, ids used in more than one slide are
+    changed and positions of the steps are calculated from the fields of all the steps.
+
+    :param frame: html of the frame, see render_frame
+    :param slides: rendered slides, see render_slide
+    :return: index.html as bytes
+    """
+    tree = etree.Element("document")
+    bodies = []
+    used = set()
+    counter = [1]
+    for slide in slides:
+        renamed = rename_ids(slide["ids"], used, counter)
+        for attributes, body in slide["steps"]:
+            step = etree.SubElement(tree, "step")
+            for name, value in attributes:
+                step.set(name, value)
+            step.set("step", str(len(bodies)))
+            bodies.append(replace_ids(body, renamed) if renamed else body)
+    position_slides(tree)
+
+    match = impress_div.search(frame)
+    parts = [frame[:match.end(1)]]
+    for step, body in zip(tree, bodies):
+        parts.extend([start_tag(step.items()), body.encode("ascii"), b"</div>"])
+    parts.append(frame[match.start(2):])
+    return b"".join(parts)
+
+
+def copy_files(html_files, sourcedir, targetdir, template_info):
+    """
+    Copies the resources of the template, img and source files of the steps and files referenced by url() in the
+    css files to the presentation folder like hovercraft does.
+
+    :param html_files: src of the img and source tags
+    """
+    # generator, files are copied when it is consumed
+    list(template_info.copy_resources(targetdir))
+    for filename in html_files:
+        copy_resource(filename, sourcedir, targetdir)
+    for resource in list(template_info.resources):
+        if resource.resource_type != CSS_RESOURCE:
+            continue
+        # path in css is relative to the css file
+        css_base = template_info.template_root if resource.is_in_template else sourcedir
+        css_sourcedir = os.path.dirname(os.path.join(css_base, resource.filepath))
+        css_targetdir = os.path.dirname(os.path.join(targetdir, resource.final_path()))
+        uris = [uri.decode() for uri in css_url.findall(template_info.read_data(resource))]
+        if resource.is_in_template and template_info.builtin_template:
+            for filename in uris:
+                template_info.add_resource(filename, OTHER_RESOURCE, target=css_targetdir, is_in_template=True)
+        else:
+            for filename in uris:
+                copy_resource(filename, css_sourcedir, css_targetdir)
+
+
+def generate(rst_file, target_dir, cache_dir, jobs=1):
+    """
+    Creates index.html of the presentation RST from the rendered slides. Same options are used as in
+    hovercraft --skip-help.
+
+    :param cache_dir: directory of the rendered slides
+    :param jobs: number of processes rendering slides
+    :return: path to index.html
+    """
+    args = hovercraft.create_arg_parser().parse_args(["--skip-help", str(rst_file), str(target_dir)])
+    template_info = Template(args.template)
+    with open(str(rst_file)) as reader:
+        preamble, slides = pm.split_slides(reader.read())
+
+    with profiling.stage("render_slides", "html_slide"):
+        rendered = render_slides(slides, rst_file, template_info, cache_dir, jobs)
+    with profiling.stage("assemble_slides", "html_slide"):
+        mathjax = args.mathjax
+        if any(slide["mathjax"] for slide in rendered):
+            add_mathjax(template_info, args.mathjax)
+            # frame does not add it again
+            mathjax = False
+        frame = render_frame(preamble, rst_file, template_info, mathjax)
+        htmldata = assemble(frame, rendered)
+
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    html_file = target_dir / "index.html"
+    with open(str(html_file), "wb") as writer:
+        writer.write(htmldata)
+    html_files = [filename for slide in rendered for filename in slide["files"]]
+    html_files.extend(element.get("src") for element in html.fromstring(frame).iter("img", "source")
+                      if element.get("src"))
+    copy_files(dict.fromkeys(html_files), str(Path(rst_file).resolve().parent), str(target_dir), template_info)
+    return html_file
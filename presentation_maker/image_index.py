@@ -0,0 +1,80 @@
+"""
+Image index for finding course images by name.
+
+Index is built once per run from the list of image paths (see create_img_path_list in presentation_maker.py).
+Image names are normalized so that the suffix is case-insensitive: 'photo.PNG' and 'photo.png' are the same image.
+Lookups are dictionary lookups, so the size of the course does not affect the time needed to find one image.
+"""
+
+import hashlib
+from pathlib import Path
+
+from . import settings
+
+
+def normalize_name(name):
+    """
+    Normalizes image name. Suffix is changed to lowercase, rest of the name is kept as it is.
+
+    :return: normalized name e.g. 'Photo.png' from 'Photo.PNG'
+    """
+    path = Path(name)
+    return path.stem + path.suffix.lower()
+
+
+class ImageIndex:
+    """
+    Maps normalized image names to image paths.
+
+    If the same name exists in multiple folders, the first path in the image path list is used and the
+    ambiguity is reported once per name.
+    """
+
+    def __init__(self, image_paths):
+        # {normalized name: [path, path, ...]}
+        self.names = {}
+        # {name without suffix: [path, path, ...]}, used if the suffix in the RST file differs from the file system
+        self.stems = {}
+        self.reported = set()
+        for p in image_paths:
+            p = Path(p)
+            self.names.setdefault(normalize_name(p.name), []).append(p)
+            self.stems.setdefault(p.stem, []).append(p)
+        self.version = self.create_version()
+
+    def __len__(self):
+        return sum(len(paths) for paths in self.names.values())
+
+    def create_version(self):
+        """
+        Creates version string for the index. Version changes if any image is added, removed or moved.
+
+        :return: hex digest of the indexed paths.
+        """
+        digest = hashlib.sha1()
+        for name in sorted(self.names):
+            for p in self.names[name]:
+                digest.update(str(p).encode("utf-8", "surrogateescape"))
+                digest.update(b"\0")
+        return digest.hexdigest()
+
+    def find(self, image):
+        """
+        Finds path to the image. image is the image path written in the RST file, so only the name of the image
+        is used.
+
+        :return: path to the image or None if image was not found.
+        """
+        image = Path(image.strip())
+        candidates = self.names.get(normalize_name(image.name))
+        if not candidates:
+            # same name but different suffix, e.g. image.jpg in the RST-file and image.png in the file system
+            candidates = self.stems.get(image.stem)
+        if not candidates:
+            return None
+        if len(candidates) > 1 and image.name not in self.reported:
+            self.reported.add(image.name)
+            settings.logger.warning('Image name "{}" is ambiguous. Found {} images with the same name:\n{}\n'
+                                    'Using {}'.format(image.name, len(candidates),
+                                                      "\n".join(str(c) for c in candidates), candidates[0]))
+        return candidates[0]
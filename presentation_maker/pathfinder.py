@@ -8,6 +8,7 @@ from pathlib import Path
 
 from . import presentation_maker as pm
 from . import settings
+from .errors import CourseError
 
 
 def filter_rounds(rounds, indexes):
@@ -82,11 +83,11 @@ def read_index_rst(path_to_index):
         settings.logger.error("Error - No such file: {} \n".format(str(path)))
         settings.logger.info("Make sure you are running this from A+ course directory where index.rst is located.")
         settings.logger.info("Are you trying to use unsupported languages?\n".format(str(path)))
-        pm.exiting()
+        pm.exiting(CourseError, "No such file: {}".format(path))
     except PermissionError as pe:
         settings.logger.error("Permission error while handling {}\n"
                               "Error: {}".format(path, pe))
-        pm.exiting()
+        pm.exiting(CourseError, "Permission error while handling {}".format(path))
     return indexes
 
 
@@ -116,9 +117,9 @@ def build_paths(index_path, paths, file):
     return filestructure
 
 
-def remake_paths(index_path, paths, language):
+def remake_paths(index_path, paths, language, snapshot=None, verbose=False):
     """
-    Creates paths for each .rst file.
+    Creates paths for each .rst file. Existence of the files is checked from the snapshot if it is given.
 
     :return: list of paths to each .RST file.
     """
@@ -140,19 +141,19 @@ def remake_paths(index_path, paths, language):
             #         # file do not have language suffix and if it does it will not make another
             #         f = file + "_" + language + ".rst"
             #         p = Path(index_path / folder / f)
-            if p.exists():
+            if (snapshot.exists(p) if snapshot else p.exists()):
                 # some files may not exist even if they are in the index
                 # or files have naming discrepancy.
                 path_list.append(str(p))
             else:
-                if settings.verbose:
+                if verbose:
                     settings.logger.info("File {} not found, skipping...".format(file))
     return path_list
 
 
-def create_paths(rounds, course_path, language):
+def create_paths(rounds, course_path, language, snapshot=None, verbose=False):
     """
-    Main function. Calls all the other functions in pathfinder.
+    Main function. Calls all the other functions in pathfinder. Index files are looked up from course_path.
 
     :return: list of paths to each .RST file.
     """
@@ -160,7 +161,7 @@ def create_paths(rounds, course_path, language):
     # If index_language.rst exist then it will be used
 
     file = "index_" + language + ".rst"
-    if not Path(file).exists():
+    if not (Path(course_path) / file).exists():
         file = "index.rst"
 
     index_path = Path(course_path) / file
@@ -168,5 +169,5 @@ def create_paths(rounds, course_path, language):
     paths = read_index_rst(index_path)
     paths = filter_rounds(rounds, paths)
     structure = build_paths(index_path, paths, file)
-    path_list = remake_paths(index_path, structure, language)
+    path_list = remake_paths(index_path, structure, language, snapshot, verbose)
     return path_list
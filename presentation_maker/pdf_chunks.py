@@ -0,0 +1,164 @@
+"""
+rst2pdf in chunks. converted_rst.rst is split at the slide titles into chunks of settings.pdf_chunk_size slides.
+Each chunk is rendered to its own pdf and the pdf files are merged in order.
+
+Rendered chunks are saved to the build directory (_build/.cache/rst2pdf). Key of a chunk is a hash of the chunk,
+light.style, the rst2pdf options and the images used in the chunk, so only the chunks which changed are rendered
+again. Chunks which are not in the cache are rendered in parallel processes if jobs is more than 1.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+from . import create_pdf
+from . import pdf_render
+from . import pdf_shards
+from . import poi_cache
+from . import profiling
+from . import settings
+
+# change this if rendering of the chunks changes
+cache_version = 1
+# slide title underline in converted rst
+title_underline = re.compile(r"^={2,}$")
+image_directive = re.compile(r"^\s*\.\. (?:image|figure)::\s*(\S+)")
+
+
+def split_chunks(text, size):
+    """
+    Splits rst2pdf rst into chunks of slides. Lines before the first slide (main title) belong to the first chunk.
+    Chunk is never a single slide, since docutils would make a lone section the title of the document. So the last
+    slide is added to the previous chunk if it would be alone.
+
+    :param text: contents of converted_rst.rst
+    :param size: number of slides in a chunk
+    :return: list of chunks as strings
+    """
+    size = max(2, size)
+    lines = text.splitlines(True)
+    starts = [index - 1 for index, line in enumerate(lines)
+              if index > 0 and title_underline.match(line.rstrip("\n")) and lines[index - 1].strip()]
+    if len(starts) <= size:
+        return [text]
+    boundaries = starts[size::size]
+    if len(starts) % size == 1:
+        boundaries = boundaries[:-1]
+    chunks = []
+    start = 0
+    for boundary in boundaries + [len(lines)]:
+        chunks.append("".join(lines[start:boundary]))
+        start = boundary
+    return chunks
+
+
+def style_key(code_dir):
+    """
+    :return: key of the settings which affect all the chunks
+    """
+    with open(str(Path(code_dir) / "light.style"), "rb") as reader:
+        style = hashlib.sha256(reader.read()).hexdigest()
+    return json.dumps([cache_version, style, create_pdf.rst2pdf_options(code_dir)])
+
+
+def chunk_key(chunk, config_key, base_dir):
+    """
+    :return: hash of the chunk, config key and modification times and sizes of the images in the chunk
+    """
+    digest = hashlib.sha256(config_key.encode("utf-8"))
+    digest.update(chunk.encode("utf-8"))
+    for line in chunk.splitlines():
+        match = image_directive.match(line)
+        if match:
+            try:
+                st = os.stat(str(Path(base_dir) / match.group(1)))
+                digest.update("{}:{}:{}".format(match.group(1), st.st_mtime_ns, st.st_size).encode("utf-8"))
+            except OSError:
+                digest.update(match.group(1).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def render_chunk(job, parallel=False):
+    """
+    Renders one chunk. Run in a worker process if there are many chunks to render.
+
+    :param job: tuple (rst file, pdf file, code_dir)
+    :param parallel: True if other stages of the build run at the same time, see create_pdf.create_with_rst2pdf
+    :return: True if the pdf file was created
+    """
+    rst_file, pdf_file, code_dir = job
+    create_pdf.create_with_rst2pdf(str(rst_file), str(pdf_file), code_dir, parallel)
+    return Path(pdf_file).exists()
+
+
+def create(converted_rst, output, code_dir, cache_dir, chunk_size, jobs=1, parallel=False):
+    """
+    Creates pdf from rst2pdf rst by rendering the chunks which are not in the cache.
+
+    :param converted_rst: rst2pdf compatible rst file
+    :param output: path of the pdf file
+    :param cache_dir: directory of the rendered chunks
+    :param chunk_size: number of slides in a chunk
+    :param jobs: number of processes rendering chunks
+    :param parallel: True if other stages of the build run at the same time, see create_pdf.create_with_rst2pdf
+    :return: True if the pdf was created
+    """
+    converted_rst = Path(converted_rst).resolve()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(str(converted_rst)) as reader:
+        chunks = split_chunks(reader.read(), chunk_size)
+    config_key = style_key(code_dir)
+
+    pdf_files = []
+    missing = []
+    for index, chunk in enumerate(chunks):
+        pdf_file = cache_dir / (chunk_key(chunk, config_key, converted_rst.parent) + ".pdf")
+        pdf_files.append(pdf_file)
+        if pdf_file.exists():
+            # marks the chunk as recently used
+            os.utime(str(pdf_file))
+            continue
+        # chunks are written next to converted_rst.rst, so relative image paths work
+        rst_file = converted_rst.parent / settings.pdf_chunk_name.format(index)
+        with open(str(rst_file), "w") as writer:
+            writer.write(chunk)
+        missing.append((rst_file, pdf_file.with_name(pdf_file.stem + ".tmp.pdf"), code_dir))
+    settings.logger.info("Rendering {} of {} pdf chunks, {} taken from the cache.".format(
+        len(missing), len(chunks), len(chunks) - len(missing)))
+    profiling.count("pdf_chunks", len(chunks))
+    profiling.count("pdf_chunk_cache_hits", len(chunks) - len(missing))
+
+    try:
+        if jobs > 1 and len(missing) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                # workers are forked when the chunks are submitted. Holding docutils_lock keeps hovercraft from
+                # running in another thread at that moment, so workers do not get a copy of a lock someone holds.
+                with pdf_render.docutils_lock:
+                    results = executor.map(profiling.worker(render_chunk), missing)
+                created = list(profiling.results(results))
+        else:
+            created = [render_chunk(job, parallel) for job in missing]
+        for (rst_file, temporary, _), ok in zip(missing, created):
+            if ok:
+                os.replace(str(temporary), str(temporary.with_name(temporary.name[:-len(".tmp.pdf")] + ".pdf")))
+    finally:
+        for rst_file, _, _ in missing:
+            rst_file.unlink()
+
+    if not all(created):
+        settings.logger.critical("PDF creation failed. {} of {} chunks were not rendered.".format(
+            created.count(False), len(missing)))
+        return False
+    if len(pdf_files) == 1:
+        shutil.copyfile(str(pdf_files[0]), str(output))
+        ok = True
+    else:
+        ok = pdf_shards.merge_pdfs(pdf_files, output)
+    poi_cache.evict_files(cache_dir, ".pdf", settings.rst2pdf_cache_max_size)
+    return ok
@@ -0,0 +1,155 @@
+"""
+Runs rst2pdf in the same process instead of starting the rst2pdf command.
+
+Starting rst2pdf imports reportlab, finds the fonts and parses light.style every time. Here rst2pdf is imported once
+and parsed stylesheets (which have the fonts registered) are kept for the next presentations in the same process,
+e.g. other languages of the course or chunks rendered by the same worker process. Errors of rst2pdf are raised
+to the caller.
+
+docutils keeps directives and roles in process wide registries and rst2pdf replaces some of them, e.g. code and
+code-block. Directives and roles of rst2pdf are used only while rst2pdf runs, and docutils_lock keeps hovercraft
+from parsing rst at the same time. So in the same thread hovercraft and rst2pdf do not run at the same time. When
+the stages of the build run in parallel, render_in_worker renders the pdf in a warm worker process instead, so the
+html presentation is created while rst2pdf runs. Chunks (pdf_chunks) rendered in worker processes run at the same
+time too.
+"""
+
+import importlib.util
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import profiling
+from . import settings
+
+docutils_lock = threading.RLock()
+# {(stylesheets, font path, style path, dpi): rst2pdf StyleSheet}
+stylesheets = {}
+# directives and roles which rst2pdf has registered, ({name: directive}, {name: role})
+rst2pdf_registry = ({}, {})
+renderer_class = None
+# one worker process which renders pdf while the other stages run in this process, see render_in_worker
+worker_pool = None
+
+
+def available():
+    """
+    :return: True if rst2pdf can be imported
+    """
+    return importlib.util.find_spec("rst2pdf") is not None
+
+
+def docutils_registry():
+    """
+    :return: copies of the docutils registries, ({name: directive}, {name: role})
+    """
+    from docutils.parsers.rst import directives, roles
+    return dict(directives._directives), dict(roles._roles)
+
+
+def set_docutils_registry(registry):
+    from docutils.parsers.rst import directives, roles
+    for current, saved in zip((directives._directives, roles._roles), registry):
+        current.clear()
+        current.update(saved)
+
+
+@contextmanager
+def rst2pdf_docutils():
+    """
+    Only the standard directives and roles and the ones of rst2pdf are registered inside of this block, like when
+    rst2pdf command is run. Registries are restored afterwards and the changes rst2pdf made are saved for the next
+    block.
+    """
+    with docutils_lock:
+        saved = docutils_registry()
+        set_docutils_registry(rst2pdf_registry)
+        try:
+            yield
+        finally:
+            for current, registered in zip(docutils_registry(), rst2pdf_registry):
+                registered.update(current)
+            set_docutils_registry(saved)
+
+
+def warm_renderer_class():
+    """
+    :return: subclass of rst2pdf RstToPdf which parses each combination of stylesheets once in the process
+    """
+    global renderer_class
+    if renderer_class is None:
+        from rst2pdf.createpdf import RstToPdf
+
+        class WarmRstToPdf(RstToPdf):
+            def loadStyles(self, styleSheets=None):
+                key = (tuple(styleSheets or ()), tuple(self.font_path), tuple(self.style_path), self.def_dpi)
+                if key not in stylesheets:
+                    super().loadStyles(styleSheets)
+                    stylesheets[key] = self.styles
+                    settings.logger.info("rst2pdf stylesheets loaded: {}".format(", ".join(key[0])))
+                self.styles = stylesheets[key]
+
+        renderer_class = WarmRstToPdf
+    return renderer_class
+
+
+def render(rst_file, output, style_sheets, break_level):
+    """
+    Creates pdf from rst2pdf compatible rst file.
+
+    :param rst_file: rst file, images are relative to its directory
+    :param output: path of the pdf file
+    :param style_sheets: list of rst2pdf stylesheets, e.g. ["freetype-serif", "light.style"]
+    :param break_level: maximum section level that starts a new page (rst2pdf -b)
+    """
+    from docutils.core import publish_doctree
+
+    rst_file = Path(rst_file).resolve()
+    with open(str(rst_file), encoding="utf-8") as reader:
+        text = reader.read()
+    with rst2pdf_docutils():
+        # imports rst2pdf (registers its directives) and loads the stylesheets if they have not been loaded yet
+        # default font_path list of RstToPdf is shared and rst2pdf adds the found font directories to it
+        renderer = warm_renderer_class()(stylesheets=list(style_sheets), breaklevel=break_level, font_path=[],
+                                         style_path=[], basedir=str(rst_file.parent))
+        overrides = {'strip_elements_with_classes': renderer.strip_elements_with_classes}
+        if renderer.language:
+            overrides['language_code'] = renderer.docutils_language
+        doctree = publish_doctree(text, source_path=str(rst_file), settings_overrides=overrides)
+        # cover page, headers and footers are parsed while the pages are created
+        renderer.createPdf(doctree=doctree, output=str(output))
+
+
+def warm_up_worker():
+    """
+    Initializer of the renderer process. Imports rst2pdf and registers its directives before the first pdf.
+    """
+    with rst2pdf_docutils():
+        warm_renderer_class()
+
+
+def render_in_worker(rst_file, output, style_sheets, break_level):
+    """
+    Creates pdf like render, but in a worker process which is kept for the next pdf files of this process. So
+    docutils_lock is held only while the worker is started and the stages of the build running in this process
+    (e.g. hovercraft) are not waiting for rst2pdf.
+
+    :raises Exception: errors of rst2pdf in the worker, BrokenProcessPool if the worker died
+    """
+    global worker_pool
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    with docutils_lock:
+        if worker_pool is None:
+            worker_pool = ProcessPoolExecutor(max_workers=1, initializer=warm_up_worker)
+        # worker is forked when the first pdf is submitted. Holding docutils_lock keeps hovercraft from running in
+        # another thread at that moment, so the worker does not get a copy of a lock someone holds.
+        future = worker_pool.submit(profiling.worker(render), str(rst_file), str(output), list(style_sheets),
+                                    break_level)
+    try:
+        return next(profiling.results([future.result()]))
+    except BrokenProcessPool:
+        # worker is started again for the next pdf
+        worker_pool = None
+        raise
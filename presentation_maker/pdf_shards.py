@@ -0,0 +1,165 @@
+"""
+Sharded deck2pdf. deck2pdf renders the presentation one step after another, which takes a long time with large
+presentations. Here the presentation is split into step ranges (shards) which are rendered at the same time:
+
+    1) index.html is copied to index_shard_01.html, index_shard_02.html, ... next to it. Each copy has only its own
+       steps, so the copies use the same css, js and images as the presentation.
+    2) Each shard is rendered by its own deck2pdf process. If xvfb-run is available, each process gets its own
+       virtual display. Process is killed if it takes longer than the timeout and the shard is rendered again.
+    3) PDFs of the shards are merged in order into the final pdf with pypdf or pdfunite.
+"""
+
+import copy
+import os
+import shutil
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import profiling
+from . import settings
+
+
+def shard_ranges(count, shards):
+    """
+    Splits steps into shards of about the same size.
+
+    :param count: number of steps
+    :param shards: number of shards, limited to the number of steps
+    :return: list of (start, end) ranges
+    """
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    ranges = []
+    start = 0
+    for index in range(shards):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def split_deck(html_file, shards):
+    """
+    Writes the shards of the presentation next to index.html.
+
+    :return: list of paths to the shard html files
+    """
+    from bs4 import BeautifulSoup as bs
+
+    html_file = Path(html_file)
+    with open(str(html_file)) as file:
+        soup = bs(file.read(), 'html.parser')
+    count = len(soup.find_all(attrs={'class': 'step'}))
+    shard_files = []
+    for index, (start, end) in enumerate(shard_ranges(count, shards), 1):
+        shard = copy.copy(soup)
+        for position, step in enumerate(shard.find_all(attrs={'class': 'step'})):
+            if not start <= position < end:
+                step.decompose()
+        shard_file = html_file.parent / settings.pdf_shard_name.format(index)
+        with open(str(shard_file), "w") as out_file:
+            out_file.write(str(shard))
+        shard_files.append(shard_file)
+    settings.logger.info("Presentation of {} steps split into {} shards.".format(count, len(shard_files)))
+    return shard_files
+
+
+def deck2pdf_command(html_file, output):
+    """
+    :return: deck2pdf command. Command is run with xvfb-run if it is available, so that each deck2pdf process has
+        its own virtual display.
+    """
+    command = ["./deck2pdf", "--profile=impressjs", str(html_file), str(output)]
+    if shutil.which("xvfb-run"):
+        command = ["xvfb-run", "--auto-servernum", "--server-args=-screen 0 1920x1080x24"] + command
+    return command
+
+
+def run_deck2pdf(deck2pdf_folder, html_file, output, timeout=None, retries=None):
+    """
+    Runs deck2pdf in its bin directory. Process and its children (virtual display, java) are killed if it does not
+    finish before the timeout, and deck2pdf is run again.
+
+    :param timeout: seconds, settings.deck2pdf_timeout by default
+    :param retries: how many times deck2pdf is run again after failing, settings.deck2pdf_retries by default
+    :return: True if the pdf file was created
+    """
+    timeout = settings.deck2pdf_timeout if timeout is None else timeout
+    retries = settings.deck2pdf_retries if retries is None else retries
+    command = deck2pdf_command(html_file, output)
+    with profiling.stage("deck2pdf.render", "pdf", file=Path(html_file).name):
+        for attempt in range(retries + 1):
+            if attempt:
+                settings.logger.warning("Rendering {} again ({}/{})".format(Path(html_file).name, attempt, retries))
+            # own process group, so the whole group can be killed
+            process = subprocess.Popen(command, cwd=str(Path(deck2pdf_folder) / "bin"), start_new_session=True)
+            try:
+                returncode = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                settings.logger.error("deck2pdf did not finish {} in {} s.".format(Path(html_file).name, timeout))
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+                continue
+            if returncode == 0 and Path(output).exists():
+                return True
+            settings.logger.error("deck2pdf failed to render {}. Exit code: {}".format(Path(html_file).name,
+                                                                                      returncode))
+        return False
+
+
+def merge_pdfs(pdf_files, output):
+    """
+    Merges pdf files in order. Uses pypdf if it is installed, otherwise pdfunite (poppler-utils).
+
+    :return: True if the merged pdf was created
+    """
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        PdfWriter = None
+    with profiling.stage("merge_pdfs", "pdf", files=len(pdf_files)):
+        if PdfWriter is not None:
+            writer = PdfWriter()
+            for pdf_file in pdf_files:
+                writer.append(str(pdf_file))
+            with open(str(output), "wb") as out_file:
+                writer.write(out_file)
+            return True
+        if shutil.which("pdfunite"):
+            return subprocess.call(["pdfunite"] + [str(pdf_file) for pdf_file in pdf_files] + [str(output)]) == 0
+    settings.logger.critical("Merging pdf files needs pypdf (pip install pypdf) or pdfunite (poppler-utils).")
+    return False
+
+
+def create(deck2pdf_folder, html_file, output, shards):
+    """
+    Creates pdf of the presentation by rendering shards of it at the same time.
+
+    :param deck2pdf_folder: directory of deck2pdf
+    :param html_file: index.html of the presentation
+    :param output: path of the pdf file
+    :param shards: number of deck2pdf processes
+    :return: True if the pdf was created
+    """
+    html_file = Path(html_file).resolve()
+    output = Path(output).resolve()
+    shard_files = split_deck(html_file, shards)
+    shard_dir = output.parent / "{}_shards".format(output.stem)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    pdf_files = [shard_dir / "{}.pdf".format(shard_file.stem) for shard_file in shard_files]
+    try:
+        with ThreadPoolExecutor(max_workers=len(shard_files)) as executor:
+            created = list(executor.map(profiling.bind(lambda args: run_deck2pdf(deck2pdf_folder, *args)),
+                                        zip(shard_files, pdf_files)))
+        if not all(created):
+            failed = [shard_file.name for shard_file, ok in zip(shard_files, created) if not ok]
+            settings.logger.critical("PDF creation failed. Shards not rendered: {}".format(", ".join(failed)))
+            return False
+        settings.logger.info("Merging {} pdf files to {}".format(len(pdf_files), output))
+        return merge_pdfs(pdf_files, output)
+    finally:
+        for shard_file in shard_files:
+            shard_file.unlink()
+        shutil.rmtree(str(shard_dir), ignore_errors=True)
@@ -0,0 +1,166 @@
+"""
+Build pipeline as a dependency graph of stages.
+
+Each stage is a function which gets the results of the stages it depends on as its arguments. Stages whose
+dependencies are done are started in a thread pool, so independent stages (e.g. html presentation and rst2pdf)
+run at the same time. Number of stages running at the same time is limited by jobs (--jobs).
+
+After the run, stage times and the critical path (the chain of dependent stages which took the longest) are
+logged. Wall time of the build can not be shorter than the critical path.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from . import profiling
+from . import settings
+
+
+class Stage:
+    """
+    One step of the build.
+
+    name: unique name of the stage
+    function: called with the results of the dependencies in the order of deps
+    deps: names of the stages which need to be done before this stage
+    start, end: perf_counter times of the run, None if stage has not been run
+    """
+
+    __slots__ = ("name", "function", "deps", "start", "end")
+
+    def __init__(self, name, function, deps):
+        self.name = name
+        self.function = function
+        self.deps = tuple(deps)
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class Pipeline:
+    """
+    Stages of the build and their results. Starts of the stages are logged if verbose is True.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = OrderedDict()
+        self.results = {}
+        self.started = None
+        self.finished = None
+
+    def add(self, name, function, deps=()):
+        """
+        Adds stage to the pipeline. Dependencies need to be added before the stages which depend on them.
+        """
+        if name in self.stages:
+            raise ValueError("Stage {} is already in the pipeline.".format(name))
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError("Stage {} depends on unknown stage {}.".format(name, dep))
+        self.stages[name] = Stage(name, function, deps)
+
+    def run_stage(self, stage):
+        """
+        Runs one stage in a worker thread.
+
+        :return: tuple (result, exception). Exception is returned instead of raised, so that every exception
+            (e.g. KeyboardInterrupt) is given to the main thread.
+        """
+        stage.start = time.perf_counter()
+        if self.verbose:
+            settings.logger.info("Stage {} started in {}.".format(stage.name, threading.current_thread().name))
+        try:
+            with profiling.stage(stage.name, "pipeline"):
+                return stage.function(*(self.results[dep] for dep in stage.deps)), None
+        except BaseException as e:
+            return None, e
+        finally:
+            stage.end = time.perf_counter()
+
+    def run(self, jobs=1):
+        """
+        Runs all the stages. Stages are started in the order they were added when their dependencies are done.
+        If a stage fails, the stages which depend on it are not run, but the other stages are. The first exception
+        is raised after all the stages which could be run have ended. KeyboardInterrupt and other exceptions which
+        are not Exceptions stop starting new stages.
+
+        :param jobs: maximum number of stages running at the same time
+        :return: results of the stages, {name: result}
+        """
+        self.started = time.perf_counter()
+        waiting = list(self.stages.values())
+        running = {}
+        failed = set()
+        error = None
+        interrupted = False
+        with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="stage") as executor:
+            while waiting or running:
+                if not interrupted:
+                    for stage in list(waiting):
+                        if any(dep in failed for dep in stage.deps):
+                            # dependents of a failed stage are not run
+                            waiting.remove(stage)
+                            failed.add(stage.name)
+                        elif len(running) < max(1, jobs) and all(dep in self.results for dep in stage.deps):
+                            waiting.remove(stage)
+                            # stages record to the recorder of the build
+                            running[executor.submit(profiling.bind(self.run_stage), stage)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    result, exception = future.result()
+                    if exception is not None:
+                        failed.add(stage.name)
+                        if isinstance(exception, Exception):
+                            error = error or exception
+                        elif not interrupted:
+                            # e.g. KeyboardInterrupt stops the build and is raised instead of the errors of the stages
+                            interrupted = True
+                            error = exception
+                    else:
+                        self.results[stage.name] = result
+        self.finished = time.perf_counter()
+        if error is not None:
+            raise error
+        return self.results
+
+    def critical_path(self):
+        """
+        :return: list of stages on the longest chain of dependent stages
+        """
+        # longest chain ending at each stage, stages are in dependency order
+        chains = {}
+        for stage in self.stages.values():
+            best = max((chains[dep] for dep in stage.deps), key=lambda chain: chain[0], default=(0.0, []))
+            chains[stage.name] = (best[0] + stage.duration, best[1] + [stage])
+        if not chains:
+            return []
+        return max(chains.values(), key=lambda chain: chain[0])[1]
+
+    def report(self):
+        """
+        Logs times of the stages and the critical path.
+        """
+        if self.started is None or self.finished is None:
+            return
+        settings.logger.info("Build took {:.2f} s.".format(self.finished - self.started))
+        for stage in self.stages.values():
+            if stage.start is None:
+                settings.logger.info("  {:<16} not run".format(stage.name))
+            else:
+                settings.logger.info("  {:<16} {:7.2f} s - {:7.2f} s  ({:.2f} s)".format(
+                    stage.name, stage.start - self.started, stage.end - self.started, stage.duration))
+        path = self.critical_path()
+        settings.logger.info("Critical path: {} = {:.2f} s".format(
+            " -> ".join("{} {:.2f} s".format(stage.name, stage.duration) for stage in path),
+            sum(stage.duration for stage in path)))
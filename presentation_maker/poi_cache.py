@@ -0,0 +1,138 @@
+"""
+Cache for the slides extracted from rst-files.
+
+Slides extracted from one rst-file (PoiFragment) are saved to the build directory (_build/.cache/poi).
+Key of the cached slides is a hash of the rst-file content and the settings which affect the extraction,
+so unchanged files do not need to be extracted again. Least recently used fragments are deleted when the
+cache grows over settings.poi_cache_max_size.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from . import settings
+
+# change this if extraction changes in a way that changes extracted slides
+cache_version = 4
+
+
+class PoiFragment:
+    """
+    Slides extracted from one rst-file.
+
+    text: slides in hovercraft RST, without the first slide of the presentation
+    pdf_text: same slides in rst2pdf RST
+    opened: True if slides have been started in the file. First slide of the presentation is written before
+        the first file that has opened slides.
+    images: image paths used in the slides
+    bg_img: True if slides have background images (:bgimg:)
+    """
+
+    __slots__ = ("text", "pdf_text", "opened", "images", "bg_img")
+
+    def __init__(self, text, pdf_text, opened, images, bg_img):
+        self.text = text
+        self.pdf_text = pdf_text
+        self.opened = opened
+        self.images = images
+        self.bg_img = bg_img
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data[name] for name in cls.__slots__))
+
+
+def create_config_key(other_transitions, image_index_version, image_dir):
+    """
+    Creates key from the settings which affect extracted slides.
+
+    :param image_dir: directory which image paths of the slides are relative to
+    :return: config key as a string
+    """
+    config = [cache_version, settings.poi, settings.not_in_slides, settings.newcol, other_transitions,
+              image_index_version, os.path.abspath(str(image_dir))]
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class PoiCache:
+    """
+    Cached PoiFragments. One JSON file per fragment, file modification time is used as the last access time.
+    """
+
+    def __init__(self, cache_dir, config_key, max_size=None):
+        self.cache_dir = Path(cache_dir)
+        self.config_key = config_key.encode("utf-8")
+        self.max_size = settings.poi_cache_max_size if max_size is None else max_size
+        self.hits = 0
+        self.misses = 0
+
+    def create_key(self, rst_file):
+        """
+        :return: hash of the rst-file content and the config key.
+        """
+        digest = hashlib.sha256(self.config_key)
+        with open(str(rst_file), 'rb') as reader:
+            digest.update(reader.read())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / (key + ".json")
+
+    def get(self, key):
+        """
+        :return: cached PoiFragment or None if key is not in the cache.
+        """
+        path = self.path(key)
+        try:
+            with open(str(path), encoding="utf-8") as reader:
+                fragment = PoiFragment.from_dict(json.load(reader))
+            # marks the fragment as recently used
+            os.utime(str(path))
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        path = self.path(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name(path.name + ".tmp")
+            with open(str(temporary), 'w', encoding="utf-8") as writer:
+                json.dump(fragment.to_dict(), writer)
+            os.replace(str(temporary), str(path))
+        except OSError as e:
+            settings.logger.warning("Could not write slide cache {}. Error: {}".format(path, e))
+
+    def evict(self):
+        """
+        Deletes least recently used fragments until the cache is smaller than max_size.
+        """
+        evict_files(self.cache_dir, ".json", self.max_size)
+
+
+def evict_files(cache_dir, suffix, max_size):
+    """
+    Deletes least recently used files (oldest modification time) with the suffix until the files in cache_dir
+    take less than max_size bytes.
+    """
+    try:
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                   for entry in os.scandir(str(cache_dir)) if entry.name.endswith(suffix)]
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
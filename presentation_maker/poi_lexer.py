@@ -0,0 +1,277 @@
+"""
+Lexer for point-of-interest directives.
+
+Rst-file is read once and every line is classified with one compiled regular expression:
+    option line: starts with whitespace and colon, e.g. '  :title: Example'
+    text line: starts without indentation, ends the point-of-interest
+    body line: indented or empty line inside of the point-of-interest
+
+Lines of each point-of-interest are collected into Slide records, which are written to hovercraft RST
+by write_slide in presentation_maker.py.
+"""
+
+import re
+
+from . import settings
+
+# group 1: option line, group 2: text line, no match: body line
+line_kind = re.compile(r"(\s+:)|(\S)")
+
+image = '.. image::'
+figure = '.. figure::'
+youtube = '.. youtube::'
+local_video = '.. local-video::'
+code_block = '.. code-block::'
+# ::newcol is kept in the slide body as this marker, write_slide writes it as a newcol directive
+newcol_marker = "\n::newcol\n"
+
+youtube_html = '  <iframe width="800" height="600" src="https://www.youtube.com/embed/{}" frameborder="0" ' \
+               'allow="accelerometer; autoplay; encrypted-media; gyroscope; picture-in-picture" allowfullscreen>' \
+               '</iframe>\n'
+local_video_html = '  <video width="65%" controls><source src="../../_static/videot/{}.mp4" type="video/mp4">' \
+                   'Your browser does not support the video element.</video>'
+
+
+def get_title_from_options(line):
+    """
+    Gets title from poi if someone uses old way of defining poi.
+    (This is old way)
+    Get header from POI :title: option. There is another function
+    (get_title_without_options) when title option is not available.
+
+    .. point-of-interest:: 0
+        :title: Example Title
+        :next: 1
+
+    :return: Array of heading text and header underline.
+    """
+    # Assumes that the line parameter is in this form "title: Test title"
+    title = line.split(":")[2].lstrip()
+    title_underline = "-" * len(title) + "\n\n"
+
+    return [title, title_underline]
+
+
+def get_title_without_options(line):
+    """
+    Gets headers from POI. This function is used when there are no :title:
+    option available. (This is new)
+
+    This is the POI format in this case.
+
+    .. point-of-interest:: Example Title
+        :id: 0
+        :next: 1
+        :class: borderless
+
+    :return: Array of heading text and header underline.
+    """
+    try:
+        title = "\n" + line.split(settings.poi)[1].lstrip()
+        title_underline = "-" * len(title) + "\n\n"
+
+        return [title, title_underline]
+    except IndexError:
+        # IndexError occurs so
+        # it has :title: option in POI. Title has been set the old way
+        # ignoring and returning empty list.
+        # returned array will be overwritten later by get_title_from_options
+        return [""]
+
+
+def depth_of_indentation(line, spaces):
+    """
+    Calculates how many spaces is in the indentation.
+    :param line:
+    :param spaces:
+    :return:
+    """
+    if spaces == 0:
+        for char in line:
+            if char.isspace():
+                spaces += 1
+            else:
+                return spaces
+    else:
+        return spaces
+
+
+class Slide:
+    """
+    One point-of-interest.
+
+    title: heading text and underline, written before the first body line
+    options: option lines of the point-of-interest
+    head: lines written before the title, e.g. background image and column options
+    body: lines written after the title
+    images: image paths used in the slide
+    columns: column ratios (:columns: option)
+    newcol: True if slide has ::newcol
+    bgimg: background image path or None
+    opened: True if any line was read after the point-of-interest line
+    title_written: True if title is written before body
+    ending: True if transition line is written after the slide
+    """
+
+    __slots__ = ("title", "options", "head", "body", "images", "columns", "newcol", "bgimg", "opened",
+                 "title_written", "ending")
+
+    def __init__(self):
+        self.title = None
+        self.options = []
+        self.head = []
+        self.body = []
+        self.images = []
+        self.columns = []
+        self.newcol = False
+        self.bgimg = None
+        self.opened = False
+        self.title_written = False
+        self.ending = False
+
+    def write(self, line):
+        if self.title_written:
+            self.body.append(line)
+        else:
+            self.head.append(line)
+
+
+def read_slides(file_to_read, find_image):
+    """
+    Reads point-of-interests from rst-file.
+
+    :param file_to_read: path to the rst-file
+    :param find_image: function that returns path to the image used in the slide or None if image was not found
+    :return: list of Slides
+    """
+    slides = []
+    slide = None
+    # for counting spaces in indentation
+    spaces = 0
+    title = None
+    # title_option flag separates new version of POI from old one.
+    # Since old version uses title_option and new POI does not.
+    title_option = False
+    # flag to see if current POI is wanted in slides
+    in_slides = True
+    # not_in_slides is defined in point_of_interest.py directive in a-plus-rst-tools
+    # if 'not_in_slides' flag is changed in that file, it should be changed here as well.
+    not_in_slides = settings.not_in_slides
+    poi = settings.poi
+    newcol = settings.newcol
+    # If in code block inside POI register it, if code block not in POI ignore.
+    # Background images are not read from the first POI of the file, since this is True until the first POI ends.
+    in_code_block = True
+
+    with open(file_to_read, 'r') as reader:
+        for line in reader:
+            if slide:
+                slide.opened = True
+                kind = line_kind.match(line)
+                if kind and kind.group(1):
+                    # inside poi, in options
+                    # from here count how many spaces are in the indentation
+                    spaces = depth_of_indentation(line, spaces)
+                    slide.options.append(line)
+                    if not_in_slides in line:
+                        # If poi has this option, then exclude from presentation
+                        in_slides = False
+                    else:
+                        if ":title:" in line:
+                            # if there are title option then it will be used
+                            # to provide header to the slide
+                            title_option = True
+                            title = get_title_from_options(line)
+                        if ":columns:" in line:
+                            slide.columns.append(line.split(":columns:")[1].strip())
+                        if newcol in line:
+                            slide.newcol = True
+                            # keep ::newcol in rst. Later it is easier to know how columns are set
+                            slide.write(newcol_marker)
+                        if ":bgimg:" in line and not in_code_block:
+                            # if poi has background image in it. We need to keep it in rst. It will be used later.
+                            new_path = find_image(line.split(":bgimg:")[1])
+                            if new_path:
+                                slide.write("\n:bgimg: {}".format(new_path))
+                                slide.bgimg = new_path
+                                slide.images.append(new_path)
+                        if ":math" in line:
+                            slide.write(line)
+                        if settings.column_width_opt in line:
+                            # keep column :width: option in rst.
+                            slide.write(line)
+                        if settings.column_class_opt in line:
+                            slide.write(line)
+
+                elif kind:
+                    # line starts without indentation, poi has ended
+                    in_code_block = False
+                    # if option :not_in_slides: is activated then do not write
+                    # transition. Otherwise it will print double transition and
+                    # blank slide will appear
+                    slide.ending = in_slides
+                    slide = None
+                elif in_slides:
+                    spaces = depth_of_indentation(line, spaces)
+                    if not slide.title_written:
+                        slide.title = title
+                        slide.title_written = True
+                        # gets the spaces in case if user has not set any options in poi
+                        slide.write(line[spaces:])
+                    if ".. " not in line:
+                        # body lines are written as they are
+                        slide.write(line)
+                    else:
+                        read_directive(slide, line, find_image)
+                        if code_block in line:
+                            in_code_block = True
+
+            if poi in line:
+                # if not in code block do things normally
+                # if POI then start extract
+                if not title_option:
+                    # if there is title option this variable will be overwritten by that option value
+                    title = get_title_without_options(line)
+                else:
+                    settings.logger.warning("POI titled: {} has two titles. Please remove other one."
+                                            .format(title[0].rstrip()))
+                if not in_code_block:
+                    in_slides = True
+                if not slide:
+                    slide = Slide()
+                    slides.append(slide)
+
+                settings.logger.info("\nextracting {} from {}".format(title[0].rstrip().lstrip(), file_to_read))
+    if slide:
+        # if file has ended unexpectedly, write transition
+        slide.ending = True
+    return slides
+
+
+def read_directive(slide, line, find_image):
+    """
+    Writes body line which may have a directive in it. Images, figures and videos are changed to work
+    in the presentation, other lines are written as they are.
+    """
+    if image in line:
+        new_path = find_image(line.split(image)[1])
+        if new_path:
+            slide.write(line.split(image)[0] + image + " " + new_path + "\n")
+            slide.images.append(new_path)
+    elif figure in line:
+        # figures are written as images
+        new_path = find_image(line.split(figure)[1])
+        if new_path:
+            slide.write(line.split(figure)[0] + image + " " + new_path + "\n")
+            slide.images.append(new_path)
+    elif youtube in line:
+        # line looks like this: .. youtube:: Yw6u6YkTgQ4
+        video_id = line.split(youtube)[1].strip()
+        slide.write(".. raw:: html\n\n")
+        slide.write(youtube_html.format(video_id))
+    elif local_video in line:
+        video_name = line.split(local_video)[1].strip()
+        slide.write(".. raw:: html\n\n")
+        slide.write(local_video_html.format(video_name))
+    else:
+        slide.write(line)
@@ -4,85 +4,48 @@
     This is script makes hovercraft compatible RST-file from RST-file
     using configuration file (presentation.config.yaml). Hovercraft
     can use this created RST-file to create presentation.
+
+    hover (hovercraft, docutils, bs4) and the other subcommands are imported when they are used, so --help and
+    errors in the configuration do not wait for them to be imported.
 """
 
 import argparse
-import pathlib
+import io
+import os
 import re
 import sys
+from contextlib import contextmanager
+from itertools import repeat
 from shutil import copyfile
 from pathlib import Path
 
 import yaml
 
+from presentation_maker import build_manifest
 from presentation_maker import pathfinder
+from presentation_maker.build_context import BuildContext
 from presentation_maker import create_pdf
-from presentation_maker import hover
+from presentation_maker.errors import PresentationMakerError, ConfigError, CourseError
+from presentation_maker import pipeline
+from presentation_maker import profiling
 from presentation_maker import settings
+from presentation_maker import file_snapshot
+from presentation_maker import poi_cache
+from presentation_maker import poi_lexer
+from presentation_maker.poi_cache import PoiCache, PoiFragment
+from presentation_maker.file_snapshot import FileSnapshot
+from presentation_maker.image_index import ImageIndex
 
 
-def write_ending(file_to_write, ending, last_slide_content):
-    # make these settings from config
-    """
-    Writes ending to a rst-file.
-    Ending contains last slide and transitions to it.
-    Basically anything that is in last_slide in presentation_config.yaml.
-    """
-    with open(file_to_write, 'a') as writer:
-        writer.writelines(ending)
-        writer.writelines(last_slide_content)
-
-
-def exiting():
-    settings.logger.info("Fix errors and try again. Exiting...")
-    sys.exit(2)
-
-
-def get_title_from_options(line):
-    """
-    Gets title from poi if someone uses old way of defining poi.
-    (This is old way)
-    Get header from POI :title: option. There is another function
-    (get_title_without_options) when title option is not available.
-
-    .. point-of-interest:: 0
-        :title: Example Title
-        :next: 1
-
-    :return: Array of heading text and header underline.
+def exiting(error=PresentationMakerError, message=None):
     """
-    # Assumes that the line parameter is in this form "title: Test title"
-    title = line.split(":")[2].lstrip()
-    title_underline = "-" * len(title) + "\n\n"
-
-    return [title, title_underline]
-
+    Stops the build. Errors have been logged already.
 
-def get_title_without_options(line):
+    :param error: PresentationMakerError subclass of the kind of the error
+    :param message: message of the exception
+    :raises error: always. Command line catches it and exits, see main.
     """
-    Gets headers from POI. This function is used when there are no :title:
-    option available. (This is new)
-
-    This is the POI format in this case.
-
-    .. point-of-interest:: Example Title
-        :id: 0
-        :next: 1
-        :class: borderless
-
-    :return: Array of heading text and header underline.
-    """
-    try:
-        title = "\n" + line.split(settings.poi)[1].lstrip()
-        title_underline = "-" * len(title) + "\n\n"
-
-        return [title, title_underline]
-    except IndexError:
-        # IndexError occurs so
-        # it has :title: option in POI. Title has been set the old way
-        # ignoring and returning empty list.
-        # returned array will be overwritten later by get_title_from_options
-        return [""]
+    raise error(message or "Fix errors and try again.")
 
 
 def create_first_slide(dictionary):
@@ -102,226 +65,180 @@ def create_first_slide(dictionary):
         first_slide[2] = subtitle + "\n"
     except KeyError as e:
         settings.logger.critical("Title and/or subtitle missing from presentation_config.yaml. Message: {}".format(e))
-        exiting()
+        exiting(ConfigError, "Title and/or subtitle missing from presentation_start: {}".format(e))
     return first_slide
 
 
-def depth_of_indentation(line, spaces):
+def change_path_to_relative(absolute_path, image_dir):
     """
-    Calculates how many spaces is in the indentation.
-    :param line:
-    :param spaces:
-    :return:
+    :param image_dir: directory of the presentation RST, which image paths are relative to
+    :return: image path relative to image_dir
     """
-    if spaces == 0:
-        for char in line:
-            if char.isspace():
-                spaces += 1
-            else:
-                return spaces
-    else:
-        return spaces
+    if absolute_path:
+        return os.path.relpath(os.path.abspath(str(absolute_path)), os.path.abspath(str(image_dir)))
 
 
-def change_path_to_relative(absolute_path):
-    if absolute_path:
-        relative = str(Path('..') / absolute_path.parent.name / absolute_path.name)
-        return relative
-
-
-def write_poi(file_to_read, file_to_write, transition, first_slide, image_paths, other_transitions,
-              raw_dict, step_num, img_list):
-    """
-    This is just for extracting point-of-interest from rst-files.
-    It will get images too if there are any inside the POI.
-
-    Needs some cleaning and more functions since now it is kind of a mess.
-    """
-    extract = settings.poi
-    # flag when POI starts
-    start = False
-    # for counting spaces in indentation
-    spaces = 0
-    # title_option flag separates new version of POI from old one.
-    # Since old version uses title_option and new POI does not.
-    title_option = False
-    # see if title is already written to rst, so it does not write it multiple times
-    title_written = False
-    # flag to see if current POI is wanted in slides
-    in_slides = True
-    # not_in_slides is defined in point_of_interest.py directive in a-plus-rst-tools
-    # if 'not_in_slides' flag is changed in that file, it should be changed here as well.
-    not_in_slides = settings.not_in_slides
-    # directives which are handled differently while writing
-    # columns in slides.
-    newcol = settings.newcol
-    directive = ['.. image::', '.. figure::', '.. youtube::', '.. local-video::', '.. column::', '.. row::',
-                 '.. code-block::']
-    # If in code block inside POI register it, if code block not in POI ignore
-    code_block = True
-
-    with open(file_to_read, 'r') as reader, open(file_to_write, 'a') as writer:
-
-        def write_transition(file_writer, transitions):
-            for k, v in transitions.items():
-                file_writer.write("\n:{}: {}".format(k, v))
-            file_writer.write("\n\n")
-
-        def transition_line(file_writer):
-            file_writer.write("\n----\n\n")
-
-        for line in reader.readlines():
-            if start:
-                if first_slide:
-                    # if it is first slide then write transition line and transitions
-                    # and cover slide which contains title and subtitle
-                    transition_line(writer)
-                    # write transitions
-                    write_transition(writer, transition)
-                    first_slide = False
-                    writer.write("\n")
-                    writer.writelines(create_first_slide(raw_dict))
-                    transition_line(writer)
-                # regex below searches lines that starts with a (1 or more) whitespaces and
-                # after that ":"
-                if re.search("^(\s+:)", line):
-                    # inside poi, in options
-                    # from here count how many spaces are in the indentation
-                    # later that amount is used to remove extra whitespaces
-                    # to indent correctly in presentation.rst
-                    spaces = depth_of_indentation(line, spaces)
-                    if not_in_slides in line:
-                        # If poi has this option, then exclude from presentation
-                        in_slides = False
-                    else:
-                        if ":title:" in line:
-                            # if there are title option then it will be used
-                            # to provide header to the slide
-                            title_option = True
-                            title = get_title_from_options(line)
-                        if ":columns:" in line:
-                            settings.column_ratios.append(line.split(":columns:")[1].lstrip().rstrip())
-                        if newcol in line:
-                            settings.columns = True
-                            # keep ::newcol in rst. Later it is easier to know how columns are set
-                            writer.write("\n::newcol\n")
-                        if ":bgimg:" in line:
-                            if not code_block:
-                                # if poi has background image in it. We need to keep it in rst. It will be used later.
-                                new_path = find_image_path(image_paths, line.split(":bgimg:")[1])
-                                new_path = change_path_to_relative(new_path)
-                                if new_path:
-                                    writer.write("\n:bgimg: {}".format(new_path))
-                                    settings.bg_img = True
-                                    # img_path = line.split(":bgimg:")[1].strip()
-                                    # img_list.append(img_path)
-                                    img_list.append(new_path)
-
-                        if ":math" in line:
-                            writer.write(line)
-                        if settings.column_width_opt in line:
-                            # keep column :width: option in rst.
-                            writer.write(line)
-                        if settings.column_class_opt in line:
-                            writer.write(line)
-
-                elif re.search("^([a-zA-Z0-9\S]+)", line):
-                    # if the line starts with numbers or characters
-                    # means poi has ended
-                    # regex searches for lines that start normally without indentation
-                    # means: poi has ended
-                    start = False
-                    title_written = False
-                    code_block = False
-                    # ends slide
-                    # if option :not_in_slides: is activated then do not write
-                    # transition. Otherwise it will print double transition and
-                    # blank slide will appear
-                    if in_slides:
-                        transition_line(writer)
-                    else:
-                        pass
-                elif in_slides:
-                    spaces = depth_of_indentation(line, spaces)
-                    if not title_written:
-                        write_transition(writer, other_transitions)
-                        writer.writelines(title)
-                        title_written = True
-                        writer.write(line[spaces:])
-                        # if directives specified in the directive list are in line
-                        # those will be written to the file
-                        # gets the spaces in case if user has not set any options in poi
-                    if directive[0] in line:
-                        new_path = find_image_path(image_paths, line.split(directive[0])[1])
-                        if new_path:
-                            new_path = change_path_to_relative(new_path)
-                            parts = line.split(directive[0])
-                            new = parts[0] + directive[0] + " " + str(new_path)
-                            writer.write(new + "\n")
-                            img_list.append(new_path)
-                    elif directive[1] in line:
-                        new_path = find_image_path(image_paths, line.split(directive[1])[1])
-                        if new_path:
-                            new_path = change_path_to_relative(new_path)
-                            parts = line.split(directive[1])
-                            new = parts[0] + directive[0] + " " + str(new_path)
-                            writer.write(new + "\n")
-                            img_list.append(new_path)
-                    elif directive[2] in line:
-                        # Handling youtube video
-                        # line looks like this: .. youtube:: Yw6u6YkTgQ4
-                        video_id = line.split(directive[2])[1].rstrip().lstrip()
-                        writer.write(".. raw:: html\n\n")
-                        writer.write('  <iframe width="800" height="600" src="https://www.youtube.com/embed/' + video_id + '" frameborder="0" allow="accelerometer; autoplay; encrypted-media; gyroscope; picture-in-picture" allowfullscreen></iframe>\n')
-                    elif directive[3] in line:
-                        # Handling local-video directive
-                        video_name = line.split(directive[3])[1].rstrip().lstrip()
-                        writer.write(".. raw:: html\n\n")
-                        writer.write('  <video width="65%" controls><source src="../../_static/videot/' + video_name + '.mp4" type="video/mp4">Your browser does not support the video element.</video>')
-                    elif directive[4] or directive[5] in line:
-                        # row and column
-                        writer.write(line)
-                    else:
-                        # empty lines need to be written
-                        # otherwise some important empty lines will be deleted
-                        if re.search("^\s*$", line):
-                            writer.write(line)
-                        else:
-                            writer.write(line[spaces:])
-                    if directive[6] in line:
-                        # code-block
-                        code_block = True
-            if extract in line:
-                # if not in code block do things normally
-                # if POI then start extract
-                # keeping count of the slides (steps)
-                if not title_option:
-                    # if there is title option this variable will be overwritten by that option value
-                    title = get_title_without_options(line)
-                else:
-                    settings.logger.warning("POI titled: {} has two titles. Please remove other one."
-                                            .format(title[0].rstrip()))
+def extract_poi(file_to_read, image_index, other_transitions, image_dir):
+    """
+    Extracts point-of-interests from rst-file. Slides are read with poi_lexer and written to PoiFragment
+    instead of the presentation file, both as hovercraft RST and rst2pdf RST. First slide of the presentation
+    is added by write_fragment, since it depends on the files before this one.
+
+    :param image_dir: directory of the presentation RST, image paths are written relative to it
+    :return: PoiFragment
+    """
+    def find_image(line):
+        return change_path_to_relative(find_image_path(image_index, line), image_dir)
+
+    with profiling.stage("write_poi", "file", file=str(file_to_read)):
+        slides = poi_lexer.read_slides(file_to_read, find_image)
+        writer = io.StringIO()
+        pdf_writer = io.StringIO()
+        images = []
+        for slide in slides:
+            write_slide(writer, slide, other_transitions)
+            write_pdf_slide(pdf_writer, slide)
+            images.extend(slide.images)
+    return PoiFragment(writer.getvalue(), pdf_writer.getvalue(), any(slide.opened for slide in slides), images,
+                       any(slide.bgimg for slide in slides))
+
+
+def write_slide(writer, slide, other_transitions):
+    """
+    Writes slide as hovercraft RST. Transitions (other_slides in presentation_config.yaml) and title are
+    written before the body of the slide. ::newcol markers are written as newcol directives which have the column
+    ratios of the slide, see create_columns.
+    """
+    newcol = None
+    if slide.newcol:
+        newcol = newcol_directive(slide.columns[-1] if slide.columns else None)
+    writer.writelines(replace_newcol(slide.head, newcol))
+    if slide.title_written:
+        for k, v in other_transitions.items():
+            writer.write("\n:{}: {}".format(k, v))
+        writer.write("\n\n")
+        writer.writelines(slide.title)
+    writer.writelines(replace_newcol(slide.body, newcol))
+    if slide.ending:
+        writer.write("\n----\n\n")
+
+
+def write_pdf_slide(writer, slide):
+    """
+    Writes slide as rst2pdf RST. Options and transitions are left out, since they only affect the html
+    presentation, and so are notes. Title is underlined with (=) and ::newcol markers are written as they are,
+    since columns do not work in rst2pdf.
+    """
+    writer.writelines(line for line in slide.head if line is poi_lexer.newcol_marker)
+    if slide.title_written:
+        writer.write("\n\n")
+        writer.writelines(line.replace("-", "=") if line.strip() and not line.strip("-\n") else line
+                          for line in slide.title)
+    writer.writelines(without_notes(slide.body))
+    if slide.ending:
+        writer.write("\n\n")
+
+
+def without_notes(lines):
+    """
+    :return: lines without the note directives and their content
+    """
+    note_indent = None
+    for line in lines:
+        indent = len(line) - len(line.lstrip(" "))
+        if note_indent is not None:
+            if not line.strip() or indent > note_indent:
+                continue
+            note_indent = None
+        if settings.note in line:
+            note_indent = indent
+            continue
+        yield line
+
+
+def newcol_directive(ratio):
+    """
+    :param ratio: column ratios of the slide, e.g. "5 1 1", or None
+    :return: newcol directive as RST. Empty comment after the directive ends it, so the indented text of the next
+        column is not read as the content of the directive.
+    """
+    if ratio:
+        return "\n.. {}:: {}\n\n..\n".format(settings.newcol_directive, ratio)
+    return "\n.. {}::\n\n..\n".format(settings.newcol_directive)
+
+
+def replace_newcol(lines, newcol):
+    """
+    :return: lines where ::newcol markers are replaced with newcol directive
+    """
+    if newcol is None:
+        return lines
+    return (newcol if line is poi_lexer.newcol_marker else line for line in lines)
+
+
+def write_first_slide(writer, transition, raw_dict):
+    """
+    Writes transition line, transitions and cover slide which contains title and subtitle.
+    """
+    writer.write("\n----\n\n")
+    for k, v in transition.items():
+        writer.write("\n:{}: {}".format(k, v))
+    writer.write("\n\n")
+    writer.write("\n")
+    writer.writelines(create_first_slide(raw_dict))
+    writer.write("\n----\n\n")
+
+
+def write_pdf_first_slide(writer, raw_dict):
+    """
+    Writes cover slide as rst2pdf RST. Title of the presentation is the main title (#).
+    """
+    title, underline, subtitle = create_first_slide(raw_dict)
+    writer.write("\n\n")
+    writer.writelines([title, underline.replace("=", "#"), subtitle, "\n"])
+
+
+def write_fragment(writer, fragment, first_slide, transition, raw_dict, img_list, context, pdf_writer=None):
+    """
+    Writes slides extracted from one rst-file to the presentation. If no slides were written before,
+    first slide of the presentation is written before the slides.
+
+    :param context: BuildContext, bg_img is set if the slides have background images
+    :param pdf_writer: writer of the rst2pdf RST or None
+    :return: first_slide flag, False if first slide has been written.
+    """
+    if first_slide and fragment.opened:
+        write_first_slide(writer, transition, raw_dict)
+        if pdf_writer is not None:
+            write_pdf_first_slide(pdf_writer, raw_dict)
+        first_slide = False
+    writer.write(fragment.text)
+    if pdf_writer is not None:
+        pdf_writer.write(fragment.pdf_text)
+    img_list.extend(fragment.images)
+    if fragment.bg_img:
+        context.bg_img = True
+    return first_slide
 
-                if code_block:
-                    start = True
-                else:
-                    step_num += 1
-                    start = True
-                    in_slides = True
 
-                settings.logger.info("\nextracting {} from {}".format(title[0].rstrip().lstrip(), file_to_read))
-        if start:
-            # if file has ended unexpectedly, write transition
-            transition_line(writer)
+def write_poi(file_to_read, file_to_write, transition, first_slide, image_index, other_transitions,
+              raw_dict, img_list, context):
+    """
+    Extracts point-of-interests from rst-file and appends them to file_to_write.
 
+    :return: first_slide flag and image list.
+    """
+    fragment = extract_poi(file_to_read, image_index, other_transitions, Path(file_to_write).parent)
+    with open(file_to_write, 'a') as writer:
+        first_slide = write_fragment(writer, fragment, first_slide, transition, raw_dict, img_list, context)
     return first_slide, img_list
 
 
-def find_image_path(image_paths, line):
+def find_image_path(image_index, line):
     """
-    Find working image path to a given image from image_paths list.
+    Find working image path to a given image from image_index.
     Works if you have correct image name in the path and image exists.
-    image_paths has paths which are gathered from file system.
+    image_index has paths which are gathered from file system.
 
     :return: path to the image if it is found.
     """
@@ -338,40 +255,23 @@ def find_image_path(image_paths, line):
         settings.logger.info("Image URL {} found.".format(line.rstrip()))
         return line
     else:
-        # image_path is from rst file, which user has typed. May have errors.
-        image_path = pathlib.Path(line)
-        # image_name is from rst file, which user has typed. May have errors.
-        image_name = pathlib.Path(line).name
-
-        for p in image_paths:
-            suffix = pathlib.Path(p).suffix
-            if p.name == image_name:
-                new_path = p
-                settings.logger.info("Image {} found.".format(new_path))
-                return new_path
-            elif p.name == str(image_path.with_suffix(suffix.upper()).name):
-                new_path = p
-                settings.logger.info("Image {} found.".format(new_path))
-                return new_path
-            elif p.name == str(image_path.with_suffix(suffix.lower()).name):
-                new_path = p
-                settings.logger.info("Image {} found.".format(new_path))
-                return new_path
-            else:
-                pass
+        # image path is from rst file, which user has typed. May have errors.
+        new_path = image_index.find(line)
+        if new_path:
+            settings.logger.info("Image {} found.".format(new_path))
+            return new_path
 
         print_spacer()
         settings.logger.warning('Image "{}" was not found. \nMake sure it exist and it is named the same way as the '
-                              'rst-file.'.format(str(image_path).rstrip()))
+                                'rst-file.'.format(line.strip()))
         print_spacer()
         # exiting()
 
 
-def create_img_path_list(course_path):
+def create_img_path_list(course_path, snapshot=None):
     """
-    Creates image list (.png) from all the images in folders from ../ to sub directories
-    recursively. If you need to go deeper change cwd_parent to Path.cwd().parent.parent
-    keep in mind that if you go too deep, presentation creation time will increase.
+    Creates image list from all the images in the course directory and its sub directories.
+    Images are taken from the file snapshot, so the course directory is walked only once.
 
     :return: Image list which contains all the images which have defined image format.
     """
@@ -379,15 +279,10 @@ def create_img_path_list(course_path):
     # If you need support for another types of image files. Insert suffix in the list.
 
     img_formats = [".png", ".jpg", ".jpeg", ".gif", ".PNG", ".JPG", ".JPEG", ".GIF"]
-    # creating image list
-    image_paths = []
-    for f in img_formats:
-        for filepath in Path(course_path).glob('**/*' + f):
-            if "build" in str(filepath):
-                pass
-            else:
-                image_paths.append(filepath)
-    return image_paths
+    if snapshot is None:
+        snapshot = FileSnapshot(course_path)
+    # build directories are not in the snapshot
+    return snapshot.find_suffixes(img_formats)
 
 
 def handle_css(build_path, code_dir, user_given_css):
@@ -400,13 +295,17 @@ def handle_css(build_path, code_dir, user_given_css):
     relative path so hovercraft will copy this file to presentation folder and keeps relative path.) if absolute path
     is used hovercraft will not copy external files.
 
-    :param user_given_css: path or None
+    :param user_given_css: path of the css given in the configuration or None
     :param build_path:
     :param code_dir:
     :return: relative_css_path
+    :raises ConfigError: user given css file does not exist
     """
     css = Path("css")
     if user_given_css:
+        if not Path(user_given_css).is_file():
+            settings.logger.error("CSS file {} given in the configuration does not exist.".format(user_given_css))
+            exiting(ConfigError, "CSS file {} does not exist".format(user_given_css))
         css_file = Path(user_given_css).name
         settings.logger.info("User given {} found.".format(css_file))
         old_css_path = user_given_css
@@ -432,21 +331,26 @@ def handle_css(build_path, code_dir, user_given_css):
     return relative_css_path
 
 
-def copy_file(source, target):
+def copy_file(source, target, snapshot=None):
     """
-    Copy file function.
+    Copy file function. Source is stat'ed from snapshot if it is given.
     :param source:
     :param target:
+    :param snapshot: FileSnapshot or None
     :return:
     """
 
-    if source.exists():
-        if target.exists() and source.lstat().st_mtime <= target.lstat().st_mtime:
+    source_stat = snapshot.stat(source) if snapshot else file_snapshot.stat(source)
+    if source_stat:
+        target_stat = file_snapshot.stat(target)
+        if target_stat and source_stat.mtime <= target_stat.mtime:
             # if file has not changed then skip.
             pass
         else:
             if not source == target:
-                settings.logger.info("Copying {} to {}".format(source, Path.cwd() / target))
+                settings.logger.info("Copying {} to {}".format(source, target))
+                profiling.count("files_copied")
+                profiling.count("bytes_copied", source_stat.size)
                 if not target.parent.is_dir():
                     target.parent.mkdir(parents=True)
                     copyfile(str(source), str(target))
@@ -456,9 +360,9 @@ def copy_file(source, target):
         settings.logger.warning("{} does not exist. Try fixing the path in the RST-file.".format(str(source)))
 
 
-def parse_config_file(code_dir, config_path, build_dir):
+def parse_config_file(config_path, context):
     """
-    Parse config file and return list of parameters.
+    Parse config file and return list of parameters. Header and footer visibility are set to the context.
 
     :returns: a list of parameters from presentation_config.yaml formatted as rst. :name: param
     """
@@ -473,85 +377,110 @@ def parse_config_file(code_dir, config_path, build_dir):
         settings.logger.error("{} was not found. Make sure that path to the configuration file is "
                               "correct.".format(config_file))
         settings.logger.error("error message: {}".format(fnf))
-        exiting()
+        exiting(ConfigError, "{} was not found".format(config_path))
 
     with open(str(config_path)) as file:
-        doc = yaml.load(file, Loader=yaml.Loader)
-        params_dict = []
-        params = []
-        ending = []
-        last_slide_content = []
-        config = doc
-
-        for k, v in doc.items():
-            if k == settings.presentation_start:
-                try:
-                    for keys, values in v.items():
-                        params.append(":{}: {}\n".format(keys, values))
-                except KeyError as e:
-                    settings.logger.error("Missing keys in presentation_start. Error message: {}".format(e))
-                    exiting()
-            if k == settings.files:
-                if config.get(settings.files) and config[settings.files].get(settings.css):
-                    css_path = Path(config[settings.files].get(settings.css))
-                    css_path = str(handle_css(build_dir, code_dir, css_path))
-                    params.append(":{}: {}\n".format("css", css_path))
-                else:
-                    # if css is not set. It will be set up in set_defaults function
-                    css_path = str(handle_css(build_dir, code_dir, None))
-                    params.append(":{}: {}\n".format("css", css_path))
-
-            if k == 'slide_options':
-                try:
-                    for keys, values in v.items():
-                        params.append(":{}: {}\n".format(keys, values))
-                except KeyError:
-                    settings.logger.error("{} missing from slide_options in {}.".format(keys, Path(config_file).name))
-                    exiting()
-
-                params_dict.append(v)
-
-            if k == settings.header_footer:
-                if not doc[settings.header_footer].get(settings.header):
-                    config[settings.header_footer][settings.header] = " "
-                if not doc[settings.header_footer].get(settings.footer):
-                    config[settings.header_footer][settings.footer] = " "
-                params.append("\n{}\n\n".format(".. header::"))
-                params.append("\n{}\n\n".format("      " + doc.get(settings.header_footer).get(settings.header)))
-                params.append("\n{}\n\n".format(".. footer::"))
-                params.append("\n{}\n\n".format("      " + doc.get(settings.header_footer).get(settings.footer)))
-
-                if not doc[settings.header_footer].get(settings.header_visible):
-                    # make header disappear
-                    settings.header_visible = False
-                if not doc[settings.header_footer].get(settings.footer_visible):
-                    # make footer disappear
-                    settings.footer_visible = False
-            elif k == settings.first_slide:
-                # getting transitions for easier access
-                transition = v
-            elif k == settings.other_slides:
-                other_transitions = v
+        try:
+            doc = yaml.load(file, Loader=yaml.Loader)
+        except yaml.YAMLError as e:
+            settings.logger.error("{} is not valid YAML. Error: {}".format(config_file, e))
+            exiting(ConfigError, "{} is not valid YAML".format(config_file))
+    return parse_config(doc, config_file, context)
+
+
+def parse_config(doc, config_file, context):
+    """
+    Same as parse_config_file for a configuration which has been read already, e.g. given to api.build.
+
+    :param doc: configuration as a dictionary in the format of presentation_config.yaml. It is changed: default
+        values are added to it.
+    :param config_file: name of the configuration in the messages
+    """
+    missing = [key for key in (settings.files, settings.first_slide, settings.other_slides)
+               if not isinstance(doc, dict) or key not in doc]
+    if missing:
+        settings.logger.error("{} missing from {}.".format(", ".join(missing), config_file))
+        exiting(ConfigError, "{} missing from {}".format(", ".join(missing), config_file))
+
+    code_dir = context.code_dir
+    build_dir = context.build_dir
+    params_dict = []
+    params = []
+    ending = []
+    last_slide_content = []
+    config = doc
+
+    for k, v in doc.items():
+        if k == settings.presentation_start:
+            try:
+                for keys, values in v.items():
+                    params.append(":{}: {}\n".format(keys, values))
+            except KeyError as e:
+                settings.logger.error("Missing keys in presentation_start. Error message: {}".format(e))
+                exiting(ConfigError, "Missing keys in presentation_start: {}".format(e))
+        if k == settings.files:
+            if config.get(settings.files) and config[settings.files].get(settings.css):
+                # relative to the course like the other paths of the configuration
+                css_path = context.path(config[settings.files].get(settings.css))
+                css_path = str(handle_css(build_dir, code_dir, css_path))
+                params.append(":{}: {}\n".format("css", css_path))
             else:
-                if k == settings.last_slide:
-                    # does not append ending to the params, makes it
-                    # easier to get later when writing ending
-                    if settings.content in v:
-                        last_slide_content = doc.get(settings.last_slide)[settings.content]
-                    if settings.slide_class in v:
-                        ending.append(":{}: {}\n".format("class", doc.get(settings.last_slide)[settings.slide_class]))
-        config = set_defaults(config, config_file, css_path)
-        file_to_write = config[settings.files][settings.filename]
+                # if css is not set. It will be set up in set_defaults function
+                css_path = str(handle_css(build_dir, code_dir, None))
+                params.append(":{}: {}\n".format("css", css_path))
+
+        if k == 'slide_options':
+            try:
+                for keys, values in v.items():
+                    params.append(":{}: {}\n".format(keys, values))
+            except KeyError:
+                settings.logger.error("{} missing from slide_options in {}.".format(keys, Path(config_file).name))
+                exiting(ConfigError, "{} missing from slide_options".format(keys))
+
+            params_dict.append(v)
+
+        if k == settings.header_footer:
+            if not doc[settings.header_footer].get(settings.header):
+                config[settings.header_footer][settings.header] = " "
+            if not doc[settings.header_footer].get(settings.footer):
+                config[settings.header_footer][settings.footer] = " "
+            params.append("\n{}\n\n".format(".. header::"))
+            params.append("\n{}\n\n".format("      " + doc.get(settings.header_footer).get(settings.header)))
+            params.append("\n{}\n\n".format(".. footer::"))
+            params.append("\n{}\n\n".format("      " + doc.get(settings.header_footer).get(settings.footer)))
+
+            if not doc[settings.header_footer].get(settings.header_visible):
+                # make header disappear
+                context.header_visible = False
+            if not doc[settings.header_footer].get(settings.footer_visible):
+                # make footer disappear
+                context.footer_visible = False
+        elif k == settings.first_slide:
+            # getting transitions for easier access
+            transition = v
+        elif k == settings.other_slides:
+            other_transitions = v
+        else:
+            if k == settings.last_slide:
+                # does not append ending to the params, makes it
+                # easier to get later when writing ending
+                if settings.content in v:
+                    last_slide_content = doc.get(settings.last_slide)[settings.content]
+                if settings.slide_class in v:
+                    ending.append(":{}: {}\n".format("class", doc.get(settings.last_slide)[settings.slide_class]))
+    config = set_defaults(config, config_file, css_path, context.base_dir)
+    file_to_write = config[settings.files][settings.filename]
 
     return params, config, params_dict, file_to_write, ending, last_slide_content, transition, other_transitions
 
 
-def set_defaults(config, config_path, css_path):
+def set_defaults(config, config_path, css_path, base_dir):
     """
     Set default values if other values are not used.
     :param css_path:
     :param config_path:
     :param config:
+    :param base_dir: default course path
     :return:
     """
     master_key = settings.files
@@ -563,7 +492,7 @@ def set_defaults(config, config_path, css_path):
     default_hovercraft_target_dir = settings.default_hovercraft_target_dir
     default_course_rounds = settings.default_course_rounds
     default_rst2pdf = settings.default_rst2pdf
-    default_course_path = str(Path.cwd())
+    default_course_path = str(base_dir)
     default_language = settings.default_language
     defaults = {settings.filename: default_filename, settings.css: default_css,
                 settings.course_path: default_course_path, settings.make_pdf: default_make_pdf,
@@ -606,12 +535,120 @@ def set_defaults(config, config_path, css_path):
     return config
 
 
+@contextmanager
+def extraction_errors(file):
+    """
+    Stops the build with an error message if extracting POIs from file fails.
+    """
+    try:
+        yield
+    except PermissionError as pe:
+        settings.logger.error("Permission error while handling {}\nError: {}".format(file, pe))
+        exiting(CourseError, "Permission error while handling {}".format(file))
+    except FileNotFoundError as fnf:
+        settings.logger.error("{} was not found.\nError: {}".format(file, fnf))
+        exiting(CourseError, "{} was not found".format(file))
+    except Exception as err:
+        settings.logger.error("Error occurred during write_poi function.\nError: {}".format(err))
+        exiting(CourseError, "Extracting slides from {} failed: {}".format(file, err))
+
+
+def extract_fragments(paths, image_index, other_transitions, image_dir, cache, jobs=1, verbose=False):
+    """
+    Extracts POIs from all the rst-files. Cached slides are used if the file has not changed.
+    If jobs is more than 1, files that are not in the cache are extracted in parallel processes.
+
+    :param image_dir: directory of the presentation RST, see extract_poi
+
+    :return: list of PoiFragments in the same order as paths.
+    """
+    keys = [None] * len(paths)
+    fragments = [None] * len(paths)
+    missing = []
+    for i, file in enumerate(paths):
+        with extraction_errors(file):
+            keys[i] = cache.create_key(file)
+            fragments[i] = cache.get(keys[i])
+        if fragments[i] is None:
+            missing.append(i)
+        elif verbose:
+            settings.logger.info("Using cached slides of {}".format(file))
+
+    if jobs > 1 and len(missing) > 1:
+        # multiprocessing is imported only when it is used
+        from concurrent.futures import ProcessPoolExecutor
+
+        settings.logger.info("Extracting {} files in {} processes.".format(len(missing), jobs))
+        # image index is pickled once per chunk, not once per file
+        chunksize = max(1, len(missing) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # spans of the worker processes are added to the build report
+            results = profiling.results(executor.map(profiling.worker(extract_poi), [paths[i] for i in missing],
+                                                     repeat(image_index), repeat(other_transitions),
+                                                     repeat(image_dir), chunksize=chunksize))
+            for i in missing:
+                with extraction_errors(paths[i]):
+                    fragments[i] = next(results)
+    else:
+        for i in missing:
+            with extraction_errors(paths[i]):
+                fragments[i] = extract_poi(paths[i], image_index, other_transitions, image_dir)
+
+    for i in missing:
+        cache.put(keys[i], fragments[i])
+    return fragments
+
+
+def create_poi_cache(other_transitions, image_index, image_dir, context):
+    """
+    Extracted slides are cached by the content of the rst-file and settings which affect the extraction.
+
+    :param image_dir: directory of the presentation RST, see extract_poi
+    :return: PoiCache
+    """
+    return PoiCache(context.cache_path(settings.poi_cache_dir),
+                    poi_cache.create_config_key(other_transitions, image_index.version, image_dir))
+
+
+def presentation_text(raw_dict, param, fragments, ending, last_slide_content, transition, context):
+    """
+    Writes the presentation from the extracted slides. Ending contains last slide and transitions to it.
+    Basically anything that is in last_slide in presentation_config.yaml.
+
+    :return: tuple (presentation as hovercraft RST, presentation as rst2pdf RST, image paths used in the
+        presentation)
+    """
+    writer = io.StringIO()
+    pdf_writer = io.StringIO()
+    # fragments are written in the course order
+    # first_slide keeps track if it is on the first slide or not
+    first_slide = True
+    # for the image paths in the presentation
+    img_list = []
+    writer.writelines(param)
+    for fragment in fragments:
+        first_slide = write_fragment(writer, fragment, first_slide, transition, raw_dict, img_list, context,
+                                     pdf_writer)
+    writer.writelines(ending)
+    writer.writelines(last_slide_content)
+    # last slide is written by the user, so it is converted line by line
+    pdf_writer.writelines(create_pdf.rst2pdf_lines("".join(last_slide_content).splitlines(True),
+                                                   first_title_reached=True, title_done=not first_slide))
+    return writer.getvalue(), pdf_writer.getvalue(), img_list
+
+
 def write_rst(raw_dict, param, file_to_write, paths, ending, last_slide_content, transition, other_transitions,
-              course_path, step_num):
-    """ Writes rst-file."""
+              course_path, step_num, context, snapshot=None, jobs=1, pdf_file=None, image_index=None):
+    """
+    Writes rst-file.
+
+    :param pdf_file: path of the rst2pdf RST, which is written from the same slides, or None
+    :param image_index: ImageIndex of the course, created from the course images if None
+    """
     settings.logger.info("Creating {}".format(file_to_write))
-    # find paths for images
-    img_paths = create_img_path_list(course_path)
+    # find paths for images. Index is built once and used for every image in the presentation.
+    if image_index is None:
+        image_index = create_image_index(course_path, snapshot)
     presentation_dir = Path(file_to_write).parent
 
     if not presentation_dir.exists():
@@ -619,34 +656,74 @@ def write_rst(raw_dict, param, file_to_write, paths, ending, last_slide_content,
         settings.logger.info("Creating directory {}".format(presentation_dir))
         create_dir(Path(file_to_write).parent)
 
+    cache = create_poi_cache(other_transitions, image_index, presentation_dir, context)
+    fragments = extract_fragments(paths, image_index, other_transitions, presentation_dir, cache, jobs,
+                                  context.verbose)
+    cache.evict()
+    settings.logger.info("Slides of {} files extracted, {} files taken from the cache.".format(
+        cache.misses, cache.hits))
+    profiling.count("rst_files", len(paths))
+    profiling.count("cache_hits", cache.hits)
+    profiling.count("cache_misses", cache.misses)
+
+    text, pdf_text, img_list = presentation_text(raw_dict, param, fragments, ending, last_slide_content, transition,
+                                                 context)
+    if profiling.enabled():
+        profiling.count("slides", count_slides(text))
+        profiling.count("images", len(set(img_list)))
     with open(file_to_write, 'w') as writer:
-        writer.writelines(param)
-
-    # for loop goes thought the list of rst files in the project and extract POIs
-    # first_slide keeps track if it is on the first slide or not
-    first_slide = True
-    # for the image paths in the presentation
-    img_list = []
-    for file in paths:
-        try:
-            first_slide, img_list = write_poi(file, file_to_write, transition, first_slide, img_paths,
-                                              other_transitions, raw_dict, step_num, img_list)
-        except PermissionError as pe:
-            settings.logger.error("Permission error while handling {}\nError: {}".format(file, pe))
-            exiting()
-        except FileNotFoundError as fnf:
-            settings.logger.error("{} was not found.\nError: {}".format(file, fnf))
-            exiting()
-        except Exception as err:
-            settings.logger.error("Error occurred during write_poi function.\nError: {}".format(err))
-            exiting()
-    write_ending(file_to_write, ending, last_slide_content)
+        writer.write(text)
     settings.logger.info("\n{} is created.".format(file_to_write))
+    if pdf_file:
+        with open(str(pdf_file), 'w') as writer:
+            writer.write(pdf_text)
+        settings.logger.info("{} is created.".format(pdf_file))
 
     return img_list
 
 
-def selected_rounds(dictionary):
+def create_image_index(course_path, snapshot=None):
+    """
+    :return: ImageIndex of the images in the course directory
+    """
+    with profiling.stage("image_index"):
+        return ImageIndex(create_img_path_list(course_path, snapshot))
+
+
+def is_transition(lines, index):
+    """
+    :return: True if the line is a transition (----) between slides. Transitions have blank lines around them, so
+        title underlines are not transitions.
+    """
+    return (re.match(r"^-{4,}$", lines[index].rstrip("\n")) is not None
+            and (index == 0 or not lines[index - 1].strip())
+            and (index + 1 == len(lines) or not lines[index + 1].strip()))
+
+
+def split_slides(text):
+    """
+    Splits the presentation RST at the transitions written before each slide, see write_slide.
+
+    :return: tuple (text before the first slide, [text of each slide]). Texts of the slides do not have the
+        transition lines.
+    """
+    lines = text.splitlines(True)
+    starts = [index for index in range(len(lines)) if is_transition(lines, index)]
+    if not starts:
+        return text, []
+    slides = ["".join(lines[start + 1:end]) for start, end in zip(starts, starts[1:] + [len(lines)])]
+    return "".join(lines[:starts[0]]), slides
+
+
+def count_slides(text):
+    """
+    :return: number of slides in the presentation RST
+    """
+    # presentation without transitions is one slide
+    return len(split_slides(text)[1]) or 1
+
+
+def selected_rounds(dictionary, verbose=False):
     """
     Select which rounds will be included in presentation.
     Gets rounds from dictionary and creates a list of numbers from that data.
@@ -687,7 +764,7 @@ def selected_rounds(dictionary):
         # filtering same numbers. Changing variable to set and back to list.
         parsed_rounds = set(parsed_rounds)
         parsed_rounds = list(parsed_rounds)
-        if settings.verbose:
+        if verbose:
             if parsed_rounds == [-1]:
                 settings.logger.info("all rounds included in the presentation")
             else:
@@ -730,16 +807,41 @@ def cmd_line_parsing():
     file_group.add_argument("-p", "--pdf", action="store_true", help="enable pdf creation")
     file_group.add_argument("-m", "--html2pdf", action="store_true", help="enables deck2pdf (html to pdf) as a pdf "
                                                                           "creation method")
+    file_group.add_argument("--pdf-shards", type=int, metavar="N",
+                            help="render the pdf with N deck2pdf processes, each rendering a part of the presentation")
+    file_group.add_argument("--pdf-chunk-size", type=int, metavar="K",
+                            help="render the rst2pdf pdf in cached chunks of K slides, so only the changed chunks "
+                                 "are rendered again")
+    file_group.add_argument("--html-per-slide", action="store_true",
+                            help="render the html presentation one slide at a time and cache the rendered slides, so "
+                                 "only the changed slides are rendered again")
     file_group.add_argument("-l", "--language", help="select language for the presentation. e.g. 'en' or 'fi'")
     file_group.add_argument("-r", "--rounds", help="select which course rounds will be included to presentation. e.g. "
                                                    "1-3, 5")
+    file_group.add_argument("--stream-html", action="store_true",
+                            help="rewrite index.html one slide at a time. Uses less memory with very large "
+                                 "presentations")
+    file_group.add_argument("-j", "--jobs", type=int, default=settings.default_jobs,
+                            help="number of processes used to extract slides from rst-files and number of build "
+                                 "stages (e.g. html presentation and pdf) run at the same time")
+    file_group.add_argument("--timings", action="store_true",
+                            help="write wall time, CPU time and peak memory of the build stages to "
+                                 "_build/build_report.json and a Chrome trace to _build/build_trace.json")
+    file_group.add_argument("--profile", action="store_true",
+                            help="same as --timings and run the stages with cProfile. Profiles are written to "
+                                 "_build/profile")
+    file_group.add_argument("--force", action="store_true",
+                            help="create the presentation even if the course, configuration and outputs have not "
+                                 "changed since the last build")
+    file_group.add_argument("-w", "--watch", action="store_true",
+                            help="keep running and create the presentation again when the course files, images or "
+                                 "the configuration file change")
     parser.add_argument("-d", "-direct", metavar="<name of presentation.rst>", help="creates presentation directly "
                                                                                     "from available (hovercraft "
                                                                                     "compatible) RST-file.")
     args = parser.parse_args()
 
     if args.verbose:
-        settings.verbose = True
         settings.logger.info("Following parameters were used:")
         for arg in vars(args):
             if getattr(args, arg):
@@ -781,6 +883,12 @@ def set_parameters(dictionary, args, params):
             dictionary[settings.files][settings.course_rounds] = args.rounds
         if args.html2pdf:
             dictionary[settings.files][settings.rst2pdf] = False
+        if args.pdf_shards:
+            dictionary[settings.files][settings.pdf_shards] = args.pdf_shards
+        if args.pdf_chunk_size:
+            dictionary[settings.files][settings.pdf_chunk_size] = args.pdf_chunk_size
+        if args.html_per_slide:
+            dictionary[settings.files][settings.html_per_slide] = True
         if args.course_path:
             dictionary[settings.files][settings.course_path] = args.course_path
         if args.config_path:
@@ -818,7 +926,84 @@ def create_dir(directory):
         Path(directory).mkdir(parents=True, exist_ok=True)
 
 
-def create_presentation(args):
+def find_config_path(args, context):
+    """
+    :return: path to the configuration file given in command-line or the default one.
+    """
+    if args.config_path:
+        settings.logger.info("Using presentation configure file at {}".format(args.config_path))
+        return context.path(args.config_path)
+    # default name and path for configuration file
+    config_path = context.path(settings.config_name)
+    settings.logger.info("Using default name and path for configuration file: {}".format(config_path))
+    return config_path
+
+
+def add_output_stages(build, raw_dict, rst_file, context, snapshot=None, jobs=1):
+    """
+    Adds the stages which create html presentation and pdf from the presentation RST. Pipeline needs to have
+    stage "rst" which writes the presentation RST and returns the list of images.
+
+        rst -> images -> hovercraft -> html -> (deck2pdf)
+        rst -> rst2pdf
+
+    rst2pdf RST is written by the rst stage too, see write_rst.
+
+    Hovercraft copies the images too, so it is run after images to avoid writing the same files at the same time.
+
+    :return: folder of the presentation
+    """
+    from presentation_maker import hover
+
+    build_dir = context.build_dir
+    code_dir = context.code_dir
+    presentation_folder = hover.target_folder(raw_dict, build_dir)
+    build.add("images", lambda img_list: hover.handle_images(presentation_folder, rst_file, img_list, snapshot),
+              ["rst"])
+    slide_cache = hover.slide_cache_dir(raw_dict, context)
+    build.add("hovercraft", lambda rst, images: hover.run_hovercraft(rst_file, presentation_folder, slide_cache, jobs),
+              ["rst", "images"])
+    build.add("html", lambda html_file: hover.finish_html(html_file, context), ["hovercraft"])
+
+    pdf_file = create_pdf.clean_filename(rst_file)
+    if not raw_dict.get(settings.files)[settings.make_pdf]:
+        create_pdf.skip_pdf()
+    elif raw_dict.get(settings.files)[settings.rst2pdf]:
+        converted_rst = create_pdf.converted_rst_path(build_dir)
+        chunk_size = create_pdf.pdf_chunk_size(raw_dict)
+        # hovercraft runs at the same time if jobs is more than 1
+        build.add("rst2pdf", lambda rst: create_pdf.rst2pdf_render(converted_rst, pdf_file, code_dir, build_dir,
+                                                                   chunk_size, jobs, jobs > 1), ["rst"])
+    else:
+        def deck2pdf(html, images):
+            create_pdf.deck2pdf_method(presentation_folder, pdf_file, code_dir, build_dir,
+                                       create_pdf.pdf_shard_count(raw_dict))
+            create_pdf.check_pdf(pdf_file, build_dir)
+        build.add("deck2pdf", deck2pdf, ["html", "images"])
+    return presentation_folder
+
+
+def run_pipeline(build, jobs):
+    """
+    Runs the stages of the build and logs their times.
+    """
+    print_spacer()
+    try:
+        build.run(jobs)
+    finally:
+        print_spacer()
+        build.report()
+        print_spacer()
+
+
+def create_context(args):
+    """
+    :return: BuildContext of the command line, paths are relative to the working directory
+    """
+    return BuildContext(Path.cwd(), verbose=args.verbose, stream_html=args.stream_html)
+
+
+def create_presentation(args, context):
     """
     Creates presentation (HTML, PDF) from POIs which are gathered from other RST files.
     Pdf will be created if you enable it from presentation_config.yaml.
@@ -826,46 +1011,130 @@ def create_presentation(args):
     presentation_config.yaml will be copied to the root of course directory where user can change settings.
 
     """
-    code_dir = settings.code_dir
-    build_dir = settings.build_dir
-    working_dir = Path.cwd()
+    build_dir = context.build_dir
     # background image related variables
     step_num = 0
-    # default name and path for configuration file
+    config_path = find_config_path(args[2], context)
 
-    if args[2].config_path:
-        settings.logger.info("Using presentation configure file at {}".format(args[2].config_path))
-        config_path = Path(args[2].config_path)
-    else:
-        config_path = Path(settings.config_name)
-        settings.logger.info("Using default name and path for configuration file: {}".format(working_dir / config_path))
+    if args[2].watch and not args[1]:
+        # presentation is created again when the course files change
+        from presentation_maker import watch
+        watch.run(args[2], config_path, context)
+        return
 
-    params, raw_dict, dictionary, rst_file, ending, last_slide_content, transition, other_transitions = \
-        parse_config_file(code_dir, config_path, build_dir)
-    raw_dict, params = set_parameters(raw_dict, args[2], params)
+    if args[2].timings or args[2].profile:
+        context.recorder = profiling.start(build_dir / profiling.profile_dir_name if args[2].profile else None)
+    try:
+        build_presentation(args, config_path, context, step_num)
+    finally:
+        profiling.finish(build_dir)
+    settings.logger.info("If no errors occurred, presentation should be ready.")
+    settings.logger.info("Exiting...\n")
+
+
+def build_presentation(args, config_path, context, step_num):
+    """
+    Creates presentation from the configuration file and command-line arguments, see create_presentation.
+    """
+    with profiling.stage("config"):
+        params, raw_dict, dictionary, rst_file, ending, last_slide_content, transition, other_transitions = \
+            parse_config_file(config_path, context)
+        raw_dict, params = set_parameters(raw_dict, args[2], params)
 
     if args[1]:
         # if direct create was used (--direct, d). Does not write_rst, uses available rst file to create presentation.
         # other parameters do not affect the output, since given rst file will be used
-        custom_rst_file = args[2].d
-        presentation_folder = hover.run(custom_rst_file, raw_dict)
-        create_pdf.create(raw_dict, custom_rst_file, presentation_folder, build_dir, code_dir)
+        custom_rst_file = str(context.path(args[2].d))
+        from presentation_maker import hover
+        with profiling.stage("html"):
+            presentation_folder = hover.run(custom_rst_file, raw_dict, [], context, jobs=args[2].jobs)
+        with profiling.stage("pdf"):
+            create_pdf.create(raw_dict, custom_rst_file, presentation_folder, context, args[2].jobs)
     else:
-        if args[0]:
-            # if parameters were used
-            rst_file = raw_dict[settings.files][settings.filename]  # needs to be reassigned if it was changed via cmd
-            # arguments
-            course_path = raw_dict[settings.files][settings.course_path]
-            image_list = write_rst(raw_dict, params, rst_file, pathfinder.create_paths(selected_rounds(raw_dict),
-                                   course_path, raw_dict[settings.files][settings.language]), ending,
-                                   last_slide_content, transition, other_transitions, course_path, step_num)
-        presentation_folder = hover.run(rst_file, raw_dict, build_dir, image_list)
-        create_pdf.create(raw_dict, rst_file, presentation_folder, build_dir, code_dir)
-    settings.logger.info("If no errors occurred, presentation should be ready.")
-    settings.logger.info("Exiting...\n")
+        build_course(raw_dict, params, ending, last_slide_content, transition, other_transitions, context,
+                     args[2].jobs, step_num, args[2].force)
+
+
+def build_course(raw_dict, params, ending, last_slide_content, transition, other_transitions, context, jobs=1,
+                 step_num=0, force=False):
+    """
+    Creates presentation RST from the course and the html presentation and pdf from it. Arguments are from
+    parse_config_file.
 
+    Nothing is created if the fingerprint of the build and the output files are the same as after the last successful
+    build, see build_manifest.
 
-def initialization():
+    :param force: create the presentation even if nothing has changed
+    :return: tuple (Pipeline, presentation RST, folder of the presentation). Pipeline has no stages if the build
+        was skipped.
+    """
+    build_dir = context.build_dir
+    # Relative paths are relative to base_dir.
+    rst_file = str(context.path(raw_dict[settings.files][settings.filename]))
+    course_path = str(context.path(raw_dict[settings.files][settings.course_path]))
+    # course directory is walked once, rst-files, images and copied files are looked up from the snapshot
+    with profiling.stage("paths"):
+        snapshot = FileSnapshot(course_path, context.cache_path())
+        settings.logger.info("File index: {} directories read, {} directories unchanged since the last "
+                             "run.".format(snapshot.scanned_dirs, snapshot.reused_dirs))
+        paths = pathfinder.create_paths(selected_rounds(raw_dict, context.verbose), course_path,
+                                        raw_dict[settings.files][settings.language], snapshot, context.verbose)
+    image_index = create_image_index(course_path, snapshot)
+    config = [raw_dict, params, ending, last_slide_content, transition, other_transitions]
+    manifest_file = context.cache_path(settings.build_manifest)
+    with profiling.stage("fingerprint"):
+        manifest = build_manifest.load(manifest_file)
+        fingerprint = build_manifest.create_fingerprint(config, paths, image_index,
+                                                        manifest["images"] if manifest else [], rst_file, context)
+        changes = build_manifest.changes(manifest, fingerprint)
+    build = pipeline.Pipeline(context.verbose)
+    if not changes and not force:
+        settings.logger.info("Nothing has changed since the last build, presentation is up to date. Use --force to "
+                             "create it again.")
+        build.run()
+        return build, rst_file, manifest["presentation_folder"]
+    if context.verbose:
+        settings.logger.info("Creating the presentation: {}".format(", ".join(changes) if changes else "--force"))
+    build_manifest.remove(manifest_file)
+
+    # rst2pdf RST is written from the same slides
+    pdf_rst = create_pdf.converted_rst_path(build_dir) if create_pdf.uses_rst2pdf(raw_dict) else None
+    build.add("rst", lambda: write_rst(raw_dict, params, rst_file, paths, ending, last_slide_content, transition,
+                                       other_transitions, course_path, step_num, context, snapshot, jobs, pdf_rst,
+                                       image_index))
+    # html presentation and pdf are created at the same time if --jobs is more than 1
+    presentation_folder = add_output_stages(build, raw_dict, rst_file, context, snapshot, jobs)
+    run_pipeline(build, jobs)
+    save_manifest(manifest_file, fingerprint, raw_dict, image_index, build.results["rst"], rst_file,
+                  presentation_folder, pdf_rst, context)
+    return build, rst_file, presentation_folder
+
+
+def save_manifest(manifest_file, fingerprint, raw_dict, image_index, img_list, rst_file, presentation_folder, pdf_rst,
+                  context):
+    """
+    Saves the fingerprint of the build and the output files, if all the outputs were created. Sources were hashed
+    before they were read, so a file changed during the build is built again next time.
+
+    :param img_list: image paths used in the slides, returned by write_rst
+    """
+    pdf_file = None
+    if raw_dict[settings.files][settings.make_pdf]:
+        pdf_file = context.build_dir / settings.pdf_folder / create_pdf.clean_filename(rst_file)
+    with profiling.stage("fingerprint"):
+        required, files = build_manifest.output_files(rst_file, presentation_folder, pdf_rst, pdf_file)
+        outputs = build_manifest.stat_files(files)
+        missing = [path for path in required if outputs[str(path)] is None]
+        if missing:
+            settings.logger.warning("Build manifest was not saved, {} was not created.".format(
+                ", ".join(str(path) for path in missing)))
+            return
+        # images used in this build instead of the images of the last build
+        fingerprint["images"] = build_manifest.image_fingerprint(raw_dict, image_index, img_list, rst_file)
+        build_manifest.save(manifest_file, fingerprint, outputs, img_list, presentation_folder)
+
+
+def initialization(context):
     """
     Makes initializations in order to make everything work as easily as possible.
 
@@ -873,17 +1142,37 @@ def initialization():
     """
     settings.logger.info("Making initializations...")
     # creating _build if it is not created yet
-    create_dir(settings.build_dir)
+    create_dir(context.build_dir)
     # config file will be copied to the course root directory for easier access. Especially when using with roman.
-    copy_file(settings.code_dir / settings.config_name, Path(settings.config_name))
+    copy_file(context.code_dir / settings.config_name, context.path(settings.config_name))
     settings.logger.info("Initializations OK.")
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        # presentation_maker serve [options]
+        from presentation_maker import serve
+        serve.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["daemon"]:
+        # presentation_maker daemon [options]
+        from presentation_maker import daemon
+        daemon.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["submit"]:
+        # presentation_maker submit [course_path] [options]. Client does not need the build modules.
+        from presentation_maker import daemon
+        sys.exit(daemon.submit_main(sys.argv[2:]))
     header()
-    initialization()
     cmd_args = cmd_line_parsing()
-    create_presentation(cmd_args)
+    context = create_context(cmd_args[2])
+    try:
+        initialization(context)
+        create_presentation(cmd_args, context)
+    except PresentationMakerError:
+        # errors have been logged already
+        settings.logger.info("Fix errors and try again. Exiting...")
+        sys.exit(2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+"""
+Stage timings, profiles and build report (--timings, --profile).
+
+Parts of the build are wrapped in stage() blocks. When recording is enabled, each block is saved as a span with
+its wall time, CPU time of the thread and peak RSS of the process. count() adds to the counters of the build
+(slides, images, bytes copied, cache hits). Recording is disabled by default and stage() does nothing then.
+
+Each build has its own Recorder (BuildContext.recorder), which is active in the threads running the build, see
+activate(). Functions run in other threads with bind(), e.g. the stages of the pipeline, record to the same
+Recorder. So two builds in the same process do not share their timings.
+
+finish() writes two files to the build directory:
+    build_report.json: total time, times of the stages summed by name, counters
+    build_trace.json: spans as Chrome trace events (chrome://tracing, https://ui.perfetto.dev)
+
+With --profile each stage which is not inside of another stage of the same thread is run with cProfile and
+the profile is saved to _build/profile/<stage>.prof. Spans of worker processes are sent to the main process
+with the results, see worker() and results().
+"""
+
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import settings
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# CPU time of the current thread, thread_time is new in Python 3.7
+thread_time = getattr(time, "thread_time", time.process_time)
+report_name = "build_report.json"
+trace_name = "build_trace.json"
+profile_dir_name = "profile"
+
+
+class Span:
+    __slots__ = ("name", "category", "start", "wall", "cpu", "peak_rss", "pid", "tid", "args")
+
+    def __init__(self, name, category, start, wall, cpu, peak_rss, pid, tid, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_rss = peak_rss
+        self.pid = pid
+        self.tid = tid
+        self.args = args
+
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+class Recorder:
+    """
+    Spans and counters of one build.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = OrderedDict()
+        self.thread_names = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = {}
+
+    def add(self, span, thread_name):
+        with self.lock:
+            self.spans.append(span)
+            self.thread_names.setdefault((span.pid, span.tid), thread_name)
+
+    def count(self, name, amount):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def profile(self, name, profiler):
+        """
+        Adds profile of the stage to the profiles of the same name.
+        """
+        with self.lock:
+            if name in self.profiles:
+                self.profiles[name].add(profiler)
+            else:
+                profiler.create_stats()
+                import pstats
+                self.profiles[name] = pstats.Stats(profiler)
+
+
+# recorder of the build running in the thread, see activate
+active = threading.local()
+
+
+def current():
+    """
+    :return: Recorder of the current thread or None when recording is disabled
+    """
+    return getattr(active, "recorder", None)
+
+
+def enabled():
+    return current() is not None
+
+
+@contextmanager
+def activate(recorder):
+    """
+    Records to recorder in the current thread inside of the block.
+
+    :param recorder: Recorder or None to disable recording
+    """
+    previous = current()
+    active.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        active.recorder = previous
+
+
+def bind(function):
+    """
+    :return: function which records to the recorder of the current thread when it is run in another thread, e.g. by a
+        ThreadPoolExecutor
+    """
+    recorder = current()
+    if recorder is None:
+        return function
+
+    def run(*args, **kwargs):
+        with activate(recorder):
+            return function(*args, **kwargs)
+    return run
+
+
+def start(profile_dir=None):
+    """
+    Enables recording in the current thread.
+
+    :param profile_dir: directory of the cProfile files or None if stages are not profiled
+    :return: Recorder
+    """
+    active.recorder = Recorder(profile_dir)
+    return active.recorder
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in kilobytes, None if not available
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextmanager
+def stage(name, category="stage", **args):
+    """
+    Records the block as a span if recording is enabled.
+
+    :param args: extra information of the span, e.g. file name
+    """
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    local = recorder.local
+    depth = getattr(local, "depth", 0)
+    profiler = None
+    if recorder.profile_dir is not None and depth == 0:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another thread is being profiled (Python 3.12+ allows one profiler at a time)
+            profiler = None
+    local.depth = depth + 1
+    start_time = time.perf_counter()
+    start_cpu = thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start_time
+        cpu = thread_time() - start_cpu
+        local.depth = depth
+        if profiler is not None:
+            profiler.disable()
+            recorder.profile(name, profiler)
+        recorder.add(Span(name, category, start_time, wall, cpu, peak_rss(), os.getpid(), threading.get_ident(),
+                          args), threading.current_thread().name)
+
+
+def count(name, amount=1):
+    """
+    Adds amount to the counter if recording is enabled.
+    """
+    recorder = current()
+    if recorder is not None:
+        recorder.count(name, amount)
+
+
+class WorkerFunction:
+    """
+    Runs function in a worker process and returns its result with the spans, counters and profiles recorded in the
+    worker. perf_counter is a system wide clock on Linux, so the spans of the workers are on the same time line as
+    the spans of the main process.
+    """
+
+    def __init__(self, function, profile_dir):
+        self.function = function
+        self.profile_dir = profile_dir
+
+    def __call__(self, *args):
+        # forked worker has a copy of the parent's recorder
+        with activate(Recorder(self.profile_dir)) as recorder:
+            result = self.function(*args)
+            profiles = {name: stats.stats for name, stats in recorder.profiles.items()}
+            return result, [span.to_tuple() for span in recorder.spans], dict(recorder.counters), profiles
+
+
+def worker(function):
+    """
+    :return: function to run in a worker process. Spans of the worker are recorded too if recording is enabled.
+    """
+    recorder = current()
+    if recorder is None:
+        return function
+    return WorkerFunction(function, recorder.profile_dir)
+
+
+def results(iterable):
+    """
+    Adds spans, counters and profiles of the worker results to the recorder.
+
+    :param iterable: results of the functions returned by worker()
+    :return: generator of results of the functions
+    """
+    recorder = current()
+    if recorder is None:
+        yield from iterable
+        return
+    for result, spans, counters, profiles in iterable:
+        for values in spans:
+            span = Span(*values)
+            recorder.add(span, "worker {}".format(span.pid))
+        for name, amount in counters.items():
+            recorder.count(name, amount)
+        for name, stats in profiles.items():
+            merge_profile(recorder, name, stats)
+        yield result
+
+
+def merge_profile(recorder, name, stats):
+    """
+    Adds pstats data of a worker process to the profiles of recorder.
+    """
+    import pstats
+
+    class WorkerStats:
+        def create_stats(self):
+            pass
+
+    data = WorkerStats()
+    data.stats = stats
+    with recorder.lock:
+        if name in recorder.profiles:
+            recorder.profiles[name].add(data)
+        else:
+            recorder.profiles[name] = pstats.Stats(data)
+
+
+def create_report(recorder):
+    """
+    :return: build report of the recorder as a dictionary
+    """
+    total = time.perf_counter() - recorder.started
+    stages = OrderedDict()
+    for span in sorted(recorder.spans, key=lambda span: span.start):
+        entry = stages.setdefault(span.name, {"category": span.category, "calls": 0, "wall": 0.0, "cpu": 0.0,
+                                              "peak_rss_kb": None})
+        entry["calls"] += 1
+        entry["wall"] += span.wall
+        entry["cpu"] += span.cpu
+        if span.peak_rss is not None:
+            entry["peak_rss_kb"] = max(entry["peak_rss_kb"] or 0, span.peak_rss)
+    for entry in stages.values():
+        entry["wall"] = round(entry["wall"], 6)
+        entry["cpu"] = round(entry["cpu"], 6)
+    return OrderedDict([
+        ("version", 1),
+        ("wall", round(total, 6)),
+        ("peak_rss_kb", peak_rss()),
+        ("stages", stages),
+        ("counters", recorder.counters),
+    ])
+
+
+def create_trace(recorder):
+    """
+    :return: spans of the recorder as Chrome trace events
+    """
+    events = []
+    for (pid, tid), thread_name in recorder.thread_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    for span in recorder.spans:
+        args = dict(span.args, cpu=round(span.cpu, 6))
+        if span.peak_rss is not None:
+            args["peak_rss_kb"] = span.peak_rss
+        events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": span.pid, "tid": span.tid,
+                       # microseconds from the start of the build
+                       "ts": round((span.start - recorder.started) * 10 ** 6, 1),
+                       "dur": round(span.wall * 10 ** 6, 1),
+                       "args": {name: str(value) if isinstance(value, Path) else value
+                                for name, value in args.items()}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def stop():
+    """
+    Disables recording without writing any files.
+
+    :return: build report as a dictionary or None if recording was not enabled
+    """
+    recorder = current()
+    if recorder is None:
+        return None
+    active.recorder = None
+    return create_report(recorder)
+
+
+def finish(build_dir):
+    """
+    Writes the build report, trace and profiles and disables recording.
+
+    :return: path of the build report or None if recording was not enabled
+    """
+    recorder = current()
+    if recorder is None:
+        return None
+    active.recorder = None
+    build_dir = Path(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    report_file = build_dir / report_name
+    with open(str(report_file), "w") as writer:
+        json.dump(create_report(recorder), writer, indent=2)
+    with open(str(build_dir / trace_name), "w") as writer:
+        json.dump(create_trace(recorder), writer)
+    if recorder.profile_dir is not None and recorder.profiles:
+        recorder.profile_dir.mkdir(parents=True, exist_ok=True)
+        for name, stats in recorder.profiles.items():
+            stats.dump_stats(str(recorder.profile_dir / (re.sub(r"[^\w.-]+", "_", name) + ".prof")))
+        settings.logger.info("Profiles written to {}".format(recorder.profile_dir))
+    settings.logger.info("Build report written to {} and trace to {}".format(report_file, build_dir / trace_name))
+    return report_file
@@ -0,0 +1,331 @@
+"""
+Local preview server for the html presentation: presentation_maker serve
+
+Serves the build directory (_build) over HTTP and redirects / to the presentation (_build/<hovercraft_target_dir>),
+since the presentation refers to the images copied next to it (../images). Local videos refer to the _static
+directory of the course (../../_static/videot), so /_static/ is served from the directory next to the build
+directory. Files are sent with sendfile, ETag/If-None-Match lets the browser keep images it already has and byte
+ranges make videos seekable.
+
+Html pages get a small script which listens to /__reload (server-sent events). Open browsers reload the page
+when index.html is created again, e.g. by presentation_maker --watch.
+"""
+
+import argparse
+import mimetypes
+import os
+import re
+import socketserver
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+import yaml
+
+from . import settings
+
+reload_path = "/__reload"
+reload_script = ('<script>new EventSource("{}").addEventListener("reload", function () {{ location.reload(); }});'
+                 '</script>').format(reload_path).encode("utf-8")
+byte_range = re.compile(r"bytes=(\d*)-(\d*)$")
+# local videos of the slides are in the _static directory of the course, see poi_lexer
+static_dir_name = "_static"
+
+
+def find_presentation_dir(config_path):
+    """
+    :return: name of the presentation directory from the configuration file or the default name.
+    """
+    try:
+        with open(str(config_path)) as file:
+            config = yaml.load(file, Loader=yaml.Loader) or {}
+        target_dir = (config.get(settings.files) or {}).get(settings.hovercraft_target_dir)
+    except (OSError, yaml.YAMLError) as e:
+        settings.logger.warning("Could not read {}. Error: {}".format(config_path, e))
+        target_dir = None
+    return target_dir or settings.default_hovercraft_target_dir
+
+
+def find_file(root, path):
+    """
+    :param root: resolved directory which the file must be in
+    :return: path of the file or None if there is no such file in root
+    """
+    file_path = (root / path.lstrip("/")).resolve()
+    if file_path.is_dir():
+        file_path = file_path / "index.html"
+    if root != file_path and root not in file_path.parents:
+        return None
+    if not file_path.is_file():
+        return None
+    return file_path
+
+
+def create_etag(st):
+    return '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+
+
+def parse_range(header, size):
+    """
+    Parses one byte range, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-500".
+
+    :return: tuple (start, end) where end is inclusive, None if header is not a single byte range or
+        False if range is not satisfiable.
+    """
+    match = byte_range.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # last n bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+class ReloadNotifier:
+    """
+    Follows modification time of index.html and wakes up the browsers waiting for reload events.
+    """
+
+    def __init__(self, html_file, interval=None):
+        self.html_file = html_file
+        self.interval = settings.serve_poll_interval if interval is None else interval
+        self.version = 0
+        self.condition = threading.Condition()
+        self.mtime = self.modified()
+
+    def modified(self):
+        try:
+            return os.stat(str(self.html_file)).st_mtime_ns
+        except OSError:
+            return None
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            mtime = self.modified()
+            if mtime is not None and mtime != self.mtime:
+                self.mtime = mtime
+                settings.logger.info("{} changed, reloading browsers.".format(self.html_file))
+                with self.condition:
+                    self.version += 1
+                    self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """
+        :return: current version, which differs from version if the presentation has changed
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of the build directory and the _static directory of the course. Attributes root, static_dir,
+    start_page, notifier and verbose are set by create_server.
+    """
+
+    protocol_version = "HTTP/1.1"
+    root = None
+    static_dir = None
+    start_page = None
+    notifier = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            settings.logger.info("{} - {}".format(self.address_string(), format % args))
+
+    def do_GET(self):
+        self.handle_request(True)
+
+    def do_HEAD(self):
+        self.handle_request(False)
+
+    def handle_request(self, send_body):
+        path = unquote(urlsplit(self.path).path)
+        if path == reload_path:
+            self.send_reload_events()
+            return
+        if path == "/":
+            self.send_response(HTTPStatus.FOUND)
+            self.send_header("Location", self.start_page)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        file_path = self.translate_path(path)
+        if file_path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if file_path.suffix in (".html", ".htm"):
+            self.send_html(file_path, send_body)
+        else:
+            self.send_file(file_path, send_body)
+
+    def translate_path(self, path):
+        """
+        :return: path of the file in the build directory, or in the _static directory of the course if path starts
+            with /_static/, or None if there is no such file.
+        """
+        prefix = "/{}/".format(static_dir_name)
+        if path.startswith(prefix):
+            return find_file(self.static_dir, path[len(prefix):])
+        return find_file(self.root, path)
+
+    def not_modified(self, etag):
+        if self.headers.get("If-None-Match") in (etag, "*"):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return True
+        return False
+
+    def send_html(self, file_path, send_body):
+        """
+        Sends html page with the reload script. Pages are small, so they are read to memory.
+        """
+        with open(str(file_path), "rb") as file:
+            st = os.fstat(file.fileno())
+            etag = create_etag(st)
+            if self.not_modified(etag):
+                return
+            html = file.read()
+        index = html.rfind(b"</body>")
+        if index < 0:
+            index = len(html)
+        html = html[:index] + reload_script + html[index:]
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(html)
+
+    def send_file(self, file_path, send_body):
+        """
+        Sends file or a byte range of it with sendfile.
+        """
+        with open(str(file_path), "rb") as file:
+            st = os.fstat(file.fileno())
+            etag = create_etag(st)
+            if self.not_modified(etag):
+                return
+            start, end = 0, st.st_size - 1
+            status = HTTPStatus.OK
+            header = self.headers.get("Range")
+            # If-Range: range is used only if the file has not changed
+            if header and self.headers.get("If-Range", etag) == etag:
+                requested = parse_range(header, st.st_size)
+                if requested is False:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", "bytes */{}".format(st.st_size))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if requested:
+                    start, end = requested
+                    status = HTTPStatus.PARTIAL_CONTENT
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header("Content-Type", mimetypes.guess_type(str(file_path))[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            # browser asks if the file has changed and gets 304 Not Modified if it has not
+            self.send_header("Cache-Control", "no-cache")
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, st.st_size))
+            self.end_headers()
+            if send_body and length > 0:
+                self.wfile.flush()
+                self.connection.sendfile(file, start, length)
+
+    def send_reload_events(self):
+        """
+        Keeps the connection open and sends reload event when the presentation changes.
+        """
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.close_connection = True
+        version = self.notifier.version
+        try:
+            while True:
+                current = self.notifier.wait(version, settings.serve_keepalive)
+                if current != version:
+                    self.wfile.write(b"event: reload\ndata: reload\n\n")
+                    version = current
+                else:
+                    # comment line keeps the connection open
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class PreviewServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_server(build_dir, presentation_dir, host, port, verbose=False):
+    """
+    :return: PreviewServer, which has not been started yet
+    """
+    root = Path(build_dir).resolve()
+    html_file = root / presentation_dir / "index.html"
+    notifier = ReloadNotifier(html_file)
+    threading.Thread(target=notifier.run, daemon=True).start()
+    handler = type("Handler", (PreviewHandler,), {
+        "root": root,
+        # local videos refer to the course directory, ../../_static from the presentation
+        "static_dir": root.parent / static_dir_name,
+        "start_page": "/{}/".format(Path(presentation_dir).as_posix().strip("/")),
+        "notifier": notifier,
+        "verbose": verbose,
+    })
+    return PreviewServer((host, port), handler)
+
+
+def main(argv=None):
+    """
+    Runs the preview server until interrupted.
+    """
+    parser = argparse.ArgumentParser(prog="presentation_maker serve",
+                                     description="Serve the html presentation and reload it in the browser when it "
+                                                 "is created again.")
+    parser.add_argument("-y", "--config_path", default=settings.config_name,
+                        help="path to the configuration file (presentation_config.yaml)")
+    parser.add_argument("-b", "--build_dir", default=settings.build_dir_name, help="path to the build directory")
+    parser.add_argument("--host", default=settings.serve_host, help="address to listen to")
+    parser.add_argument("--port", type=int, default=settings.serve_port, help="port to listen to")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the requests")
+    args = parser.parse_args(argv)
+
+    presentation_dir = find_presentation_dir(args.config_path)
+    server = create_server(args.build_dir, presentation_dir, args.host, args.port, args.verbose)
+    settings.logger.info("Serving {} at http://{}:{}/ Press Ctrl+C to stop.".format(
+        Path(args.build_dir) / presentation_dir, args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        settings.logger.info("Stopped serving.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,19 @@ import logging
 
 # paths
 code_dir = Path(__file__).resolve().parent
-build_dir = Path(Path.cwd() / "_build")
+# build directory inside of the directory presentation_maker is run in, see BuildContext
+build_dir_name = "_build"
+
+# directories which are skipped when course directory is searched for images and rst-files.
+# Directories which have ignored_dir_pattern in their name are skipped too, e.g. _build.
+ignored_dirs = (".git", ".hg", ".svn", "__pycache__", "node_modules")
+ignored_dir_pattern = "build"
 
 not_in_slides = ":not_in_slides"
 poi = 'point-of-interest::'
 newcol = "::newcol"
+# ::newcol is written to the hovercraft RST as this directive
+newcol_directive = "newcol"
 note = ".. note::"
 
 # language settings
@@ -22,21 +30,6 @@ default_language = "fi"
 # for the variable name
 language = "language"
 
-# verbose, set true with verbose command line parameter.
-verbose = False
-
-# like global variables. Flags for columns and background images.
-columns = False
-bg_img = False
-
-# has column width ratios for each slide that has columns and is included in slides. ["5 1 2", "3 1", ...]
-column_ratios = []
-col_step = 0
-
-# headers and footer visibility
-header_visible = True
-footer_visible = True
-
 # logger setup
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -61,15 +54,65 @@ default_hovercraft_target_dir = "presentation"
 default_overwrite_earlier_versions = True
 default_course_rounds = "all"
 default_rst2pdf = True
+default_jobs = 1
+# watch mode: seconds between checks when inotify is not available, seconds to wait for more changes after a change
+watch_poll_interval = 0.2
+watch_settle_time = 0.05
+# preview server (presentation_maker serve). Seconds between index.html checks and keepalive messages.
+serve_host = "127.0.0.1"
+serve_port = 8000
+serve_poll_interval = 0.25
+serve_keepalive = 15
+# build daemon (presentation_maker daemon). Number of worker processes, maximum number of jobs waiting in the queue,
+# number of finished jobs kept for the clients and maximum seconds a client waits for a job in one request.
+daemon_host = "127.0.0.1"
+daemon_port = 8010
+daemon_workers = 2
+daemon_queue_size = 32
+daemon_history = 200
+daemon_wait = 30
 # default_course_path is defined in presentation_maker set_defaults function
 
 # if deck2pdf directory name changes. Change it here too.
 deck2pdf_dir_name = "deck2pdf-0.3.0"
+# deck2pdf: number of processes rendering parts of the presentation, seconds before a process is killed and how many
+# times a failed part is rendered again
+default_pdf_shards = 1
+deck2pdf_timeout = 600
+deck2pdf_retries = 1
+pdf_shard_name = "index_shard_{:02d}.html"
+# rst2pdf: run in the same process if rst2pdf can be imported. Maximum section level that starts a new page, if page
+# breaking fails try using 1 or 3 instead of 2.
+rst2pdf_in_process = True
+rst2pdf_break_level = 2
+# rst2pdf: when the stages of the build run in parallel, run rst2pdf in a warm worker process, so that hovercraft does
+# not wait for it. Worker processes of the daemon render in their own thread.
+rst2pdf_worker_process = True
+# rst2pdf: number of slides rendered together, 0 renders the whole presentation at once. Rendered chunks are cached.
+default_pdf_chunk_size = 0
+pdf_chunk_name = "converted_rst_chunk_{:03d}.rst"
+# html: render each slide of the presentation RST alone and cache the rendered slides. Lines before the first slide
+# are written to html_frame_name next to the presentation RST while they are rendered.
+default_html_per_slide = False
+html_frame_name = "presentation_frame.rst"
 
 pdf_folder = "pdf"
 
 converted_rst_filename = "converted_rst.rst"
 
+# caches are saved inside of the build directory
+cache_dir = ".cache"
+file_index_cache = "file_index.json.gz"
+# extracted slides of each rst-file. Least recently used files are deleted when cache is larger than max size (bytes)
+poi_cache_dir = "poi"
+poi_cache_max_size = 64 * 1024 * 1024
+rst2pdf_cache_dir = "rst2pdf"
+rst2pdf_cache_max_size = 256 * 1024 * 1024
+html_cache_dir = "html"
+html_cache_max_size = 64 * 1024 * 1024
+# fingerprint and output files of the last successful build, build is skipped if nothing has changed
+build_manifest = "build_manifest.json"
+
 # config variable names - these are used in multiple places. If you change some of the variable values here. You must
 # also change the corresponding value in the presentation_config.yaml.
 presentation_start = "presentation_start"
@@ -94,6 +137,9 @@ hovercraft_target_dir = "hovercraft_target_dir"
 overwrite_earlier_versions = "overwrite_earlier_versions"
 course_rounds = "course_rounds"
 rst2pdf = "rst2pdf"
+pdf_shards = "pdf_shards"
+pdf_chunk_size = "pdf_chunk_size"
+html_per_slide = "html_per_slide"
 
 header_footer = "header_footer"
 header = "header"
@@ -0,0 +1,171 @@
+"""
+Streaming rewriter for index.html. Used instead of hover.post_process for very large presentations.
+
+index.html is read in chunks with an event based HTML parser and written to a new file while it is read.
+Only one step (div.step) is kept in memory at a time. Each step is parsed as its own small soup and
+background images and link targets are added to it. Header, footer, links and bootstrap outside
+of the steps are changed without parsing them into a tree.
+
+Output is not prettified.
+"""
+
+import os
+from html import escape
+from html.parser import HTMLParser
+from pathlib import Path
+
+from bs4 import BeautifulSoup as bs
+
+from . import settings
+
+chunk_size = 64 * 1024
+hidden = "visibility: hidden;"
+bootstrap_attrs = [("crossorigin", "anonymous"),
+                   ("href", "https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/css/bootstrap.min.css"),
+                   ("integrity", "sha384-Vkoo8x4CGsO3+Hhxv8T/Q5PaXtkKtu6ug5TOeNV6gBiFeWPGFN9MuhOf23Q9Ifjh"),
+                   ("rel", "stylesheet")]
+
+
+def start_tag(tag, attrs, self_closing=False):
+    """
+    :return: start tag as a string, e.g. <a href="link" target="_blank">
+    """
+    parts = [tag]
+    for name, value in attrs:
+        if value is None:
+            parts.append(name)
+        else:
+            parts.append('{}="{}"'.format(name, escape(value, quote=True)))
+    return "<{}{}>".format(" ".join(parts), "/" if self_closing else "")
+
+
+def set_attr(attrs, name, value):
+    """
+    :return: attrs where name is set to value.
+    """
+    return [(n, v) for n, v in attrs if n != name] + [(name, value)]
+
+
+class StepRewriter(HTMLParser):
+    """
+    Copies html to out and rewrites it one step at a time. Background images, header and footer visibility are
+    taken from the BuildContext.
+    """
+
+    def __init__(self, out, context):
+        super().__init__(convert_charrefs=False)
+        self.out = out
+        self.context = context
+        # raw html of the current step, None when not inside of a step
+        self.step = None
+        # depth of div tags inside of the current step
+        self.depth = 0
+        self.in_head = False
+        self.bootstrap_added = False
+        self.steps = 0
+
+    def write(self, text):
+        if self.step is None:
+            self.out.write(text)
+        else:
+            self.step.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self.handle_tag(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_tag(tag, attrs, True)
+
+    def handle_tag(self, tag, attrs, self_closing):
+        raw = self.get_starttag_text()
+        if self.step is not None:
+            # links inside of the steps are changed when the step is rewritten
+            if tag == "div":
+                self.depth += 1
+            self.step.append(raw)
+            return
+        classes = (dict(attrs).get("class") or "").split()
+        if tag == "div" and "step" in classes:
+            self.step = [raw]
+            self.depth = 1
+            return
+        if tag == "head":
+            self.in_head = True
+        elif tag == "a":
+            raw = start_tag(tag, set_attr(attrs, "target", "_blank"), self_closing)
+        elif tag == "div" and (("header" in classes and not self.context.header_visible)
+                               or ("footer" in classes and not self.context.footer_visible)):
+            raw = start_tag(tag, set_attr(attrs, "style", hidden), self_closing)
+        self.out.write(raw)
+        if tag == "link" and self.in_head and not self.bootstrap_added:
+            self.bootstrap_added = True
+            settings.logger.info("Adding bootstrap styles to hovercraft.")
+            self.out.write(start_tag("link", bootstrap_attrs, True))
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.in_head = False
+        self.write("</{}>".format(tag))
+        if self.step is not None and tag == "div":
+            self.depth -= 1
+            if self.depth == 0:
+                html = "".join(self.step)
+                self.step = None
+                self.out.write(self.rewrite_step(html))
+
+    def handle_data(self, data):
+        self.write(data)
+
+    def handle_entityref(self, name):
+        self.write("&{};".format(name))
+
+    def handle_charref(self, name):
+        self.write("&#{};".format(name))
+
+    def handle_comment(self, data):
+        self.write("<!--{}-->".format(data))
+
+    def handle_decl(self, decl):
+        self.write("<!{}>".format(decl))
+
+    def handle_pi(self, data):
+        self.write("<?{}>".format(data))
+
+    def unknown_decl(self, data):
+        self.write("<![{}]>".format(data))
+
+    def rewrite_step(self, html):
+        """
+        Parses one step and adds background image and link targets to it.
+
+        :return: rewritten step as a string
+        """
+        self.steps += 1
+        soup = bs(html, 'html.parser')
+        step = soup.find('div')
+        if self.context.bg_img and step.get('bgimg'):
+            step['style'] = "background-image: url(" + step['bgimg'] + ");"
+            del step['bgimg']
+        for link in soup.find_all('a'):
+            link['target'] = "_blank"
+        return str(soup)
+
+
+def rewrite(html_file, context):
+    """
+    Rewrites html file one step at a time. Result is written to a temporary file which replaces html_file.
+
+    :param context: BuildContext of the presentation
+    """
+    html_file = Path(html_file)
+    temporary = html_file.with_name(html_file.name + ".tmp")
+    with open(str(html_file)) as reader, open(str(temporary), "w") as writer:
+        rewriter = StepRewriter(writer, context)
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            rewriter.feed(chunk)
+        rewriter.close()
+    os.replace(str(temporary), str(html_file))
+    settings.logger.info("{} steps rewritten.".format(rewriter.steps))
@@ -0,0 +1,375 @@
+"""
+Watch mode (--watch). Creates the presentation and keeps running. When the course files change, only the parts of
+the presentation which depend on the changed files are created again:
+
+    rst-file: slides of the changed files are extracted again, other slides are kept in memory. Hovercraft and pdf
+        creation are run only if the presentation RST changed.
+    image: image is copied to the presentation again.
+    configuration file, css or index.rst: whole presentation is created again.
+
+Changes are noticed with inotify on Linux. Other systems poll the modification times of the watched files.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from pathlib import Path
+
+from . import presentation_maker as pm
+from . import create_pdf
+from . import hover
+from . import pathfinder
+from . import settings
+from .errors import PresentationMakerError
+from .file_snapshot import FileSnapshot
+from .image_index import ImageIndex
+
+# inotify flags, see inotify(7)
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+watch_mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+event_header = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """
+    Notices changes by comparing modification times and sizes of the files.
+    """
+
+    def __init__(self, files, interval=None):
+        self.interval = settings.watch_poll_interval if interval is None else interval
+        self.states = {}
+        self.watch(files)
+
+    @staticmethod
+    def state(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @property
+    def files(self):
+        return set(self.states)
+
+    def watch(self, files):
+        self.states = {path: self.states[path] if path in self.states else self.state(path) for path in files}
+
+    def changes(self, timeout):
+        """
+        :return: set of changed files or empty set if nothing changed before timeout
+        """
+        end = time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, old in self.states.items():
+                new = self.state(path)
+                if new != old:
+                    self.states[path] = new
+                    changed.add(path)
+            if changed or time.monotonic() >= end:
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Notices changes with inotify. Directories of the files are watched, so files which editors replace
+    (write to a temporary file and rename) are noticed too.
+    """
+
+    def __init__(self, files, libc):
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # {watch descriptor: directory}
+        self.dirs = {}
+        self.files = set()
+        self.watch(files)
+
+    def watch(self, files):
+        self.files = set(files)
+        watched = set(self.dirs.values())
+        for directory in {os.path.dirname(path) for path in self.files} - watched:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), watch_mask)
+            if wd < 0:
+                settings.logger.warning("Could not watch directory {}".format(directory))
+                continue
+            self.dirs[wd] = directory
+
+    def read_events(self):
+        """
+        :return: set of watched files which had events
+        """
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            directory = self.dirs.get(wd)
+            if directory is not None and name:
+                path = os.path.join(directory, os.fsdecode(name))
+                if path in self.files:
+                    changed.add(path)
+        return changed
+
+    def changes(self, timeout):
+        """
+        :return: set of changed files or empty set if nothing changed before timeout
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        return self.read_events()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(files):
+    """
+    :return: InotifyWatcher on Linux, PollingWatcher if inotify is not available
+    """
+    if sys.platform.startswith("linux"):
+        name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(name, use_errno=True)
+            if hasattr(libc, "inotify_init1"):
+                return InotifyWatcher(files, libc)
+        except OSError as e:
+            settings.logger.warning("inotify is not available, polling files instead. Error: {}".format(e))
+    return PollingWatcher(files)
+
+
+def wait_for_changes(watcher):
+    """
+    Waits until files change. Changes which happen soon after the first one are collected too, since editors
+    may write a file more than once when it is saved.
+
+    :return: set of changed files
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.changes(1.0)
+    while True:
+        more = watcher.changes(settings.watch_settle_time)
+        if not more:
+            return changed
+        changed |= more
+
+
+class IncrementalBuild:
+    """
+    State of the presentation between rebuilds. Extracted slides are kept in memory by the rst-file.
+    """
+
+    def __init__(self, args, config_path, context):
+        self.args = args
+        self.config_path = config_path
+        self.context = context
+        self.presentation_folder = None
+        self.raw_dict = None
+        self.paths = []
+        self.text = None
+        self.pdf_text = None
+        self.img_list = []
+        # {rst-file: PoiFragment}
+        self.fragments = {}
+        self.image_index = None
+
+    def load(self):
+        """
+        Reads the configuration file and finds the rst-files of the course.
+        """
+        self.context.reset()
+        (self.params, self.raw_dict, _, _, self.ending, self.last_slide_content, self.transition,
+         self.other_transitions) = pm.parse_config_file(self.config_path, self.context)
+        self.raw_dict, self.params = pm.set_parameters(self.raw_dict, self.args, self.params)
+        files = self.raw_dict[settings.files]
+        self.rst_file = str(self.context.path(files[settings.filename]))
+        self.course_path = str(self.context.path(files[settings.course_path]))
+        self.language = files[settings.language]
+        self.snapshot = FileSnapshot(self.course_path, self.context.cache_path())
+        self.paths = pathfinder.create_paths(pm.selected_rounds(self.raw_dict, self.context.verbose),
+                                             self.course_path, self.language, self.snapshot, self.context.verbose)
+        self.fragments = {}
+        self.image_index = None
+
+    def extract(self, changed=()):
+        """
+        Extracts slides of the changed rst-files and rst-files which are not in memory yet.
+        """
+        image_index = ImageIndex(pm.create_img_path_list(self.course_path, self.snapshot))
+        if self.image_index is None or image_index.version != self.image_index.version:
+            # images were added or removed, image paths of the slides may change
+            self.fragments = {}
+        self.image_index = image_index
+        image_dir = Path(self.rst_file).parent
+        cache = pm.create_poi_cache(self.other_transitions, image_index, image_dir, self.context)
+        missing = [path for path in self.paths if path in changed or path not in self.fragments]
+        for path, fragment in zip(missing, pm.extract_fragments(missing, image_index, self.other_transitions,
+                                                                image_dir, cache, self.args.jobs,
+                                                                self.context.verbose)):
+            self.fragments[path] = fragment
+        cache.evict()
+        settings.logger.info("Slides of {} files extracted, {} files taken from the cache.".format(
+            cache.misses, cache.hits))
+
+    def write(self):
+        """
+        Writes presentation RST if it changed.
+
+        :return: True if presentation RST changed
+        """
+        # background images are found again from the slides
+        self.context.bg_img = False
+        text, self.pdf_text, self.img_list = pm.presentation_text(self.raw_dict, self.params,
+                                                   [self.fragments[path] for path in self.paths], self.ending,
+                                                   self.last_slide_content, self.transition, self.context)
+        if text == self.text:
+            settings.logger.info("{} did not change.".format(self.rst_file))
+            return False
+        pm.create_dir(Path(self.rst_file).parent)
+        with open(self.rst_file, 'w') as writer:
+            writer.write(text)
+        if create_pdf.uses_rst2pdf(self.raw_dict):
+            with open(str(create_pdf.converted_rst_path(self.context.build_dir)), 'w') as writer:
+                writer.write(self.pdf_text)
+        self.text = text
+        return True
+
+    def render(self):
+        """
+        Creates html presentation and pdf from the presentation RST.
+        """
+        self.presentation_folder = hover.run(self.rst_file, self.raw_dict, self.img_list, self.context, self.snapshot,
+                                             self.presentation_folder, self.args.jobs)
+        create_pdf.create(self.raw_dict, self.rst_file, self.presentation_folder, self.context, self.args.jobs,
+                          create_pdf.converted_rst_path(self.context.build_dir))
+
+    def build(self):
+        """
+        Creates the whole presentation.
+        """
+        self.load()
+        self.extract()
+        self.text = None
+        self.write()
+        self.render()
+
+    def image_sources(self):
+        """
+        :return: {absolute path of the image: image path in the presentation RST}
+        """
+        rst_dir = Path(self.rst_file).parent
+        return {os.path.normpath(str((rst_dir / image).absolute())): image for image in self.img_list}
+
+    def copy_images(self, changed):
+        """
+        Copies changed images to the places where hovercraft and handle_images have copied them.
+        """
+        for source, image in self.image_sources().items():
+            if source in changed:
+                pm.copy_file(Path(source), Path(os.path.normpath(str(Path(self.presentation_folder) / image))))
+
+    def config_files(self):
+        """
+        :return: files which affect the whole presentation
+        """
+        files = [self.config_path]
+        if self.raw_dict:
+            css = self.raw_dict[settings.files].get(settings.css)
+            if css:
+                files.append(self.context.path(css))
+            files.extend(Path(self.course_path).glob("index*.rst"))
+            files.extend({Path(path).parent / "index.rst" for path in self.paths})
+        return {os.path.normpath(str(path.absolute())) for path in files}
+
+    def watched_files(self):
+        files = self.config_files()
+        files.update(os.path.normpath(os.path.abspath(path)) for path in self.paths)
+        files.update(self.image_sources())
+        return files
+
+    def update(self, changed):
+        """
+        Creates again the parts of the presentation which depend on the changed files.
+        """
+        if changed & self.config_files():
+            settings.logger.info("Configuration changed, creating the whole presentation.")
+            self.build()
+            return
+        rst_files = [path for path in self.paths if os.path.normpath(os.path.abspath(path)) in changed]
+        if rst_files:
+            self.snapshot = FileSnapshot(self.course_path, self.context.cache_path())
+            self.extract(rst_files)
+            if self.write():
+                self.render()
+        self.copy_images(changed)
+
+
+def run(args, config_path, context):
+    """
+    Creates the presentation and creates it again when the watched files change. Runs until interrupted.
+    """
+    builder = IncrementalBuild(args, config_path, context)
+    watcher = None
+    # None when the whole presentation needs to be created
+    changed = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                if changed is None:
+                    builder.build()
+                else:
+                    builder.update(changed)
+                settings.logger.info("Presentation created in {:.2f} s.".format(time.perf_counter() - start))
+            except PresentationMakerError:
+                # errors have been logged already
+                settings.logger.error("Creating the presentation failed. Fix errors and save the file again.")
+                changed = None
+            except Exception as e:
+                settings.logger.error("Creating the presentation failed. Error: {}".format(e))
+                settings.logger.warning(traceback.format_exc())
+                changed = None
+            else:
+                changed = set()
+
+            if watcher is None:
+                watcher = create_watcher(builder.watched_files())
+            else:
+                watcher.watch(builder.watched_files())
+            settings.logger.info("Watching {} files for changes. Press Ctrl+C to stop.".format(len(watcher.files)))
+            files = wait_for_changes(watcher)
+            settings.logger.info("Changed: {}".format(", ".join(sorted(files))))
+            if changed is not None:
+                changed = files
+    except KeyboardInterrupt:
+        settings.logger.info("Stopped watching.")
+    finally:
+        if watcher is not None:
+            watcher.close()